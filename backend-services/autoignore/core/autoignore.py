@@ -19,6 +19,9 @@ from artemis_utils.envvars import RABBITMQ_URI
 from artemis_utils.envvars import REST_PORT
 from artemis_utils.rabbitmq import create_exchange
 from artemis_utils.rabbitmq import create_queue
+from artemis_utils.rest import BlockingRequestHandler
+from artemis_utils.rest import RestMetricsHandler
+from artemis_utils.service import ProcessLauncher
 from artemis_utils.service import wait_data_worker_dependencies
 from kombu import Connection
 from kombu import Producer
@@ -86,11 +89,13 @@ def configure_autoignore(msg, shared_memory_manager_dict):
         return {"success": False, "message": "error during service configuration"}
 
 
-class ConfigHandler(RequestHandler):
+class ConfigHandler(BlockingRequestHandler):
     """
     REST request handler for configuration.
     """
 
+    max_concurrency = 1
+
     def initialize(self, shared_memory_manager_dict):
         self.shared_memory_manager_dict = shared_memory_manager_dict
 
@@ -157,8 +162,9 @@ class ControlHandler(RequestHandler):
     REST request handler for control commands.
     """
 
-    def initialize(self, shared_memory_manager_dict):
+    def initialize(self, shared_memory_manager_dict, data_worker_launcher):
         self.shared_memory_manager_dict = shared_memory_manager_dict
+        self.data_worker_launcher = data_worker_launcher
 
     def start_data_worker(self):
         shared_memory_locks["data_worker"].acquire()
@@ -167,17 +173,18 @@ class ControlHandler(RequestHandler):
             shared_memory_locks["data_worker"].release()
             return "already running"
         shared_memory_locks["data_worker"].release()
-        mp.Process(target=self.run_data_worker_process).start()
+        self.data_worker_launcher.launch()
         return "instructed to start"
 
-    def run_data_worker_process(self):
+    @staticmethod
+    def run_data_worker_process(shared_memory_manager_dict):
         try:
             with Connection(RABBITMQ_URI) as connection:
                 shared_memory_locks["data_worker"].acquire()
                 data_worker = AutoignoreDataWorker(
-                    connection, self.shared_memory_manager_dict
+                    connection, shared_memory_manager_dict
                 )
-                self.shared_memory_manager_dict["data_worker_running"] = True
+                shared_memory_manager_dict["data_worker_running"] = True
                 shared_memory_locks["data_worker"].release()
                 log.info("data worker started")
                 data_worker.run()
@@ -185,7 +192,7 @@ class ControlHandler(RequestHandler):
             log.exception("exception")
         finally:
             shared_memory_locks["data_worker"].acquire()
-            self.shared_memory_manager_dict["data_worker_running"] = False
+            shared_memory_manager_dict["data_worker_running"] = False
             shared_memory_locks["data_worker"].release()
             log.info("data worker stopped")
 
@@ -251,6 +258,11 @@ class Autoignore:
         self.shared_memory_manager_dict["time"] = 0
         self.shared_memory_manager_dict["ongoing_hijacks"] = {}
 
+        # data workers are started via a helper process (see ProcessLauncher)
+        self.data_worker_launcher = ProcessLauncher(
+            ControlHandler.run_data_worker_process, self.shared_memory_manager_dict
+        )
+
         log.info("service initiated")
 
     def make_rest_app(self):
@@ -264,17 +276,23 @@ class Autoignore:
                 (
                     "/control",
                     ControlHandler,
-                    dict(shared_memory_manager_dict=self.shared_memory_manager_dict),
+                    dict(
+                        shared_memory_manager_dict=self.shared_memory_manager_dict,
+                        data_worker_launcher=self.data_worker_launcher,
+                    ),
                 ),
                 (
                     "/health",
                     HealthHandler,
                     dict(shared_memory_manager_dict=self.shared_memory_manager_dict),
                 ),
+                ("/metrics", RestMetricsHandler),
             ]
         )
 
     def start_rest_app(self):
+        # fork the data worker launcher before any REST thread exists
+        self.data_worker_launcher.start()
         app = self.make_rest_app()
         app.listen(REST_PORT)
         log.info("REST worker started and listening to port {}".format(REST_PORT))
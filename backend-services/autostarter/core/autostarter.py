@@ -30,6 +30,8 @@ from artemis_utils.envvars import DB_USER
 from artemis_utils.envvars import IS_KUBERNETES
 from artemis_utils.envvars import REST_PORT
 from artemis_utils.envvars import TEST_ENV
+from artemis_utils.rest import BlockingRequestHandler
+from artemis_utils.rest import RestMetricsHandler
 from artemis_utils.service import service_to_ips_and_replicas_in_compose
 from artemis_utils.service import service_to_ips_and_replicas_in_k8s
 from tornado.ioloop import IOLoop
@@ -70,11 +72,13 @@ DROP_TRIGGER_QUERY = "DROP TRIGGER IF EXISTS send_update_event ON public.bgp_upd
 CREATE_TRIGGER_QUERY = "CREATE TRIGGER send_update_event AFTER INSERT ON bgp_updates FOR EACH ROW EXECUTE PROCEDURE rabbitmq.on_row_change('update-insert');"
 
 
-class ConfigHandler(RequestHandler):
+class ConfigHandler(BlockingRequestHandler):
     """
     REST request handler for configuration.
     """
 
+    max_concurrency = 1
+
     def initialize(self, shared_memory_manager_dict):
         self.shared_memory_manager_dict = shared_memory_manager_dict
 
@@ -151,6 +155,7 @@ class Autostarter:
                     HealthHandler,
                     dict(shared_memory_manager_dict=self.shared_memory_manager_dict),
                 ),
+                ("/metrics", RestMetricsHandler),
                 (
                     "/config",
                     ConfigHandler,
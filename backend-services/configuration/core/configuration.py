@@ -4,7 +4,9 @@ import os
 import re
 import shutil
 import stat
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 from io import StringIO
 from ipaddress import ip_network as str2ip
 from typing import Dict
@@ -44,7 +46,10 @@ from artemis_utils.rabbitmq import create_exchange
 from artemis_utils.rabbitmq import create_queue
 from artemis_utils.redis import ping_redis
 from artemis_utils.redis import redis_key
+from artemis_utils.rest import BlockingRequestHandler
+from artemis_utils.rest import RestMetricsHandler
 from artemis_utils.service import get_local_ip
+from artemis_utils.service import ProcessLauncher
 from artemis_utils.service import service_to_ips_and_replicas_in_compose
 from artemis_utils.service import service_to_ips_and_replicas_in_k8s
 from artemis_utils.translations import translate_as_set
@@ -55,6 +60,7 @@ from kombu import Consumer
 from kombu import Producer
 from kombu import uuid
 from kombu.mixins import ConsumerProducerMixin
+from requests.adapters import HTTPAdapter
 from tornado.ioloop import IOLoop
 from tornado.web import Application
 from tornado.web import RequestHandler
@@ -93,6 +99,22 @@ MONITOR_SERVICES = [
     BGPSTREAMHISTTAP_HOST,
     EXABGPTAP_HOST,
 ]
+# configuration sections consumed by each service (besides the timestamp);
+# services not listed here receive the whole configuration
+CONFIG_SECTIONS = {
+    PREFIXTREE_HOST: ["rules", "autoignore"],
+    AUTOIGNORE_HOST: ["autoignore"],
+    NOTIFIER_HOST: [],
+    DETECTION_HOST: [],
+    MITIGATION_HOST: [],
+}
+CONFIG_SECTIONS.update({service: [] for service in MONITOR_SERVICES})
+# services are reconfigured in stages, since services of later stages query
+# ones of earlier stages (e.g., database and monitors query prefixtree);
+# services not listed here are reconfigured last
+CONFIG_FANOUT_STAGES = {SERVICE_NAME: 0, PREFIXTREE_HOST: 0, DATABASE_HOST: 1}
+CONFIG_FANOUT_WORKERS = 16
+CONFIG_FANOUT_TIMEOUT = 120
 
 
 def read_conf(load_yaml=True, config_file=None):
@@ -727,77 +749,124 @@ def get_created_asn_anchors_from_new_rule(yaml_conf, rule_asns):
     return created_asn_anchors, all_asns_exist
 
 
+def config_payload(data, service):
+    """
+    Returns the part of the configuration that a service consumes.
+    """
+    if service not in CONFIG_SECTIONS:
+        return data
+    payload = {
+        section: data[section]
+        for section in CONFIG_SECTIONS[service]
+        if section in data
+    }
+    payload["timestamp"] = data["timestamp"]
+    return payload
+
+
+def resolve_service(service):
+    try:
+        if IS_KUBERNETES:
+            return service, service_to_ips_and_replicas_in_k8s(service)
+        return service, service_to_ips_and_replicas_in_compose(SERVICE_NAME, service)
+    except Exception:
+        log.error("could not resolve service '{}'".format(service))
+        return service, None
+
+
+def post_configuration_to_replica(session, replica_name, replica_ip, payload):
+    try:
+        r = session.post(
+            url="http://{}:{}/config".format(replica_ip, REST_PORT),
+            data=payload,
+            timeout=CONFIG_FANOUT_TIMEOUT,
+        )
+        response = r.json()
+        assert response["success"]
+    except Exception:
+        log.error("could not configure service '{}'".format(replica_name))
+
+
 def post_configuration_to_other_services(
     shared_memory_manager_dict, services=ALL_CONFIGURABLE_SERVICES
 ):
+    """
+    Posts the configuration to all replicas of the given services, concurrently
+    within each stage (see CONFIG_FANOUT_STAGES), sending to each service only the
+    configuration sections it consumes.
+    """
     data = shared_memory_manager_dict["config_data"]
     local_ip = get_local_ip()
     same_service_only = False
     if services == [SERVICE_NAME]:
         same_service_only = True
     pending_services = set(services)
+    last_stage = max(CONFIG_FANOUT_STAGES.values()) + 1
+    stages = {}
     for service in services:
-        try:
-            if IS_KUBERNETES:
-                ips_and_replicas = service_to_ips_and_replicas_in_k8s(service)
-            else:
-                ips_and_replicas = service_to_ips_and_replicas_in_compose(
-                    SERVICE_NAME, service
-                )
-        except Exception:
-            log.error("could not resolve service '{}'".format(service))
-            continue
-        if not same_service_only:
-            log.info(
-                "Reconfiguring '{}' microservice ({} replicas). Pending microservices: {}".format(
-                    service, len(ips_and_replicas), pending_services
-                )
-            )
-        for replica_name, replica_ip in ips_and_replicas:
-            try:
+        stages.setdefault(CONFIG_FANOUT_STAGES.get(service, last_stage), []).append(
+            service
+        )
+
+    session = requests.Session()
+    adapter = HTTPAdapter(
+        pool_connections=CONFIG_FANOUT_WORKERS, pool_maxsize=CONFIG_FANOUT_WORKERS
+    )
+    session.mount("http://", adapter)
+    with session, ThreadPoolExecutor(max_workers=CONFIG_FANOUT_WORKERS) as executor:
+        for stage in sorted(stages):
+            resolved = executor.map(resolve_service, stages[stage])
+            posts = {}
+            for service, ips_and_replicas in resolved:
+                if ips_and_replicas is None:
+                    pending_services.remove(service)
+                    continue
+                if not same_service_only:
+                    log.info(
+                        "Reconfiguring '{}' microservice ({} replicas). Pending microservices: {}".format(
+                            service, len(ips_and_replicas), pending_services
+                        )
+                    )
                 # same service (configuration)
                 if service == SERVICE_NAME:
-                    # do not send the configuration to yourself
-                    if replica_ip == local_ip:
-                        continue
                     # check if you need to inform the other microservice about the fileobserver ignoring state
-                    ignore_fileobserver = shared_memory_manager_dict[
-                        "ignore_fileobserver"
+                    # (no need to update data if only notifying about it)
+                    payload = {
+                        "data": {} if same_service_only else data,
+                        "ignore_fileobserver": shared_memory_manager_dict[
+                            "ignore_fileobserver"
+                        ],
+                    }
+                    # do not send the configuration to yourself
+                    ips_and_replicas = [
+                        (replica_name, replica_ip)
+                        for replica_name, replica_ip in ips_and_replicas
+                        if replica_ip != local_ip
                     ]
-                    # no need to update data, just notify about fileobserver ignore state
-                    if same_service_only:
-                        r = requests.post(
-                            url="http://{}:{}/config".format(replica_ip, REST_PORT),
-                            data=json.dumps(
-                                {"data": {}, "ignore_fileobserver": ignore_fileobserver}
-                            ),
-                        )
-                    else:
-                        r = requests.post(
-                            url="http://{}:{}/config".format(replica_ip, REST_PORT),
-                            data=json.dumps(
-                                {
-                                    "data": data,
-                                    "ignore_fileobserver": ignore_fileobserver,
-                                }
-                            ),
-                        )
                 else:
-                    r = requests.post(
-                        url="http://{}:{}/config".format(replica_ip, REST_PORT),
-                        data=json.dumps(data),
+                    payload = config_payload(data, service)
+                # serialized once per service
+                payload = json.dumps(payload)
+                posts[service] = [
+                    executor.submit(
+                        post_configuration_to_replica,
+                        session,
+                        replica_name,
+                        replica_ip,
+                        payload,
+                    )
+                    for replica_name, replica_ip in ips_and_replicas
+                ]
+            for service, futures in posts.items():
+                for future in futures:
+                    future.result()
+                pending_services.remove(service)
+                if not same_service_only:
+                    log.info(
+                        "Reconfigured '{}' microservice ({} replicas). Pending microservices: {}".format(
+                            service, len(futures), pending_services
+                        )
                     )
-                response = r.json()
-                assert response["success"]
-            except Exception:
-                log.error("could not configure service '{}'".format(replica_name))
-        pending_services.remove(service)
-        if not same_service_only:
-            log.info(
-                "Reconfigured '{}' microservice ({} replicas). Pending microservices: {}".format(
-                    service, len(ips_and_replicas), pending_services
-                )
-            )
     log.info("All microservices reconfigured")
 
 
@@ -946,11 +1015,13 @@ def translate_learn_rule_dicts_to_yaml_conf(
     return "ok", True
 
 
-class LoadAsSetsHandler(RequestHandler):
+class LoadAsSetsHandler(BlockingRequestHandler):
     """
     REST request handler for loading AS sets.
     """
 
+    max_concurrency = 1
+
     def initialize(self, shared_memory_manager_dict):
         self.shared_memory_manager_dict = shared_memory_manager_dict
 
@@ -1030,11 +1101,13 @@ class LoadAsSetsHandler(RequestHandler):
             self.write(ret_json)
 
 
-class HijackLearnRuleHandler(RequestHandler):
+class HijackLearnRuleHandler(BlockingRequestHandler):
     """
     REST request handler for learning hijack rules.
     """
 
+    max_concurrency = 1
+
     def initialize(self, shared_memory_manager_dict):
         self.shared_memory_manager_dict = shared_memory_manager_dict
 
@@ -1269,10 +1342,12 @@ def configure_configuration(msg, shared_memory_manager_dict):
                             if service not in services_to_notify:
                                 services_to_notify.append(service)
 
-                    # configure needed services with the new config in background process
-                    mp.Process(
+                    # configure needed services with the new config in background thread
+                    # (this runs in an executor thread, so do not fork from here)
+                    threading.Thread(
                         target=post_configuration_to_other_services,
                         args=(shared_memory_manager_dict, services_to_notify),
+                        daemon=True,
                     ).start()
 
                     # if the change did not come from the file observer itself,
@@ -1304,11 +1379,13 @@ def configure_configuration(msg, shared_memory_manager_dict):
         return ret_json
 
 
-class ConfigHandler(RequestHandler):
+class ConfigHandler(BlockingRequestHandler):
     """
     REST request handler for configuration
     """
 
+    max_concurrency = 1
+
     def initialize(self, shared_memory_manager_dict):
         self.shared_memory_manager_dict = shared_memory_manager_dict
 
@@ -1379,8 +1456,9 @@ class ControlHandler(RequestHandler):
     REST request handler for control commands.
     """
 
-    def initialize(self, shared_memory_manager_dict):
+    def initialize(self, shared_memory_manager_dict, data_worker_launcher):
         self.shared_memory_manager_dict = shared_memory_manager_dict
+        self.data_worker_launcher = data_worker_launcher
 
     def start_data_worker(self):
         shared_memory_locks["data_worker"].acquire()
@@ -1389,17 +1467,18 @@ class ControlHandler(RequestHandler):
             shared_memory_locks["data_worker"].release()
             return "already running"
         shared_memory_locks["data_worker"].release()
-        mp.Process(target=self.run_data_worker_process).start()
+        self.data_worker_launcher.launch()
         return "instructed to start"
 
-    def run_data_worker_process(self):
+    @staticmethod
+    def run_data_worker_process(shared_memory_manager_dict):
         try:
             with Connection(RABBITMQ_URI) as connection:
                 shared_memory_locks["data_worker"].acquire()
                 data_worker = ConfigurationDataWorker(
-                    connection, self.shared_memory_manager_dict
+                    connection, shared_memory_manager_dict
                 )
-                self.shared_memory_manager_dict["data_worker_running"] = True
+                shared_memory_manager_dict["data_worker_running"] = True
                 shared_memory_locks["data_worker"].release()
                 log.info("data worker started")
                 data_worker.run()
@@ -1407,7 +1486,7 @@ class ControlHandler(RequestHandler):
             log.exception("exception")
         finally:
             shared_memory_locks["data_worker"].acquire()
-            self.shared_memory_manager_dict["data_worker_running"] = False
+            shared_memory_manager_dict["data_worker_running"] = False
             shared_memory_locks["data_worker"].release()
             log.info("data worker stopped")
 
@@ -1482,6 +1561,11 @@ class Configuration:
             "autoignore": None,
         }
 
+        # data workers are started via a helper process (see ProcessLauncher)
+        self.data_worker_launcher = ProcessLauncher(
+            ControlHandler.run_data_worker_process, self.shared_memory_manager_dict
+        )
+
         log.info("service initiated")
 
     def make_rest_app(self):
@@ -1495,13 +1579,17 @@ class Configuration:
                 (
                     "/control",
                     ControlHandler,
-                    dict(shared_memory_manager_dict=self.shared_memory_manager_dict),
+                    dict(
+                        shared_memory_manager_dict=self.shared_memory_manager_dict,
+                        data_worker_launcher=self.data_worker_launcher,
+                    ),
                 ),
                 (
                     "/health",
                     HealthHandler,
                     dict(shared_memory_manager_dict=self.shared_memory_manager_dict),
                 ),
+                ("/metrics", RestMetricsHandler),
                 (
                     "/loadAsSets",
                     LoadAsSetsHandler,
@@ -1516,6 +1604,8 @@ class Configuration:
         )
 
     def start_rest_app(self):
+        # fork the data worker launcher before any REST thread exists
+        self.data_worker_launcher.start()
         app = self.make_rest_app()
         app.listen(REST_PORT)
         log.info("REST worker started and listening to port {}".format(REST_PORT))
@@ -230,6 +230,59 @@ class ConfigurationTester(unittest.TestCase):
             [8, 7, 6, 5],
         )
 
+    def test_config_payload(self):
+        data = self.configurationService.shared_memory_manager_dict["config_data"]
+        self.assertEqual(
+            configuration.config_payload(data, configuration.PREFIXTREE_HOST),
+            {
+                "rules": data["rules"],
+                "autoignore": data["autoignore"],
+                "timestamp": data["timestamp"],
+            },
+        )
+        self.assertEqual(
+            configuration.config_payload(data, configuration.RIPERISTAP_HOST),
+            {"timestamp": data["timestamp"]},
+        )
+        self.assertEqual(
+            configuration.config_payload(data, configuration.DATABASE_HOST), data
+        )
+
+    @patch("configuration.get_local_ip", return_value="10.0.0.1")
+    @patch("configuration.resolve_service")
+    @patch("configuration.requests.Session")
+    def test_post_configuration_stages(self, session, resolve_service, _):
+        resolve_service.side_effect = lambda service: (
+            service,
+            {
+                ("{}-1".format(service), "10.0.0.1"),
+                ("{}-2".format(service), "10.0.0.2"),
+            },
+        )
+        session.return_value.post.return_value.json.return_value = {"success": True}
+        self.configurationService.shared_memory_manager_dict[
+            "ignore_fileobserver"
+        ] = False
+        configuration.post_configuration_to_other_services(
+            self.configurationService.shared_memory_manager_dict,
+            [
+                configuration.DETECTION_HOST,
+                configuration.DATABASE_HOST,
+                configuration.SERVICE_NAME,
+                configuration.PREFIXTREE_HOST,
+            ],
+        )
+        resolved = [call[0][0] for call in resolve_service.call_args_list]
+        self.assertEqual(
+            set(resolved[:2]),
+            {configuration.SERVICE_NAME, configuration.PREFIXTREE_HOST},
+        )
+        self.assertEqual(
+            resolved[2:], [configuration.DATABASE_HOST, configuration.DETECTION_HOST]
+        )
+        # all replicas but the local configuration one
+        self.assertEqual(len(session.return_value.post.call_args_list), 7)
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -1,6 +1,11 @@
+import collections
+import csv
 import datetime
+import io
 import json as classic_json
 import multiprocessing as mp
+import queue
+import threading
 import time
 from typing import Dict
 from typing import NoReturn
@@ -14,6 +19,7 @@ from artemis_utils.constants import CONFIGURATION_HOST
 from artemis_utils.constants import NOTIFIER_HOST
 from artemis_utils.constants import PREFIXTREE_HOST
 from artemis_utils.db import DB
+from artemis_utils.envvars import BGP_UPDATES_INSERT_METHOD
 from artemis_utils.envvars import BULK_TIMER
 from artemis_utils.envvars import DB_HOST
 from artemis_utils.envvars import DB_NAME
@@ -26,11 +32,17 @@ from artemis_utils.envvars import REDIS_HOST
 from artemis_utils.envvars import REDIS_PORT
 from artemis_utils.envvars import REST_PORT
 from artemis_utils.envvars import WITHDRAWN_HIJACK_THRESHOLD
+from artemis_utils.rabbitmq import accepted_wire_formats
 from artemis_utils.rabbitmq import create_exchange
 from artemis_utils.rabbitmq import create_queue
+from artemis_utils.rabbitmq import unpack_update_envelope
+from artemis_utils.redis import MERGE_HIJACK_SCRIPT
 from artemis_utils.redis import ping_redis
 from artemis_utils.redis import purge_redis_eph_pers_keys
 from artemis_utils.redis import redis_key
+from artemis_utils.rest import BlockingRequestHandler
+from artemis_utils.rest import RestMetricsHandler
+from artemis_utils.service import ProcessLauncher
 from artemis_utils.service import wait_data_worker_dependencies
 from kombu import Connection
 from kombu import Producer
@@ -49,20 +61,24 @@ shared_memory_locks = {
     "monitored_prefixes": mp.Lock(),
     "configured_prefix_count": mp.Lock(),
     "config_timestamp": mp.Lock(),
-    "insert_bgp_entries": mp.Lock(),
-    "handle_bgp_withdrawals": mp.Lock(),
-    "handled_bgp_entries": mp.Lock(),
-    "outdate_hijacks": mp.Lock(),
-    "insert_hijacks_entries": mp.Lock(),
     "monitors": mp.Lock(),
     "service_reconfiguring": mp.Lock(),
+    "hijack_multi_action": mp.Lock(),
 }
 
 # global vars
-TABLES = ["bgp_updates", "hijacks", "configs"]
+TABLES = ["bgp_updates", "hijacks", "configs", "hijack_bgp_updates"]
 VIEWS = ["view_configs", "view_bgpupdates", "view_hijacks"]
 SERVICE_NAME = "database"
 DATA_WORKER_DEPENDENCIES = [PREFIXTREE_HOST, NOTIFIER_HOST]
+BULK_BATCH_SIZE = 1000
+BOOTSTRAP_CHUNK_SIZE = 10000
+BOOTSTRAP_CHECKPOINT = "redis-bootstrap-checkpoint"
+BOOTSTRAP_ALIVE_TIMEOUT = 60
+BGP_UPDATE_KEY_TTL = 2 * 60 * 60
+DEDUP_CACHE_SIZE = 100000
+# NULL marker of the COPY (CSV) ingestion of BGP updates
+COPY_NULL = "\\N"
 
 
 def save_config(wo_db, config_hash, yaml_config, raw_config, comment, config_timestamp):
@@ -136,6 +152,29 @@ def store_configured_prefix_count_stat(wo_db, configured_prefix_count):
         log.exception("exception")
 
 
+def delete_hijack_bgp_updates(wo_db, hijack_keys):
+    """
+    Detaches the handled BGP updates of (deleted) hijacks; the ones that do not
+    belong to any other hijack are deleted.
+    """
+    wo_db.execute(
+        "UPDATE bgp_updates AS b SET hijack_key = "
+        "ARRAY(SELECT k FROM unnest(b.hijack_key) AS k WHERE k <> ALL(%s)) "
+        "FROM (SELECT DISTINCT update_key, timestamp FROM hijack_bgp_updates "
+        "WHERE hijack_key = ANY(%s)) AS hb "
+        "WHERE b.timestamp = hb.timestamp AND b.key = hb.update_key AND b.handled = true;",
+        (hijack_keys, hijack_keys),
+    )
+    wo_db.execute(
+        "WITH removed AS (DELETE FROM hijack_bgp_updates WHERE hijack_key = ANY(%s) RETURNING update_key, timestamp) "
+        "DELETE FROM bgp_updates AS b USING removed "
+        "WHERE b.timestamp = removed.timestamp AND b.key = removed.update_key AND b.handled = true "
+        "AND NOT EXISTS (SELECT 1 FROM hijack_bgp_updates AS hb WHERE hb.timestamp = b.timestamp "
+        "AND hb.update_key = b.key AND hb.hijack_key <> ALL(%s));",
+        (hijack_keys, hijack_keys),
+    )
+
+
 def configure_database(msg, shared_memory_manager_dict):
     config = msg
     try:
@@ -258,11 +297,13 @@ class MonitorHandler(RequestHandler):
         self.write({"monitors": self.shared_memory_manager_dict["monitors"]})
 
 
-class ConfigHandler(RequestHandler):
+class ConfigHandler(BlockingRequestHandler):
     """
     REST request handler for configuration.
     """
 
+    max_concurrency = 1
+
     def initialize(self, shared_memory_manager_dict):
         self.shared_memory_manager_dict = shared_memory_manager_dict
         self.ro_db = DB(
@@ -339,8 +380,9 @@ class ControlHandler(RequestHandler):
     REST request handler for control commands.
     """
 
-    def initialize(self, shared_memory_manager_dict):
+    def initialize(self, shared_memory_manager_dict, data_worker_launcher):
         self.shared_memory_manager_dict = shared_memory_manager_dict
+        self.data_worker_launcher = data_worker_launcher
 
     def start_data_worker(self):
         shared_memory_locks["data_worker"].acquire()
@@ -349,17 +391,16 @@ class ControlHandler(RequestHandler):
             shared_memory_locks["data_worker"].release()
             return "already running"
         shared_memory_locks["data_worker"].release()
-        mp.Process(target=self.run_data_worker_process).start()
+        self.data_worker_launcher.launch()
         return "instructed to start"
 
-    def run_data_worker_process(self):
+    @staticmethod
+    def run_data_worker_process(shared_memory_manager_dict):
         try:
             with Connection(RABBITMQ_URI) as connection:
                 shared_memory_locks["data_worker"].acquire()
-                data_worker = DatabaseDataWorker(
-                    connection, self.shared_memory_manager_dict
-                )
-                self.shared_memory_manager_dict["data_worker_running"] = True
+                data_worker = DatabaseDataWorker(connection, shared_memory_manager_dict)
+                shared_memory_manager_dict["data_worker_running"] = True
                 shared_memory_locks["data_worker"].release()
                 log.info("data worker started")
                 data_worker.run()
@@ -367,7 +408,7 @@ class ControlHandler(RequestHandler):
             log.exception("exception")
         finally:
             shared_memory_locks["data_worker"].acquire()
-            self.shared_memory_manager_dict["data_worker_running"] = False
+            shared_memory_manager_dict["data_worker_running"] = False
             shared_memory_locks["data_worker"].release()
             log.info("data worker stopped")
 
@@ -417,7 +458,7 @@ class ControlHandler(RequestHandler):
             self.write({"success": False, "message": "error during control"})
 
 
-class HijackCommentHandler(RequestHandler):
+class HijackCommentHandler(BlockingRequestHandler):
     """
     REST request handler for hijack comments.
     """
@@ -455,11 +496,29 @@ class HijackCommentHandler(RequestHandler):
             log.exception("{}".format(raw))
 
 
-class HijackMultiActionHandler(RequestHandler):
+class HijackMultiActionHandler(BlockingRequestHandler):
     """
     REST request handler for multiple hijack actions.
+    Actions are applied in bulk (set-based SQL, pipelined redis purges);
+    their progress can be polled via GET.
     """
 
+    max_concurrency = 1
+
+    ACTIONS = {
+        "hijack_action_resolve": "UPDATE hijacks SET resolved=true, active=false, dormant=false, seen=true, time_ended=%s WHERE resolved=false AND ignored=false AND key = ANY(%s);",
+        "hijack_action_ignore": "UPDATE hijacks SET ignored=true, active=false, dormant=false, seen=false WHERE ignored=false AND resolved=false AND key = ANY(%s);",
+        "hijack_action_acknowledge": "UPDATE hijacks SET seen=true WHERE key = ANY(%s);",
+        "hijack_action_acknowledge_not": "UPDATE hijacks SET seen=false WHERE key = ANY(%s);",
+        "hijack_action_delete": "DELETE FROM hijacks WHERE key = ANY(%s);",
+    }
+    # actions that clear the redis state of ongoing hijacks
+    PURGE_ACTIONS = {
+        "hijack_action_resolve",
+        "hijack_action_ignore",
+        "hijack_action_delete",
+    }
+
     def initialize(self, shared_memory_manager_dict):
         self.shared_memory_manager_dict = shared_memory_manager_dict
         self.ro_db = DB(
@@ -483,6 +542,13 @@ class HijackMultiActionHandler(RequestHandler):
         )
         self.redis = redis.Redis(host=REDIS_HOST, port=REDIS_PORT)
 
+    def get(self):
+        """
+        Returns the progress of the last (or running) multi-action.
+        :return: {"action": <str>, "total": <int>, "done": <int>, "running": <bool>}
+        """
+        self.write(self.shared_memory_manager_dict["hijack_multi_action"])
+
     def post(self):
         """
         Receives a "hijack-multi-action" message and applies the related actions in DB.
@@ -494,132 +560,86 @@ class HijackMultiActionHandler(RequestHandler):
         """
         raw = json.loads(self.request.body)
         log.debug("payload: {}".format(raw))
-        seen_action = False
-        ignore_action = False
-        resolve_action = False
-        delete_action = False
-        try:
-            if not raw["keys"]:
-                query = None
-            elif raw["action"] == "hijack_action_resolve":
-                query = "UPDATE hijacks SET resolved=true, active=false, dormant=false, seen=true, time_ended=%s WHERE resolved=false AND ignored=false AND key=%s;"
-                resolve_action = True
-            elif raw["action"] == "hijack_action_ignore":
-                query = "UPDATE hijacks SET ignored=true, active=false, dormant=false, seen=false WHERE ignored=false AND resolved=false AND key=%s;"
-                ignore_action = True
-            elif raw["action"] == "hijack_action_acknowledge":
-                query = "UPDATE hijacks SET seen=true WHERE key=%s;"
-                seen_action = True
-            elif raw["action"] == "hijack_action_acknowledge_not":
-                query = "UPDATE hijacks SET seen=false WHERE key=%s;"
-                seen_action = True
-            elif raw["action"] == "hijack_action_delete":
-                query = "DELETE FROM hijacks WHERE key=%s;"
-                delete_action = True
-            else:
-                raise BaseException("unreachable code reached")
-        except Exception:
-            log.exception("None action: {}".format(raw))
-            query = None
-
-        if not query:
+        if not raw.get("keys") or raw.get("action") not in self.ACTIONS:
+            log.error("None action: {}".format(raw))
             self.write({"success": False, "message": "unknown error"})
             return
-        else:
-            for hijack_key in raw["keys"]:
-                try:
-                    entries = self.ro_db.execute(
-                        "SELECT prefix, hijack_as, type FROM hijacks WHERE key = %s;",
-                        (hijack_key,),
-                    )
 
-                    if entries:
-                        entry = entries[0]
-                        redis_hijack_key = redis_key(
-                            entry[0], entry[1], entry[2]  # prefix  # hijack_as  # type
-                        )
-                        if seen_action:
-                            self.wo_db.execute(query, (hijack_key,))
-                        elif ignore_action:
-                            # if ongoing, clear redis
-                            if self.redis.sismember("persistent-keys", hijack_key):
-                                purge_redis_eph_pers_keys(
-                                    self.redis, redis_hijack_key, hijack_key
-                                )
-                            self.wo_db.execute(query, (hijack_key,))
-                        elif resolve_action:
-                            # if ongoing, clear redis
-                            if self.redis.sismember("persistent-keys", hijack_key):
-                                purge_redis_eph_pers_keys(
-                                    self.redis, redis_hijack_key, hijack_key
-                                )
-                            self.wo_db.execute(
-                                query, (datetime.datetime.now(), hijack_key)
-                            )
-                        elif delete_action:
-                            redis_hijack = self.redis.get(redis_hijack_key)
-                            if self.redis.sismember("persistent-keys", hijack_key):
-                                purge_redis_eph_pers_keys(
-                                    self.redis, redis_hijack_key, hijack_key
-                                )
-                            log.debug(
-                                "redis-entry for {}: {}".format(
-                                    redis_hijack_key, redis_hijack
-                                )
-                            )
-                            self.wo_db.execute(query, (hijack_key,))
-                            if redis_hijack and classic_json.loads(
-                                redis_hijack.decode("utf-8")
-                            ).get("bgpupdate_keys", []):
-                                log.debug("deleting hijack using cache for bgp updates")
-                                redis_hijack = classic_json.loads(
-                                    redis_hijack.decode("utf-8")
-                                )
-                                log.debug(
-                                    "bgpupdate_keys {} for {}".format(
-                                        redis_hijack["bgpupdate_keys"], redis_hijack
-                                    )
-                                )
-                                self.wo_db.execute(
-                                    "DELETE FROM bgp_updates WHERE %s = ANY(hijack_key) AND handled = true AND array_length(hijack_key,1) = 1 AND key = ANY(%s);",
-                                    (hijack_key, list(redis_hijack["bgpupdate_keys"])),
-                                )
-                                self.wo_db.execute(
-                                    "UPDATE bgp_updates SET hijack_key = array_remove(hijack_key, %s) WHERE handled = true AND key = ANY(%s);",
-                                    (hijack_key, list(redis_hijack["bgpupdate_keys"])),
-                                )
-                            else:
-                                log.debug(
-                                    "deleting hijack by querying bgp updates database"
-                                )
-                                self.wo_db.execute(
-                                    "DELETE FROM bgp_updates WHERE %s = ANY(hijack_key) AND array_length(hijack_key,1) = 1 AND handled = true;",
-                                    (hijack_key,),
-                                )
-                                self.wo_db.execute(
-                                    "UPDATE bgp_updates SET hijack_key = array_remove(hijack_key, %s) WHERE %s = ANY(hijack_key) AND handled = true;",
-                                    (hijack_key, hijack_key),
-                                )
-                                log.debug(
-                                    "bgpupdate_keys is empty for {}".format(
-                                        redis_hijack
-                                    )
-                                )
-                        else:
-                            raise BaseException("unreachable code reached")
-
-                except Exception as e:
-                    log.exception("{}".format(raw))
-                    self.write(
-                        {
-                            "success": False,
-                            "message": "{}:{}".format(type(e).__name__, e.args),
-                        }
-                    )
-                    return
+        try:
+            self.apply_action(raw["action"], raw["keys"])
+        except Exception as e:
+            log.exception("{}".format(raw))
+            self.write(
+                {"success": False, "message": "{}:{}".format(type(e).__name__, e.args)}
+            )
+            return
+        finally:
+            self.set_progress(raw["action"], running=False)
 
         self.write({"success": True, "message": ""})
 
+    def set_progress(self, action, running=True, total=None, done=None):
+        shared_memory_locks["hijack_multi_action"].acquire()
+        progress = dict(self.shared_memory_manager_dict["hijack_multi_action"])
+        progress["action"] = action
+        progress["running"] = running
+        if total is not None:
+            progress["total"] = total
+        if done is not None:
+            progress["done"] = done
+        self.shared_memory_manager_dict["hijack_multi_action"] = progress
+        shared_memory_locks["hijack_multi_action"].release()
+
+    def apply_action(self, action, keys):
+        """
+        Applies an action on all the given hijacks, in chunks of BULK_BATCH_SIZE.
+        """
+        entries = self.ro_db.execute(
+            "SELECT key, prefix, hijack_as, type FROM hijacks WHERE key = ANY(%s);",
+            (list(set(keys)),),
+        )
+        self.set_progress(action, total=len(entries), done=0)
+        for i in range(0, len(entries), BULK_BATCH_SIZE):
+            chunk = entries[i : i + BULK_BATCH_SIZE]
+            hijack_keys = [entry[0] for entry in chunk]
+            if action in self.PURGE_ACTIONS:
+                self.purge_ongoing(chunk)
+            if action == "hijack_action_resolve":
+                self.wo_db.execute(
+                    self.ACTIONS[action], (datetime.datetime.now(), hijack_keys)
+                )
+            else:
+                self.wo_db.execute(self.ACTIONS[action], (hijack_keys,))
+            if action == "hijack_action_delete":
+                delete_hijack_bgp_updates(self.wo_db, hijack_keys)
+            self.set_progress(action, done=i + len(chunk))
+
+    def purge_ongoing(self, entries):
+        """
+        Clears the redis state of the ongoing hijacks among the given
+        (key, prefix, hijack_as, type) entries, in two round-trips.
+        """
+        redis_hijack_keys = [
+            redis_key(entry[1], entry[2], entry[3]) for entry in entries
+        ]
+        redis_pipeline = self.redis.pipeline(transaction=False)
+        for entry, redis_hijack_key in zip(entries, redis_hijack_keys):
+            redis_pipeline.sismember("persistent-keys", entry[0])
+            redis_pipeline.smembers("hijack_{}_prefixes_peers".format(redis_hijack_key))
+        results = redis_pipeline.execute()
+
+        redis_pipeline = self.redis.pipeline(transaction=False)
+        for i, entry in enumerate(entries):
+            if results[2 * i]:
+                purge_redis_eph_pers_keys(
+                    self.redis,
+                    redis_hijack_keys[i],
+                    entry[0],
+                    redis_pipeline=redis_pipeline,
+                    prefixes_peers=results[2 * i + 1],
+                )
+        redis_pipeline.execute()
+
 
 class Database:
     """
@@ -636,11 +656,17 @@ class Database:
         self.shared_memory_manager_dict["monitors"] = {}
         self.shared_memory_manager_dict["configured_prefix_count"] = 0
         self.shared_memory_manager_dict["config_timestamp"] = -1
-        self.shared_memory_manager_dict["insert_bgp_entries"] = list()
-        self.shared_memory_manager_dict["handle_bgp_withdrawals"] = list()
-        self.shared_memory_manager_dict["handled_bgp_entries"] = list()
-        self.shared_memory_manager_dict["outdate_hijacks"] = list()
-        self.shared_memory_manager_dict["insert_hijacks_entries"] = {}
+        self.shared_memory_manager_dict["hijack_multi_action"] = {
+            "action": None,
+            "total": 0,
+            "done": 0,
+            "running": False,
+        }
+
+        # data workers are started via a helper process (see ProcessLauncher)
+        self.data_worker_launcher = ProcessLauncher(
+            ControlHandler.run_data_worker_process, self.shared_memory_manager_dict
+        )
 
     def make_rest_app(self):
         return Application(
@@ -653,13 +679,17 @@ class Database:
                 (
                     "/control",
                     ControlHandler,
-                    dict(shared_memory_manager_dict=self.shared_memory_manager_dict),
+                    dict(
+                        shared_memory_manager_dict=self.shared_memory_manager_dict,
+                        data_worker_launcher=self.data_worker_launcher,
+                    ),
                 ),
                 (
                     "/health",
                     HealthHandler,
                     dict(shared_memory_manager_dict=self.shared_memory_manager_dict),
                 ),
+                ("/metrics", RestMetricsHandler),
                 (
                     "/monitors",
                     MonitorHandler,
@@ -679,20 +709,155 @@ class Database:
         )
 
     def start_rest_app(self):
+        # fork the data worker launcher before any REST thread exists
+        self.data_worker_launcher.start()
         app = self.make_rest_app()
         app.listen(REST_PORT)
         log.info("REST worker started and listening to port {}".format(REST_PORT))
         IOLoop.current().start()
 
 
+class BulkUpdatePipeline:
+    """
+    Batch pipeline between the data worker and the bulk updater.
+    Entries are buffered in process-local lists (no locks, no IPC per message)
+    and handed over as pre-batched chunks through a single multiprocessing queue,
+    preserving the order in which the data worker received them.
+    """
+
+    KINDS = (
+        "insert_bgp_entries",
+        "handle_bgp_withdrawals",
+        "handled_bgp_entries",
+        "insert_hijacks_entries",
+        "outdate_hijacks",
+    )
+
+    def __init__(self, max_batch_size=BULK_BATCH_SIZE, linger=BULK_TIMER):
+        self.queue = mp.Queue()
+        self.max_batch_size = max_batch_size
+        self.linger = linger
+        self.buffers = {kind: [] for kind in self.KINDS}
+        self.buffered = 0
+        self.last_flush = time.time()
+
+    def put(self, kind, entry):
+        """
+        Buffer an entry locally (data worker side); the whole batch is handed
+        over to the bulk updater once it fills up.
+        """
+        self.buffers[kind].append(entry)
+        self.buffered += 1
+        if self.buffered >= self.max_batch_size:
+            self.flush()
+
+    def flush(self):
+        """
+        Hand over all locally buffered entries as one chunk (data worker side).
+        """
+        if self.buffered:
+            self.queue.put(
+                {kind: entries for kind, entries in self.buffers.items() if entries}
+            )
+            self.buffers = {kind: [] for kind in self.KINDS}
+            self.buffered = 0
+        self.last_flush = time.time()
+
+    def flush_if_stale(self):
+        """
+        Hand over buffered entries that have been waiting longer than the linger time.
+        """
+        if self.buffered and time.time() - self.last_flush >= self.linger:
+            self.flush()
+
+    def drain(self):
+        """
+        Yield all chunks handed over so far (bulk updater side).
+        """
+        while True:
+            try:
+                yield self.queue.get_nowait()
+            except queue.Empty:
+                break
+
+
+class BGPUpdateDeduplicator:
+    """
+    Duplicate filter for BGP update keys.
+    Keys recently seen by this process are answered from a local LRU set with TTL;
+    only keys unknown to it are checked (and set) in redis, which is shared among
+    replicas. The TTL refreshes of duplicates are sent to redis in batches.
+    """
+
+    def __init__(
+        self,
+        redis_conn,
+        ttl=BGP_UPDATE_KEY_TTL,
+        max_size=DEDUP_CACHE_SIZE,
+        max_batch_size=BULK_BATCH_SIZE,
+    ):
+        self.redis = redis_conn
+        self.ttl = ttl
+        self.max_size = max_size
+        self.max_batch_size = max_batch_size
+        # key -> last time seen, least recently seen first
+        self.keys = collections.OrderedDict()
+        self.pending_refreshes = set()
+
+    def seen(self, key):
+        """
+        Returns True if the key has already been seen (by any replica), while
+        marking it as seen and resetting its timer.
+        """
+        now = time.time()
+        while self.keys:
+            oldest_key, last_seen = next(iter(self.keys.items()))
+            if len(self.keys) < self.max_size and now - last_seen < self.ttl:
+                break
+            del self.keys[oldest_key]
+
+        if key in self.keys:
+            duplicate = True
+            self.keys.move_to_end(key)
+        else:
+            duplicate = not self.redis.set(key, "1", ex=self.ttl, nx=True)
+        self.keys[key] = now
+
+        if duplicate:
+            # reset timer each time we hit the same BGP update
+            self.pending_refreshes.add(key)
+            if len(self.pending_refreshes) >= self.max_batch_size:
+                self.flush()
+        return duplicate
+
+    def flush(self):
+        """
+        Send the pending TTL refreshes to redis in a single round-trip.
+        """
+        if self.pending_refreshes:
+            redis_pipeline = self.redis.pipeline(transaction=False)
+            for key in self.pending_refreshes:
+                redis_pipeline.expire(key, self.ttl)
+            redis_pipeline.execute()
+            self.pending_refreshes = set()
+
+
 class DatabaseBulkUpdater:
     """
     Database bulk updater.
     """
 
-    def __init__(self, connection, shared_memory_manager_dict):
+    def __init__(self, connection, shared_memory_manager_dict, bulk_pipeline):
         self.connection = connection
         self.shared_memory_manager_dict = shared_memory_manager_dict
+        self.bulk_pipeline = bulk_pipeline
+
+        # entries drained from the pipeline, pending to be committed
+        self.insert_bgp_entries = []
+        self.handle_bgp_withdrawals = {}
+        self.handled_bgp_entries = set()
+        self.insert_hijacks_entries = {}
+        self.outdate_hijacks = set()
 
         # DB variables
         self.ro_db = DB(
@@ -722,28 +887,128 @@ class DatabaseBulkUpdater:
 
         # redis db
         self.redis = redis.Redis(host=REDIS_HOST, port=REDIS_PORT)
+        self.redis_merge_hijack = self.redis.register_script(MERGE_HIJACK_SCRIPT)
+
+    def _merge_hijack_entry(self, msg_):
+        key = msg_["key"]  # persistent hijack key
+        if key not in self.insert_hijacks_entries:
+            self.insert_hijacks_entries[key] = {
+                "prefix": msg_["prefix"],
+                "hijack_as": msg_["hijack_as"],
+                "type": msg_["type"],
+                "time_started": msg_["time_started"],
+                "time_last": msg_["time_last"],
+                "peers_seen": list(msg_["peers_seen"]),
+                "asns_inf": list(msg_["asns_inf"]),
+                "num_peers_seen": len(msg_["peers_seen"]),
+                "num_asns_inf": len(msg_["asns_inf"]),
+                "monitor_keys": set(msg_["monitor_keys"]),
+                "time_detected": msg_["time_detected"],
+                "configured_prefix": msg_["configured_prefix"],
+                "timestamp_of_config": msg_["timestamp_of_config"],
+                "community_annotation": msg_["community_annotation"],
+                "rpki_status": msg_["rpki_status"],
+            }
+        else:
+            entry = self.insert_hijacks_entries[key]
+            entry["time_started"] = min(entry["time_started"], msg_["time_started"])
+            entry["time_last"] = max(entry["time_last"], msg_["time_last"])
+            entry["peers_seen"] = list(msg_["peers_seen"])
+            entry["asns_inf"] = list(msg_["asns_inf"])
+            entry["num_peers_seen"] = len(msg_["peers_seen"])
+            entry["num_asns_inf"] = len(msg_["asns_inf"])
+            entry["monitor_keys"].update(msg_["monitor_keys"])
+            entry["community_annotation"] = msg_["community_annotation"]
+            entry["rpki_status"] = msg_["rpki_status"]
+
+    def _drain_pipeline(self):
+        for chunk in self.bulk_pipeline.drain():
+            self.insert_bgp_entries.extend(chunk.get("insert_bgp_entries", []))
+            for withdrawal in chunk.get("handle_bgp_withdrawals", []):
+                self.handle_bgp_withdrawals[withdrawal] = None
+            self.handled_bgp_entries.update(chunk.get("handled_bgp_entries", []))
+            for msg_ in chunk.get("insert_hijacks_entries", []):
+                try:
+                    self._merge_hijack_entry(msg_)
+                except Exception:
+                    log.exception("{}".format(msg_))
+            self.outdate_hijacks.update(chunk.get("outdate_hijacks", []))
+
+    def _flush_state(self):
+        self.insert_bgp_entries = []
+        self.handle_bgp_withdrawals = {}
+        self.handled_bgp_entries = set()
+        self.insert_hijacks_entries = {}
+        self.outdate_hijacks = set()
 
     def _insert_bgp_updates(self):
-        shared_memory_locks["insert_bgp_entries"].acquire()
+        if not self.insert_bgp_entries:
+            return 0
         num_of_entries = 0
         try:
-            query = (
-                "INSERT INTO bgp_updates (prefix, key, origin_as, peer_asn, as_path, service, type, communities, "
-                "timestamp, hijack_key, handled, matched_prefix, orig_path) VALUES %s"
-            )
-            self.wo_db.execute_values(
-                query,
-                self.shared_memory_manager_dict["insert_bgp_entries"],
-                page_size=1000,
-            )
-            num_of_entries = len(self.shared_memory_manager_dict["insert_bgp_entries"])
-            self.shared_memory_manager_dict["insert_bgp_entries"] = []
+            if BGP_UPDATES_INSERT_METHOD == "copy":
+                try:
+                    self._copy_bgp_updates()
+                except Exception:
+                    # the COPY transaction has been rolled back, nothing is stored
+                    log.exception("bgp updates COPY failed, falling back to VALUES")
+                    self._insert_bgp_updates_values()
+            else:
+                self._insert_bgp_updates_values()
+            num_of_entries = len(self.insert_bgp_entries)
+            self.insert_bgp_entries = []
         except Exception:
             log.exception("exception")
             num_of_entries = -1
-        finally:
-            shared_memory_locks["insert_bgp_entries"].release()
-            return num_of_entries
+        return num_of_entries
+
+    def _insert_bgp_updates_values(self):
+        query = (
+            "INSERT INTO bgp_updates (prefix, key, origin_as, peer_asn, as_path, service, type, communities, "
+            "timestamp, hijack_key, handled, matched_prefix, orig_path) VALUES %s "
+            "ON CONFLICT DO NOTHING"
+        )
+        self.wo_db.execute_values(query, self.insert_bgp_entries, page_size=1000)
+
+    def _copy_bgp_updates(self):
+        """
+        Streams the BGP updates (CSV) with COPY into a session-local staging table
+        and moves them into bgp_updates with a single INSERT ... SELECT, so that the
+        row triggers of bgp_updates still fire and duplicates do not fail the batch.
+        NULLs are written as an explicit marker, so that empty strings are stored
+        as-is (as with VALUES) instead of as NULLs.
+        """
+        csv_buffer = io.StringIO()
+        csv_writer = csv.writer(csv_buffer)
+        for entry in self.insert_bgp_entries:
+            csv_writer.writerow(
+                COPY_NULL if value is None else value
+                for value in (
+                    entry[0],
+                    entry[1],
+                    entry[2],
+                    entry[3],
+                    "{{{}}}".format(",".join(map(str, entry[4]))),
+                    entry[5],
+                    entry[6],
+                    entry[7],
+                    entry[8].isoformat(),
+                    "{{{}}}".format(",".join(entry[9])),
+                    entry[10],
+                    entry[11],
+                    entry[12],
+                )
+            )
+        self.wo_db.copy_expert(
+            "COPY bgp_updates_staging (prefix, key, origin_as, peer_asn, as_path, service, type, communities, "
+            "timestamp, hijack_key, handled, matched_prefix, orig_path) FROM STDIN WITH (FORMAT csv, NULL '{}')".format(
+                COPY_NULL
+            ),
+            csv_buffer,
+            pre_query="CREATE TEMP TABLE IF NOT EXISTS bgp_updates_staging "
+            "(LIKE bgp_updates INCLUDING DEFAULTS) ON COMMIT DELETE ROWS",
+            post_query="INSERT INTO bgp_updates SELECT * FROM bgp_updates_staging ON CONFLICT DO NOTHING",
+        )
 
     def _update_bgp_updates(self):
         num_of_updates = 0
@@ -751,23 +1016,17 @@ class DatabaseBulkUpdater:
         timestamp_thres = time.time() - 7 * 24 * 60 * 60 if HISTORIC == "false" else 0
         timestamp_thres = datetime.datetime.fromtimestamp(timestamp_thres)
         # Update the BGP entries using the hijack messages
-        handled_bgp_entries = set(
-            self.shared_memory_manager_dict["handled_bgp_entries"]
-        )
-        for hijack_key in self.shared_memory_manager_dict["insert_hijacks_entries"]:
-            for bgp_entry_to_update in self.shared_memory_manager_dict[
-                "insert_hijacks_entries"
-            ][hijack_key]["monitor_keys"]:
+        for hijack_key in self.insert_hijacks_entries:
+            for bgp_entry_to_update in self.insert_hijacks_entries[hijack_key][
+                "monitor_keys"
+            ]:
                 num_of_updates += 1
                 update_bgp_entries.add(
                     (hijack_key, bgp_entry_to_update, timestamp_thres)
                 )
                 # exclude handle bgp updates that point to same hijack as
                 # this
-                handled_bgp_entries.discard(bgp_entry_to_update)
-        self.shared_memory_manager_dict["handled_bgp_entries"] = list(
-            handled_bgp_entries
-        )
+                self.handled_bgp_entries.discard((bgp_entry_to_update,))
 
         if update_bgp_entries:
             try:
@@ -794,13 +1053,25 @@ class DatabaseBulkUpdater:
                             )
 
                 # execute parallel execute values query
-                query = "UPDATE bgp_updates SET handled=true, hijack_key=array_distinct(hijack_key || array[data.v1]) FROM (VALUES %s) AS data (v1, v2) WHERE bgp_updates.key=data.v2"
+                query = (
+                    "WITH updated AS (UPDATE bgp_updates SET handled=true, hijack_key=array_distinct(hijack_key || array[data.v1]) "
+                    "FROM (VALUES %s) AS data (v1, v2) WHERE bgp_updates.key=data.v2 "
+                    "RETURNING data.v1, bgp_updates.key, bgp_updates.timestamp) "
+                    "INSERT INTO hijack_bgp_updates (hijack_key, update_key, timestamp) "
+                    "SELECT * FROM updated ON CONFLICT DO NOTHING"
+                )
                 self.wo_db.execute_values(
                     query, list(update_bgp_entries_parallel), page_size=1000
                 )
 
                 # execute serial execute_batch query
-                query = "UPDATE bgp_updates SET handled=true, hijack_key=array_distinct(hijack_key || array[%s]) WHERE bgp_updates.key=%s"
+                query = (
+                    "WITH updated AS (UPDATE bgp_updates SET handled=true, hijack_key=array_distinct(hijack_key || array[data.v1]) "
+                    "FROM (VALUES (%s, %s)) AS data (v1, v2) WHERE bgp_updates.key=data.v2 "
+                    "RETURNING data.v1, bgp_updates.key, bgp_updates.timestamp) "
+                    "INSERT INTO hijack_bgp_updates (hijack_key, update_key, timestamp) "
+                    "SELECT * FROM updated ON CONFLICT DO NOTHING"
+                )
                 self.wo_db.execute_batch(
                     query, list(update_bgp_entries_serial), page_size=1000
                 )
@@ -818,56 +1089,63 @@ class DatabaseBulkUpdater:
                 # get all handled hijack update entries of type 'A' that belong to this set
                 # (ordered by DESC timestamp)
                 query = (
-                    "SELECT key, prefix, peer_asn, hijack_key, timestamp "
-                    "FROM bgp_updates WHERE handled = true AND type = 'A'"
-                    "AND hijack_key<>ARRAY[]::text[] "
-                    "ORDER BY timestamp DESC"
+                    "SELECT b.key, b.prefix, b.peer_asn, hb.hijack_key, b.timestamp "
+                    "FROM hijack_bgp_updates AS hb JOIN bgp_updates AS b "
+                    "ON (b.timestamp = hb.timestamp AND b.key = hb.update_key) "
+                    "WHERE hb.hijack_key = ANY(%s) AND hb.update_key = ANY(%s) "
+                    "AND b.handled = true AND b.type = 'A' "
+                    "ORDER BY b.timestamp DESC"
+                )
+                ann_updates_entries = self.ro_db.execute(
+                    query, (list(updated_hijack_keys), list(updated_bgp_update_keys))
                 )
-                ann_updates_entries = self.ro_db.execute(query)
                 hijacks_to_ann_prefix_peer_timestamp = {}
                 for entry in ann_updates_entries:
-                    hijack_keys = entry[3]
-                    for hijack_key in hijack_keys:
-                        if (
-                            hijack_key in updated_hijack_keys
-                            and entry[0] in updated_bgp_update_keys
-                        ):
-                            prefix_peer = "{}-{}".format(entry[1], entry[2])
-                            if hijack_key not in hijacks_to_ann_prefix_peer_timestamp:
-                                hijacks_to_ann_prefix_peer_timestamp[hijack_key] = {}
-                            # the following needs to take place only the first time the prefix-peer combo is encountered
-                            if (
-                                prefix_peer
-                                not in hijacks_to_ann_prefix_peer_timestamp[hijack_key]
-                            ):
-                                hijacks_to_ann_prefix_peer_timestamp[hijack_key][
-                                    prefix_peer
-                                ] = (entry[4].timestamp(), entry[2])
+                    hijack_key = entry[3]
+                    prefix_peer = "{}-{}".format(entry[1], entry[2])
+                    if hijack_key not in hijacks_to_ann_prefix_peer_timestamp:
+                        hijacks_to_ann_prefix_peer_timestamp[hijack_key] = {}
+                    # the following needs to take place only the first time the prefix-peer combo is encountered
+                    if (
+                        prefix_peer
+                        not in hijacks_to_ann_prefix_peer_timestamp[hijack_key]
+                    ):
+                        hijacks_to_ann_prefix_peer_timestamp[hijack_key][
+                            prefix_peer
+                        ] = (
+                            entry[4].timestamp(),
+                            entry[2],
+                        )
 
                 # get all handled hijack updates of type 'W' (ordered by DESC timestamp)
                 query = (
-                    "SELECT key, prefix, peer_asn, hijack_key, timestamp "
-                    "FROM bgp_updates WHERE handled = true AND type = 'W'"
-                    "AND hijack_key<>ARRAY[]::text[] "
-                    "ORDER BY timestamp DESC"
+                    "SELECT b.key, b.prefix, b.peer_asn, hb.hijack_key, b.timestamp "
+                    "FROM hijack_bgp_updates AS hb JOIN bgp_updates AS b "
+                    "ON (b.timestamp = hb.timestamp AND b.key = hb.update_key) "
+                    "WHERE hb.hijack_key = ANY(%s) "
+                    "AND b.handled = true AND b.type = 'W' "
+                    "ORDER BY b.timestamp DESC"
+                )
+                wit_updates_entries = self.ro_db.execute(
+                    query, (list(updated_hijack_keys),)
                 )
-                wit_updates_entries = self.ro_db.execute(query)
                 hijacks_to_wit_prefix_peer_timestamp = {}
                 for entry in wit_updates_entries:
-                    hijack_keys = entry[3]
-                    for hijack_key in hijack_keys:
-                        if hijack_key in updated_hijack_keys:
-                            prefix_peer = "{}-{}".format(entry[1], entry[2])
-                            if hijack_key not in hijacks_to_wit_prefix_peer_timestamp:
-                                hijacks_to_wit_prefix_peer_timestamp[hijack_key] = {}
-                            # the following needs to take place only the first time the prefix-peer combo is encountered
-                            if (
-                                prefix_peer
-                                not in hijacks_to_wit_prefix_peer_timestamp[hijack_key]
-                            ):
-                                hijacks_to_wit_prefix_peer_timestamp[hijack_key][
-                                    prefix_peer
-                                ] = (entry[4].timestamp(), entry[2])
+                    hijack_key = entry[3]
+                    prefix_peer = "{}-{}".format(entry[1], entry[2])
+                    if hijack_key not in hijacks_to_wit_prefix_peer_timestamp:
+                        hijacks_to_wit_prefix_peer_timestamp[hijack_key] = {}
+                    # the following needs to take place only the first time the prefix-peer combo is encountered
+                    if (
+                        prefix_peer
+                        not in hijacks_to_wit_prefix_peer_timestamp[hijack_key]
+                    ):
+                        hijacks_to_wit_prefix_peer_timestamp[hijack_key][
+                            prefix_peer
+                        ] = (
+                            entry[4].timestamp(),
+                            entry[2],
+                        )
 
                 # check what peers need to be removed from withdrawn sets
                 remove_withdrawn_peers = set()
@@ -914,23 +1192,17 @@ class DatabaseBulkUpdater:
         update_bgp_entries.clear()
 
         # Update the BGP entries using the handled messages
-        if self.shared_memory_manager_dict["handled_bgp_entries"]:
+        if self.handled_bgp_entries:
             try:
                 query = "UPDATE bgp_updates SET handled=true FROM (VALUES %s) AS data (key) WHERE bgp_updates.key=data.key"
                 self.wo_db.execute_values(
-                    query,
-                    self.shared_memory_manager_dict["handled_bgp_entries"],
-                    page_size=1000,
+                    query, list(self.handled_bgp_entries), page_size=1000
                 )
-                num_of_updates += len(
-                    self.shared_memory_manager_dict["handled_bgp_entries"]
-                )
-                self.shared_memory_manager_dict["handled_bgp_entries"] = []
+                num_of_updates += len(self.handled_bgp_entries)
+                self.handled_bgp_entries = set()
             except Exception:
                 log.exception(
-                    "handled bgp entries {}".format(
-                        len(self.shared_memory_manager_dict["handled_bgp_entries"])
-                    )
+                    "handled bgp entries {}".format(len(self.handled_bgp_entries))
                 )
                 num_of_updates = -1
 
@@ -950,43 +1222,27 @@ class DatabaseBulkUpdater:
             )
 
             values = []
-            for key in self.shared_memory_manager_dict["insert_hijacks_entries"]:
+            for key, hijack_entry in self.insert_hijacks_entries.items():
                 entry = (
                     key,  # key
-                    self.shared_memory_manager_dict["insert_hijacks_entries"][key][
-                        "type"
-                    ],  # type
-                    self.shared_memory_manager_dict["insert_hijacks_entries"][key][
-                        "prefix"
-                    ],  # prefix
+                    hijack_entry["type"],  # type
+                    hijack_entry["prefix"],  # prefix
                     # hijack_as
-                    self.shared_memory_manager_dict["insert_hijacks_entries"][key][
-                        "hijack_as"
-                    ],
+                    hijack_entry["hijack_as"],
                     # num_peers_seen
-                    self.shared_memory_manager_dict["insert_hijacks_entries"][key][
-                        "num_peers_seen"
-                    ],
+                    hijack_entry["num_peers_seen"],
                     # num_asns_inf
-                    self.shared_memory_manager_dict["insert_hijacks_entries"][key][
-                        "num_asns_inf"
-                    ],
+                    hijack_entry["num_asns_inf"],
                     datetime.datetime.fromtimestamp(
-                        self.shared_memory_manager_dict["insert_hijacks_entries"][key][
-                            "time_started"
-                        ]
+                        hijack_entry["time_started"]
                     ),  # time_started
                     datetime.datetime.fromtimestamp(
-                        self.shared_memory_manager_dict["insert_hijacks_entries"][key][
-                            "time_last"
-                        ]
+                        hijack_entry["time_last"]
                     ),  # time_last
                     None,  # time_ended
                     None,  # mitigation_started
                     datetime.datetime.fromtimestamp(
-                        self.shared_memory_manager_dict["insert_hijacks_entries"][key][
-                            "time_detected"
-                        ]
+                        hijack_entry["time_detected"]
                     ),  # time_detected
                     False,  # under_mitigation
                     True,  # active
@@ -995,38 +1251,24 @@ class DatabaseBulkUpdater:
                     False,  # withdrawn
                     False,  # dormant
                     # configured_prefix
-                    self.shared_memory_manager_dict["insert_hijacks_entries"][key][
-                        "configured_prefix"
-                    ],
+                    hijack_entry["configured_prefix"],
                     datetime.datetime.fromtimestamp(
-                        self.shared_memory_manager_dict["insert_hijacks_entries"][key][
-                            "timestamp_of_config"
-                        ]
+                        hijack_entry["timestamp_of_config"]
                     ),  # timestamp_of_config
                     "",  # comment
                     # peers_seen
-                    self.shared_memory_manager_dict["insert_hijacks_entries"][key][
-                        "peers_seen"
-                    ],
+                    hijack_entry["peers_seen"],
                     [],  # peers_withdrawn
                     # asns_inf
-                    self.shared_memory_manager_dict["insert_hijacks_entries"][key][
-                        "asns_inf"
-                    ],
-                    self.shared_memory_manager_dict["insert_hijacks_entries"][key][
-                        "community_annotation"
-                    ],
-                    self.shared_memory_manager_dict["insert_hijacks_entries"][key][
-                        "rpki_status"
-                    ],
+                    hijack_entry["asns_inf"],
+                    hijack_entry["community_annotation"],
+                    hijack_entry["rpki_status"],
                 )
                 values.append(entry)
 
             self.wo_db.execute_values(query, values, page_size=1000)
-            num_of_entries = len(
-                self.shared_memory_manager_dict["insert_hijacks_entries"]
-            )
-            self.shared_memory_manager_dict["insert_hijacks_entries"] = {}
+            num_of_entries = len(self.insert_hijacks_entries)
+            self.insert_hijacks_entries = {}
         except Exception:
             log.exception("exception")
             num_of_entries = -1
@@ -1036,29 +1278,53 @@ class DatabaseBulkUpdater:
     def _handle_bgp_withdrawals(self):
         timestamp_thres = time.time() - 7 * 24 * 60 * 60 if HISTORIC == "false" else 0
         timestamp_thres = datetime.datetime.fromtimestamp(timestamp_thres)
+        # resolve the active hijacks of all buffered withdrawals in a single query
         query = (
-            "SELECT DISTINCT ON (hijacks.key) hijacks.peers_seen, hijacks.peers_withdrawn, "
+            "SELECT DISTINCT ON (data.key, hijacks.key) data.key, hijacks.peers_seen, hijacks.peers_withdrawn, "
             "hijacks.key, hijacks.hijack_as, hijacks.type, bgp_updates.timestamp, hijacks.time_last "
-            "FROM hijacks LEFT JOIN bgp_updates ON (hijacks.key = ANY(bgp_updates.hijack_key)) "
-            "WHERE bgp_updates.prefix = %s "
-            "AND bgp_updates.type = 'A' "
+            "FROM unnest(%s::inet[], %s::bigint[], %s::text[]) AS data (prefix, peer_asn, key) "
+            "JOIN bgp_updates ON (bgp_updates.prefix = data.prefix AND bgp_updates.peer_asn = data.peer_asn) "
+            "JOIN hijack_bgp_updates ON (hijack_bgp_updates.timestamp = bgp_updates.timestamp "
+            "AND hijack_bgp_updates.update_key = bgp_updates.key) "
+            "JOIN hijacks ON (hijacks.key = hijack_bgp_updates.hijack_key) "
+            "WHERE bgp_updates.type = 'A' "
             "AND bgp_updates.timestamp >= %s "
             "AND hijacks.active = true "
-            "AND bgp_updates.peer_asn = %s "
             "AND bgp_updates.handled = true "
-            "ORDER BY hijacks.key, bgp_updates.timestamp DESC"
+            "ORDER BY data.key, hijacks.key, bgp_updates.timestamp DESC"
         )
         update_normal_withdrawals = set()
         update_hijack_withdrawals = set()
-        shared_memory_locks["handle_bgp_withdrawals"].acquire()
-        for withdrawal in self.shared_memory_manager_dict["handle_bgp_withdrawals"]:
-            try:
-                # withdrawal -> 0: prefix, 1: peer_asn, 2: timestamp, 3:
-                # key
+        try:
+            # withdrawal -> 0: prefix, 1: peer_asn, 2: timestamp, 3: key
+            withdrawal_entries = {}
+            if self.handle_bgp_withdrawals:
                 entries = self.ro_db.execute(
-                    query, (withdrawal[0], timestamp_thres, withdrawal[1])
+                    query,
+                    (
+                        [withdrawal[0] for withdrawal in self.handle_bgp_withdrawals],
+                        [withdrawal[1] for withdrawal in self.handle_bgp_withdrawals],
+                        [withdrawal[3] for withdrawal in self.handle_bgp_withdrawals],
+                        timestamp_thres,
+                    ),
                 )
+                for entry in entries:
+                    withdrawal_entries.setdefault(entry[0], []).append(entry[1:])
 
+            # the state of the hijacks is carried over the withdrawals of the batch
+            # hijack key -> peers_seen, peers_withdrawn, time_last, redis hijack key
+            hijack_states = {}
+            updated_hijacks = set()
+            withdrawn_hijacks = set()
+            redis_pipeline = self.redis.pipeline()
+            merged_hijacks = []
+            for withdrawal in self.handle_bgp_withdrawals:
+                # hijacks withdrawn earlier in this batch are not active any more
+                entries = [
+                    entry
+                    for entry in withdrawal_entries.get(withdrawal[3], [])
+                    if entry[2] not in withdrawn_hijacks
+                ]
                 if not entries:
                     update_normal_withdrawals.add((withdrawal[3],))
                     continue
@@ -1067,88 +1333,130 @@ class DatabaseBulkUpdater:
                     # hij.key, 3: hij.as, 4: hij.type, 5: timestamp
                     # 6: time_last
                     update_hijack_withdrawals.add((entry[2], withdrawal[3]))
+                    if entry[2] not in hijack_states:
+                        hijack_states[entry[2]] = {
+                            "peers_seen": entry[0],
+                            "peers_withdrawn": entry[1],
+                            "time_last": entry[6],
+                            "redis_hijack_key": redis_key(
+                                withdrawal[0], entry[3], entry[4]
+                            ),
+                        }
+                    hijack_state = hijack_states[entry[2]]
                     # update the bgpupdate_keys related to this hijack with withdrawals
-                    redis_hijack_key = redis_key(withdrawal[0], entry[3], entry[4])
-                    # to prevent detectors from working in parallel with hijack update
-                    hijack = None
-                    if self.redis.exists("{}token_active".format(redis_hijack_key)):
-                        self.redis.set("{}token_active".format(redis_hijack_key), "1")
-                    if self.redis.exists("{}token".format(redis_hijack_key)):
-                        token = self.redis.blpop(
-                            "{}token".format(redis_hijack_key), timeout=60
-                        )
-                        if not token:
-                            log.info(
-                                "Redis withdrawal addition encountered redis token timeout for hijack {}".format(
-                                    entry[2]
-                                )
-                            )
-                        hijack = self.redis.get(redis_hijack_key)
-                        redis_pipeline = self.redis.pipeline()
-                        if hijack:
-                            hijack = classic_json.loads(hijack.decode("utf-8"))
-                            hijack["bgpupdate_keys"] = list(
-                                set(hijack["bgpupdate_keys"] + [withdrawal[3]])
-                            )
-                            redis_pipeline.set(redis_hijack_key, json.dumps(hijack))
-                        redis_pipeline.lpush(
-                            "{}token".format(redis_hijack_key), "token"
-                        )
-                        redis_pipeline.execute()
+                    # (merged atomically, in parallel with detector hijack updates)
+                    self.redis_merge_hijack(
+                        keys=[hijack_state["redis_hijack_key"]],
+                        args=[json.dumps({"bgpupdate_keys": [withdrawal[3]]}), "[]", 1],
+                        client=redis_pipeline,
+                    )
+                    merged_hijacks.append(entry[2])
                     if entry[5] > withdrawal[2]:
                         continue
                     # matching withdraw with a hijack
-                    if withdrawal[1] not in entry[1] and withdrawal[1] in entry[0]:
-                        entry[1].append(withdrawal[1])
-                        timestamp = max(withdrawal[2], entry[6])
+                    if (
+                        withdrawal[1] not in hijack_state["peers_withdrawn"]
+                        and withdrawal[1] in hijack_state["peers_seen"]
+                    ):
+                        hijack_state["peers_withdrawn"].append(withdrawal[1])
+                        hijack_state["time_last"] = max(
+                            withdrawal[2], hijack_state["time_last"]
+                        )
+                        updated_hijacks.add(entry[2])
                         # if a certain percentage of hijack 'A' peers see corresponding hijack 'W'
-                        if len(entry[1]) >= int(
-                            round(WITHDRAWN_HIJACK_THRESHOLD * len(entry[0]) / 100.0)
-                        ):
-                            # set hijack as withdrawn and delete from redis
-                            if hijack:
-                                hijack["end_tag"] = "withdrawn"
-                            purge_redis_eph_pers_keys(
-                                self.redis, redis_hijack_key, entry[2]
-                            )
-                            self.wo_db.execute(
-                                "UPDATE hijacks SET active=false, dormant=false, resolved=false, withdrawn=true, time_ended=%s, "
-                                "peers_withdrawn=%s, time_last=%s WHERE key=%s;",
-                                (timestamp, entry[1], timestamp, entry[2]),
+                        if len(hijack_state["peers_withdrawn"]) >= int(
+                            round(
+                                WITHDRAWN_HIJACK_THRESHOLD
+                                * len(hijack_state["peers_seen"])
+                                / 100.0
                             )
+                        ):
+                            withdrawn_hijacks.add(entry[2])
+                            updated_hijacks.discard(entry[2])
+
+            # set withdrawn hijacks as withdrawn and delete them from redis
+            for hijack_key in withdrawn_hijacks:
+                purge_redis_eph_pers_keys(
+                    self.redis,
+                    hijack_states[hijack_key]["redis_hijack_key"],
+                    hijack_key,
+                    redis_pipeline=redis_pipeline,
+                )
+            # keep the last merge result of each hijack (preceding its purge)
+            hijacks = {}
+            for hijack_key, hijack in zip(merged_hijacks, redis_pipeline.execute()):
+                if hijack:
+                    hijacks[hijack_key] = classic_json.loads(hijack[1])
 
-                            log.debug("withdrawn hijack {}".format(entry))
-                            if hijack:
-                                with Producer(self.connection) as producer:
-                                    producer.publish(
-                                        hijack,
-                                        exchange=self.hijack_notification_exchange,
-                                        routing_key="mail-log",
-                                        retry=False,
-                                        priority=1,
-                                        serializer="ujson",
-                                    )
-                                    producer.publish(
-                                        hijack,
-                                        exchange=self.hijack_notification_exchange,
-                                        routing_key="hij-log",
-                                        retry=False,
-                                        priority=1,
-                                        serializer="ujson",
-                                    )
-                        else:
-                            # add withdrawal to hijack
-                            self.wo_db.execute(
-                                "UPDATE hijacks SET peers_withdrawn=%s, time_last=%s, dormant=false WHERE key=%s;",
-                                (entry[1], timestamp, entry[2]),
-                            )
+            query = (
+                "UPDATE hijacks SET active=false, dormant=false, resolved=false, withdrawn=true, time_ended=data.time_last, "
+                "peers_withdrawn=data.peers_withdrawn, time_last=data.time_last "
+                "FROM (VALUES %s) AS data (key, peers_withdrawn, time_last) WHERE hijacks.key=data.key"
+            )
+            self.wo_db.execute_values(
+                query,
+                [
+                    (
+                        hijack_key,
+                        hijack_states[hijack_key]["peers_withdrawn"],
+                        hijack_states[hijack_key]["time_last"],
+                    )
+                    for hijack_key in withdrawn_hijacks
+                ],
+                page_size=1000,
+            )
+            # add withdrawals to (still active) hijacks
+            query = (
+                "UPDATE hijacks SET peers_withdrawn=data.peers_withdrawn, time_last=data.time_last, dormant=false "
+                "FROM (VALUES %s) AS data (key, peers_withdrawn, time_last) WHERE hijacks.key=data.key"
+            )
+            self.wo_db.execute_values(
+                query,
+                [
+                    (
+                        hijack_key,
+                        hijack_states[hijack_key]["peers_withdrawn"],
+                        hijack_states[hijack_key]["time_last"],
+                    )
+                    for hijack_key in updated_hijacks
+                ],
+                page_size=1000,
+            )
+            log.debug(
+                "withdrawn hijacks {}, updated hijacks {}".format(
+                    withdrawn_hijacks, updated_hijacks
+                )
+            )
 
-                            log.debug("updating hijack {}".format(entry))
-            except Exception:
-                log.exception("exception")
-        num_of_entries = len(self.shared_memory_manager_dict["handle_bgp_withdrawals"])
-        self.shared_memory_manager_dict["handle_bgp_withdrawals"] = []
-        shared_memory_locks["handle_bgp_withdrawals"].release()
+            withdrawn_hijack_values = [
+                hijacks[hijack_key]
+                for hijack_key in withdrawn_hijacks
+                if hijacks.get(hijack_key)
+            ]
+            if withdrawn_hijack_values:
+                with Producer(self.connection) as producer:
+                    for hijack in withdrawn_hijack_values:
+                        hijack["end_tag"] = "withdrawn"
+                        producer.publish(
+                            hijack,
+                            exchange=self.hijack_notification_exchange,
+                            routing_key="mail-log",
+                            retry=False,
+                            priority=1,
+                            serializer="ujson",
+                        )
+                        producer.publish(
+                            hijack,
+                            exchange=self.hijack_notification_exchange,
+                            routing_key="hij-log",
+                            retry=False,
+                            priority=1,
+                            serializer="ujson",
+                        )
+        except Exception:
+            log.exception("exception")
+        num_of_entries = len(self.handle_bgp_withdrawals)
+        self.handle_bgp_withdrawals = {}
 
         try:
             update_hijack_withdrawals_dict = {}
@@ -1174,8 +1482,11 @@ class DatabaseBulkUpdater:
 
             # execute parallel execute values query
             query = (
-                "UPDATE bgp_updates SET handled=true, hijack_key=array_distinct(hijack_key || array[data.v1]) "
-                "FROM (VALUES %s) AS data (v1, v2) WHERE bgp_updates.key=data.v2"
+                "WITH updated AS (UPDATE bgp_updates SET handled=true, hijack_key=array_distinct(hijack_key || array[data.v1]) "
+                "FROM (VALUES %s) AS data (v1, v2) WHERE bgp_updates.key=data.v2 "
+                "RETURNING data.v1, bgp_updates.key, bgp_updates.timestamp) "
+                "INSERT INTO hijack_bgp_updates (hijack_key, update_key, timestamp) "
+                "SELECT * FROM updated ON CONFLICT DO NOTHING"
             )
             self.wo_db.execute_values(
                 query, list(update_hijack_withdrawals_parallel), page_size=1000
@@ -1183,8 +1494,11 @@ class DatabaseBulkUpdater:
 
             # execute serial execute_batch query
             query = (
-                "UPDATE bgp_updates SET handled=true, hijack_key=array_distinct(hijack_key || array[%s]) "
-                "WHERE bgp_updates.key=%s"
+                "WITH updated AS (UPDATE bgp_updates SET handled=true, hijack_key=array_distinct(hijack_key || array[data.v1]) "
+                "FROM (VALUES (%s, %s)) AS data (v1, v2) WHERE bgp_updates.key=data.v2 "
+                "RETURNING data.v1, bgp_updates.key, bgp_updates.timestamp) "
+                "INSERT INTO hijack_bgp_updates (hijack_key, update_key, timestamp) "
+                "SELECT * FROM updated ON CONFLICT DO NOTHING"
             )
             self.wo_db.execute_batch(
                 query, list(update_hijack_withdrawals_serial), page_size=1000
@@ -1203,22 +1517,14 @@ class DatabaseBulkUpdater:
         return num_of_entries
 
     def _handle_hijack_outdate(self):
-        shared_memory_locks["outdate_hijacks"].acquire()
-        if not self.shared_memory_manager_dict["outdate_hijacks"]:
-            shared_memory_locks["outdate_hijacks"].release()
+        if not self.outdate_hijacks:
             return
         try:
             query = "UPDATE hijacks SET active=false, dormant=false, outdated=true FROM (VALUES %s) AS data (key) WHERE hijacks.key=data.key;"
-            self.wo_db.execute_values(
-                query,
-                self.shared_memory_manager_dict["outdate_hijacks"],
-                page_size=1000,
-            )
-            self.shared_memory_manager_dict["outdate_hijacks"] = []
+            self.wo_db.execute_values(query, list(self.outdate_hijacks), page_size=1000)
+            self.outdate_hijacks = set()
         except Exception:
             log.exception("")
-        finally:
-            shared_memory_locks["outdate_hijacks"].release()
 
     def run(self):
         while True:
@@ -1229,13 +1535,10 @@ class DatabaseBulkUpdater:
                 break
             shared_memory_locks["data_worker"].release()
             try:
+                self._drain_pipeline()
                 inserts = self._insert_bgp_updates()
-                shared_memory_locks["insert_hijacks_entries"].acquire()
-                shared_memory_locks["handled_bgp_entries"].acquire()
                 updates = self._update_bgp_updates()
-                shared_memory_locks["handled_bgp_entries"].release()
                 hijacks = self._insert_update_hijacks()
-                shared_memory_locks["insert_hijacks_entries"].release()
                 withdrawals = self._handle_bgp_withdrawals()
                 self._handle_hijack_outdate()
                 str_ = ""
@@ -1252,21 +1555,7 @@ class DatabaseBulkUpdater:
             except Exception:
                 log.exception("exception")
                 log.error("flushing current state")
-                shared_memory_locks["insert_bgp_entries"].acquire()
-                shared_memory_locks["handle_bgp_withdrawals"].acquire()
-                shared_memory_locks["handled_bgp_entries"].acquire()
-                shared_memory_locks["outdate_hijacks"].acquire()
-                shared_memory_locks["insert_hijacks_entries"].acquire()
-                self.shared_memory_manager_dict["insert_bgp_entries"] = []
-                self.shared_memory_manager_dict["handle_bgp_withdrawals"] = []
-                self.shared_memory_manager_dict["handled_bgp_entries"] = []
-                self.shared_memory_manager_dict["outdate_hijacks"] = []
-                self.shared_memory_manager_dict["insert_hijacks_entries"] = {}
-                shared_memory_locks["insert_bgp_entries"].release()
-                shared_memory_locks["handle_bgp_withdrawals"].release()
-                shared_memory_locks["handled_bgp_entries"].release()
-                shared_memory_locks["outdate_hijacks"].release()
-                shared_memory_locks["insert_hijacks_entries"].release()
+                self._flush_state()
             finally:
                 time.sleep(BULK_TIMER)
 
@@ -1317,6 +1606,15 @@ class DatabaseDataWorker(ConsumerProducerMixin):
             self.redis.lpush("database-goahead", "1")
         else:
             while not self.redis.exists("database-goahead"):
+                # resume a bootstrap left incomplete by a (stopped) replica
+                if self.redis.exists(BOOTSTRAP_CHECKPOINT) and self.redis.set(
+                    "redis-bootstrap-alive", "1", nx=True, ex=BOOTSTRAP_ALIVE_TIMEOUT
+                ):
+                    log.info("resuming redis bootstrap...")
+                    self.bootstrap_redis()
+                    log.info("redis bootstrapped...")
+                    self.redis.lpush("database-goahead", "1")
+                    break
                 time.sleep(1)
             self.redis.blpop("database-goahead")
             self.redis.lpush("database-goahead", "1")
@@ -1423,9 +1721,13 @@ class DatabaseDataWorker(ConsumerProducerMixin):
             priority=1,
         )
 
+        # local duplicate filter in front of the redis BGP update keys
+        self.deduplicator = BGPUpdateDeduplicator(self.redis)
+
         log.info("setting up bulk updater process...")
+        self.bulk_pipeline = BulkUpdatePipeline()
         self.bulk_updater = DatabaseBulkUpdater(
-            self.connection, self.shared_memory_manager_dict
+            self.connection, self.shared_memory_manager_dict, self.bulk_pipeline
         )
         mp.Process(target=self.bulk_updater.run).start()
         log.info("bulk updater set up")
@@ -1438,7 +1740,7 @@ class DatabaseDataWorker(ConsumerProducerMixin):
                 queues=[self.update_queue],
                 on_message=self.handle_bgp_update,
                 prefetch_count=100,
-                accept=["ujson"],
+                accept=accepted_wire_formats(self.update_exchange),
             ),
             Consumer(
                 queues=[self.hijack_queue],
@@ -1450,7 +1752,7 @@ class DatabaseDataWorker(ConsumerProducerMixin):
                 queues=[self.withdraw_queue],
                 on_message=self.handle_withdraw_update,
                 prefetch_count=100,
-                accept=["ujson"],
+                accept=accepted_wire_formats(self.update_exchange),
             ),
             Consumer(
                 queues=[self.handled_queue],
@@ -1516,12 +1818,21 @@ class DatabaseDataWorker(ConsumerProducerMixin):
 
     def handle_bgp_update(self, message):
         # log.debug('message: {}\npayload: {}'.format(message, message.payload))
+        # a single ack covers all the updates of a batched envelope
         message.ack()
-        msg_ = message.payload
+        try:
+            bgp_updates = unpack_update_envelope(message.payload)
+        except Exception:
+            log.exception("{}".format(message.payload))
+            return
+        for msg_ in bgp_updates:
+            self.store_bgp_update(msg_)
+
+    def store_bgp_update(self, msg_):
         # prefix, key, origin_as, peer_asn, as_path, service, type, communities,
         # timestamp, hijack_key, handled, matched_prefix, orig_path
 
-        if not self.redis.getset(msg_["key"], "1"):
+        if not self.deduplicator.seen(msg_["key"]):
             try:
                 # discard old (older than 1.30 hour ago) timestamped BGP updates (may accumulate due to load)
                 if (
@@ -1557,16 +1868,7 @@ class DatabaseDataWorker(ConsumerProducerMixin):
                     json.dumps(msg_["orig_path"]),  # orig_path
                 )
                 # insert all types of BGP updates
-                # thread-safe access to update dict
-                shared_memory_locks["insert_bgp_entries"].acquire()
-                insert_bgp_entries = self.shared_memory_manager_dict[
-                    "insert_bgp_entries"
-                ]
-                insert_bgp_entries.append(value)
-                self.shared_memory_manager_dict[
-                    "insert_bgp_entries"
-                ] = insert_bgp_entries
-                shared_memory_locks["insert_bgp_entries"].release()
+                self.bulk_pipeline.put("insert_bgp_entries", value)
 
                 # register the monitor/peer ASN from whom we learned this BGP update
                 self.redis.sadd("peer-asns", msg_["peer_asn"])
@@ -1578,127 +1880,55 @@ class DatabaseDataWorker(ConsumerProducerMixin):
                     )
             except Exception:
                 log.exception("{}".format(msg_))
-            finally:
-                # reset timer each time we hit the same BGP update
-                self.redis.expire(msg_["key"], 2 * 60 * 60)
 
     def handle_withdraw_update(self, message):
         # log.debug('message: {}\npayload: {}'.format(message, message.payload))
         message.ack()
-        msg_ = message.payload
-        shared_memory_locks["handle_bgp_withdrawals"].acquire()
         try:
-            # update hijacks based on withdrawal messages
-            value = (
-                msg_["prefix"],  # prefix
-                msg_["peer_asn"],  # peer_asn
-                datetime.datetime.fromtimestamp((msg_["timestamp"])),  # timestamp
-                msg_["key"],  # key
-            )
-            handle_bgp_withdrawals = self.shared_memory_manager_dict[
-                "handle_bgp_withdrawals"
-            ]
-            if value not in handle_bgp_withdrawals:
-                handle_bgp_withdrawals.append(value)
-            self.shared_memory_manager_dict[
-                "handle_bgp_withdrawals"
-            ] = handle_bgp_withdrawals
+            withdrawals = unpack_update_envelope(message.payload)
         except Exception:
-            log.exception("{}".format(msg_))
-        finally:
-            shared_memory_locks["handle_bgp_withdrawals"].release()
+            log.exception("{}".format(message.payload))
+            return
+        for msg_ in withdrawals:
+            try:
+                # update hijacks based on withdrawal messages
+                value = (
+                    msg_["prefix"],  # prefix
+                    msg_["peer_asn"],  # peer_asn
+                    datetime.datetime.fromtimestamp((msg_["timestamp"])),  # timestamp
+                    msg_["key"],  # key
+                )
+                self.bulk_pipeline.put("handle_bgp_withdrawals", value)
+            except Exception:
+                log.exception("{}".format(msg_))
 
     def handle_hijack_outdate(self, message):
         # log.debug('message: {}\npayload: {}'.format(message, message.payload))
         message.ack()
-        shared_memory_locks["outdate_hijacks"].acquire()
         try:
             raw = message.payload
-            if (raw["persistent_hijack_key"],) not in self.shared_memory_manager_dict[
-                "outdate_hijacks"
-            ]:
-                outdate_hijacks = self.shared_memory_manager_dict["outdate_hijacks"]
-                outdate_hijacks.append((raw["persistent_hijack_key"],))
-                self.shared_memory_manager_dict["outdate_hijacks"] = outdate_hijacks
+            self.bulk_pipeline.put("outdate_hijacks", (raw["persistent_hijack_key"],))
         except Exception:
             log.exception("{}".format(message))
-        finally:
-            shared_memory_locks["outdate_hijacks"].release()
 
     def handle_hijack_update(self, message):
         # log.debug('message: {}\npayload: {}'.format(message, message.payload))
         message.ack()
-        msg_ = message.payload
-        shared_memory_locks["insert_hijacks_entries"].acquire()
-        try:
-            key = msg_["key"]  # persistent hijack key
-
-            insert_hijacks_entries = self.shared_memory_manager_dict[
-                "insert_hijacks_entries"
-            ]
-            if key not in insert_hijacks_entries:
-                # log.info('key {} at {}'.format(key, os.getpid()))
-                insert_hijacks_entries[key] = {}
-                insert_hijacks_entries[key]["prefix"] = msg_["prefix"]
-                insert_hijacks_entries[key]["hijack_as"] = msg_["hijack_as"]
-                insert_hijacks_entries[key]["type"] = msg_["type"]
-                insert_hijacks_entries[key]["time_started"] = msg_["time_started"]
-                insert_hijacks_entries[key]["time_last"] = msg_["time_last"]
-                insert_hijacks_entries[key]["peers_seen"] = list(msg_["peers_seen"])
-                insert_hijacks_entries[key]["asns_inf"] = list(msg_["asns_inf"])
-                insert_hijacks_entries[key]["num_peers_seen"] = len(msg_["peers_seen"])
-                insert_hijacks_entries[key]["num_asns_inf"] = len(msg_["asns_inf"])
-                insert_hijacks_entries[key]["monitor_keys"] = set(msg_["monitor_keys"])
-                insert_hijacks_entries[key]["time_detected"] = msg_["time_detected"]
-                insert_hijacks_entries[key]["configured_prefix"] = msg_[
-                    "configured_prefix"
-                ]
-                insert_hijacks_entries[key]["timestamp_of_config"] = msg_[
-                    "timestamp_of_config"
-                ]
-                insert_hijacks_entries[key]["community_annotation"] = msg_[
-                    "community_annotation"
-                ]
-                insert_hijacks_entries[key]["rpki_status"] = msg_["rpki_status"]
-            else:
-                insert_hijacks_entries[key]["time_started"] = min(
-                    insert_hijacks_entries[key]["time_started"], msg_["time_started"]
-                )
-                insert_hijacks_entries[key]["time_last"] = max(
-                    insert_hijacks_entries[key]["time_last"], msg_["time_last"]
-                )
-                insert_hijacks_entries[key]["peers_seen"] = list(msg_["peers_seen"])
-                insert_hijacks_entries[key]["asns_inf"] = list(msg_["asns_inf"])
-                insert_hijacks_entries[key]["num_peers_seen"] = len(msg_["peers_seen"])
-                insert_hijacks_entries[key]["num_asns_inf"] = len(msg_["asns_inf"])
-                insert_hijacks_entries[key]["monitor_keys"].update(msg_["monitor_keys"])
-                insert_hijacks_entries[key]["community_annotation"] = msg_[
-                    "community_annotation"
-                ]
-                insert_hijacks_entries[key]["rpki_status"] = msg_["rpki_status"]
-
-            self.shared_memory_manager_dict[
-                "insert_hijacks_entries"
-            ] = insert_hijacks_entries
-        except Exception:
-            log.exception("{}".format(msg_))
-        finally:
-            shared_memory_locks["insert_hijacks_entries"].release()
+        # hijack entries are merged per persistent key by the bulk updater
+        self.bulk_pipeline.put("insert_hijacks_entries", message.payload)
 
     def handle_handled_bgp_update(self, message):
         # log.debug('message: {}\npayload: {}'.format(message, message.payload))
         message.ack()
-        shared_memory_locks["handled_bgp_entries"].acquire()
         try:
-            key_ = (message.payload,)
-            handled_bgp_entries = self.shared_memory_manager_dict["handled_bgp_entries"]
-            if key_ not in handled_bgp_entries:
-                handled_bgp_entries.append(key_)
-            self.shared_memory_manager_dict["handled_bgp_entries"] = handled_bgp_entries
+            # detection marks whole batches of updates as handled at once
+            bgp_update_keys = message.payload
+            if not isinstance(bgp_update_keys, list):
+                bgp_update_keys = [bgp_update_keys]
+            for bgp_update_key in bgp_update_keys:
+                self.bulk_pipeline.put("handled_bgp_entries", (bgp_update_key,))
         except Exception:
             log.exception("{}".format(message))
-        finally:
-            shared_memory_locks["handled_bgp_entries"].release()
 
     def handle_hijack_ongoing_request(self, message):
         if not isinstance(message, dict):
@@ -1708,7 +1938,8 @@ class DatabaseDataWorker(ConsumerProducerMixin):
             query = (
                 "SELECT b.key, b.prefix, b.origin_as, b.as_path, b.type, b.peer_asn, "
                 "b.communities, b.timestamp, b.service, b.matched_prefix, h.key, h.hijack_as, h.type "
-                "FROM hijacks AS h LEFT JOIN bgp_updates AS b ON (h.key = ANY(b.hijack_key)) "
+                "FROM hijacks AS h JOIN hijack_bgp_updates AS hb ON (hb.hijack_key = h.key) "
+                "JOIN bgp_updates AS b ON (b.timestamp = hb.timestamp AND b.key = hb.update_key) "
                 "WHERE h.active = true AND b.handled=true"
             )
 
@@ -1749,148 +1980,195 @@ class DatabaseDataWorker(ConsumerProducerMixin):
             log.exception("exception")
 
     def bootstrap_redis(self):
+        """
+        Bootstraps redis from the database in bounded chunks (server-side cursors,
+        chunked redis pipelines). Progress is recorded in a checkpoint so that an
+        interrupted bootstrap is resumed, instead of started over.
+        """
+        stop_keepalive = threading.Event()
+        keepalive_thread = threading.Thread(
+            target=self._keep_bootstrap_alive, args=(stop_keepalive,), daemon=True
+        )
         try:
+            checkpoint = {
+                k.decode(): v.decode()
+                for k, v in self.redis.hgetall(BOOTSTRAP_CHECKPOINT).items()
+            }
+            self.redis.set("redis-bootstrap-alive", "1", ex=BOOTSTRAP_ALIVE_TIMEOUT)
+            keepalive_thread.start()
+            self.redis.hset(BOOTSTRAP_CHECKPOINT, "started", time.time())
+            if "hijacks_done" not in checkpoint:
+                self._bootstrap_redis_hijacks(checkpoint.get("hijacks", ""))
+            if "recent_done" not in checkpoint:
+                self._bootstrap_redis_recent_updates(checkpoint.get("recent"))
+            if "peers_done" not in checkpoint:
+                self._bootstrap_redis_peers()
+            stop_keepalive.set()
+            keepalive_thread.join()
+            self.redis.delete(BOOTSTRAP_CHECKPOINT, "redis-bootstrap-alive")
+        except Exception:
+            log.exception("exception")
+        finally:
+            stop_keepalive.set()
 
-            # get all ongoing hijack events
-            query = (
-                "SELECT time_started, time_last, peers_seen, "
-                "asns_inf, key, prefix, hijack_as, type, time_detected, "
-                "configured_prefix, timestamp_of_config, community_annotation, rpki_status "
-                "FROM hijacks WHERE active = true"
-            )
-            ongoing_hijack_entries = self.ro_db.execute(query)
-            ongoing_hijack_keys_to_entries = {}
-            for entry in ongoing_hijack_entries:
-                ongoing_hijack_keys_to_entries[entry[4]] = entry
-
-            # get all hijack updates
-            query = "SELECT key, hijack_key FROM bgp_updates WHERE handled = true AND hijack_key<>ARRAY[]::text[];"
-            hijack_update_entries = self.ro_db.execute(query)
-            ongoing_hijacks_to_updates = {}
-            for entry in hijack_update_entries:
-                hijack_keys = entry[1]
-                for hijack_key in hijack_keys:
-                    if hijack_key in ongoing_hijack_keys_to_entries:
-                        if hijack_key not in ongoing_hijacks_to_updates:
-                            ongoing_hijacks_to_updates[hijack_key] = set()
-                        ongoing_hijacks_to_updates[hijack_key].add(entry[0])
-            del hijack_update_entries
-
-            # bootstrap hijack events in redis
-            redis_pipeline = self.redis.pipeline()
-            for entry in ongoing_hijack_entries:
-                result = {
-                    "time_started": entry[0].timestamp(),
-                    "time_last": entry[1].timestamp(),
-                    "peers_seen": set(entry[2]),
-                    "asns_inf": set(entry[3]),
-                    "key": entry[4],
-                    "prefix": entry[5],
-                    "hijack_as": entry[6],
-                    "type": entry[7],
-                    "time_detected": entry[8].timestamp(),
-                    "configured_prefix": entry[9],
-                    "timestamp_of_config": entry[10].timestamp(),
-                    "community_annotation": entry[11],
-                    "rpki_status": entry[12],
-                }
-                result["bgpupdate_keys"] = ongoing_hijacks_to_updates[entry[4]]
-
-                redis_hijack_key = redis_key(entry[5], entry[6], entry[7])
-                redis_pipeline.set(redis_hijack_key, json.dumps(result))
-                redis_pipeline.sadd("persistent-keys", entry[4])
-            redis_pipeline.execute()
+    def _keep_bootstrap_alive(self, stop_keepalive):
+        """
+        Refreshes the liveness key of the bootstrap independently of its progress,
+        so that slow queries do not let a waiting replica take it over.
+        """
+        while not stop_keepalive.wait(BOOTSTRAP_ALIVE_TIMEOUT / 3.0):
+            try:
+                self.redis.set("redis-bootstrap-alive", "1", ex=BOOTSTRAP_ALIVE_TIMEOUT)
+            except Exception:
+                log.exception("exception")
 
-            # bootstrap recent BGP updates
-            query = (
-                "SELECT key, timestamp FROM bgp_updates "
-                "WHERE timestamp > NOW() - interval '2 hours' "
-                "ORDER BY timestamp ASC"
-            )
+    def _flush_bootstrap_pipeline(self, redis_pipeline, checkpoint_field, marker):
+        redis_pipeline.hset(BOOTSTRAP_CHECKPOINT, checkpoint_field, marker)
+        redis_pipeline.execute()
 
-            entries = self.ro_db.execute(query)
+    def _bootstrap_redis_hijacks(self, last_hijack_key):
+        # get all ongoing hijack events
+        query = (
+            "SELECT time_started, time_last, peers_seen, "
+            "asns_inf, key, prefix, hijack_as, type, time_detected, "
+            "configured_prefix, timestamp_of_config, community_annotation, rpki_status "
+            "FROM hijacks WHERE active = true AND key > %s"
+        )
+        ongoing_hijack_keys_to_entries = {}
+        for entry in self.ro_db.execute(query, (last_hijack_key,)):
+            ongoing_hijack_keys_to_entries[entry[4]] = entry
 
-            redis_pipeline = self.redis.pipeline()
+        # stream the handled updates of the ongoing hijacks, hijack by hijack
+        query = (
+            "SELECT h.key, b.key, b.type, b.prefix, b.peer_asn, b.as_path FROM hijacks AS h "
+            "LEFT JOIN (hijack_bgp_updates AS hb JOIN bgp_updates AS b "
+            "ON (b.timestamp = hb.timestamp AND b.key = hb.update_key AND b.handled = true)) "
+            "ON (hb.hijack_key = h.key) "
+            "WHERE h.active = true AND h.key > %s "
+            "ORDER BY h.key"
+        )
+        redis_pipeline = self.redis.pipeline()
+        hijack_key = None
+        hijack_updates = []
+        for entries in self.ro_db.execute_iter(
+            query, (last_hijack_key,), chunk_size=BOOTSTRAP_CHUNK_SIZE
+        ):
             for entry in entries:
-                expire = max(
-                    int(entry[1].timestamp()) + 2 * 60 * 60 - int(time.time()), 60
+                if entry[0] != hijack_key:
+                    if hijack_key in ongoing_hijack_keys_to_entries:
+                        self._bootstrap_redis_hijack(
+                            redis_pipeline,
+                            ongoing_hijack_keys_to_entries.pop(hijack_key),
+                            hijack_updates,
+                        )
+                        last_hijack_key = hijack_key
+                    hijack_key = entry[0]
+                    hijack_updates = []
+                if entry[1]:
+                    hijack_updates.append(entry[1:])
+            # only completely stored hijacks are checkpointed
+            if len(redis_pipeline) >= BOOTSTRAP_CHUNK_SIZE:
+                self._flush_bootstrap_pipeline(
+                    redis_pipeline, "hijacks", last_hijack_key
                 )
-                redis_pipeline.set(entry[0], "1", ex=expire)
-            redis_pipeline.execute()
-
-            # bootstrap (origin, neighbor) AS-links of ongoing hijacks
-
-            # first get all hijack handled 'A' updates
-            query = (
-                "SELECT key, hijack_key, prefix, peer_asn, as_path FROM bgp_updates "
-                "WHERE type = 'A' "
-                "AND handled = true "
-                "AND hijack_key<>ARRAY[]::text[];"
+        if hijack_key in ongoing_hijack_keys_to_entries:
+            self._bootstrap_redis_hijack(
+                redis_pipeline,
+                ongoing_hijack_keys_to_entries.pop(hijack_key),
+                hijack_updates,
             )
-            hijack_handled_ann_update_entries = self.ro_db.execute(query)
-            hijack_handled_ann_update_keys_to_entries = {}
-            for entry in hijack_handled_ann_update_entries:
-                hijack_handled_ann_update_keys_to_entries[entry[0]] = entry
-
-            # then map ongoing hijacks (we have them already from before) to those updates
-            ongoing_hijacks_to_handled_ann_updates = {}
-            for entry in hijack_handled_ann_update_entries:
-                hijack_keys = entry[1]
-                for hijack_key in hijack_keys:
-                    if hijack_key in ongoing_hijack_keys_to_entries:
-                        if hijack_key not in ongoing_hijacks_to_handled_ann_updates:
-                            ongoing_hijacks_to_handled_ann_updates[hijack_key] = set()
-                        ongoing_hijacks_to_handled_ann_updates[hijack_key].add(entry[0])
+        self._flush_bootstrap_pipeline(redis_pipeline, "hijacks_done", 1)
 
-            # now store the combinations
-            redis_pipeline = self.redis.pipeline()
-            for hijack_key in ongoing_hijacks_to_handled_ann_updates:
-                hijack_entry = ongoing_hijack_keys_to_entries[hijack_key]
-                redis_hijack_key = redis_key(
-                    hijack_entry[5], hijack_entry[6], hijack_entry[7]
-                )
-                for update_key in ongoing_hijacks_to_handled_ann_updates[hijack_key]:
-                    update = hijack_handled_ann_update_keys_to_entries[update_key]
-                    # store the origin, neighbor combination for this hijack BGP update
-                    origin = None
-                    neighbor = None
-                    as_path = update[4]
-                    if as_path:
-                        origin = as_path[-1]
-                    if len(as_path) > 1:
-                        neighbor = as_path[-2]
-
-                    redis_pipeline.sadd(
-                        "hij_orig_neighb_{}".format(redis_hijack_key),
-                        "{}_{}".format(origin, neighbor),
-                    )
+    @staticmethod
+    def _bootstrap_redis_hijack(redis_pipeline, entry, hijack_updates):
+        result = {
+            "time_started": entry[0].timestamp(),
+            "time_last": entry[1].timestamp(),
+            "peers_seen": set(entry[2]),
+            "asns_inf": set(entry[3]),
+            "key": entry[4],
+            "prefix": entry[5],
+            "hijack_as": entry[6],
+            "type": entry[7],
+            "time_detected": entry[8].timestamp(),
+            "configured_prefix": entry[9],
+            "timestamp_of_config": entry[10].timestamp(),
+            "community_annotation": entry[11],
+            "rpki_status": entry[12],
+            "bgpupdate_keys": set(update[0] for update in hijack_updates),
+        }
 
-                    # store the prefix and peer asn for this hijack BGP update
-                    redis_pipeline.sadd(
-                        "prefix_{}_peer_{}_hijacks".format(update[2], update[3]),
-                        redis_hijack_key,
-                    )
-                    redis_pipeline.sadd(
-                        "hijack_{}_prefixes_peers".format(redis_hijack_key),
-                        "{}_{}".format(update[2], update[3]),
-                    )
-            redis_pipeline.execute()
+        redis_hijack_key = redis_key(entry[5], entry[6], entry[7])
+        redis_pipeline.set(redis_hijack_key, json.dumps(result))
+        redis_pipeline.sadd("persistent-keys", entry[4])
+
+        # bootstrap (origin, neighbor) AS-links of the hijack 'A' updates
+        for update in hijack_updates:
+            # update -> 0: key, 1: type, 2: prefix, 3: peer_asn, 4: as_path
+            if update[1] != "A":
+                continue
+            # store the origin, neighbor combination for this hijack BGP update
+            origin = None
+            neighbor = None
+            as_path = update[4]
+            if as_path:
+                origin = as_path[-1]
+            if len(as_path) > 1:
+                neighbor = as_path[-2]
+
+            redis_pipeline.sadd(
+                "hij_orig_neighb_{}".format(redis_hijack_key),
+                "{}_{}".format(origin, neighbor),
+            )
 
-            # bootstrap seen monitor peers
-            query = "SELECT DISTINCT peer_asn FROM bgp_updates"
-            entries = self.ro_db.execute(query)
+            # store the prefix and peer asn for this hijack BGP update
+            redis_pipeline.sadd(
+                "prefix_{}_peer_{}_hijacks".format(update[2], update[3]),
+                redis_hijack_key,
+            )
+            redis_pipeline.sadd(
+                "hijack_{}_prefixes_peers".format(redis_hijack_key),
+                "{}_{}".format(update[2], update[3]),
+            )
 
-            redis_pipeline = self.redis.pipeline()
+    def _bootstrap_redis_recent_updates(self, last_timestamp):
+        # bootstrap recent BGP updates
+        timestamp_thres = datetime.datetime.now() - datetime.timedelta(hours=2)
+        if last_timestamp:
+            timestamp_thres = max(
+                timestamp_thres, datetime.datetime.fromtimestamp(float(last_timestamp))
+            )
+        query = (
+            "SELECT key, timestamp FROM bgp_updates "
+            "WHERE timestamp >= %s "
+            "ORDER BY timestamp ASC"
+        )
+        redis_pipeline = self.redis.pipeline()
+        for entries in self.ro_db.execute_iter(
+            query, (timestamp_thres,), chunk_size=BOOTSTRAP_CHUNK_SIZE
+        ):
             for entry in entries:
-                redis_pipeline.sadd("peer-asns", int(entry[0]))
-            redis_pipeline.execute()
-
-            self.wo_db.execute(
-                "UPDATE stats SET monitor_peers=%s;", (self.monitor_peers,)
+                expire = max(
+                    int(entry[1].timestamp()) + BGP_UPDATE_KEY_TTL - int(time.time()),
+                    60,
+                )
+                redis_pipeline.set(entry[0], "1", ex=expire)
+            self._flush_bootstrap_pipeline(
+                redis_pipeline, "recent", entries[-1][1].timestamp()
             )
+        self._flush_bootstrap_pipeline(redis_pipeline, "recent_done", 1)
 
-        except Exception:
-            log.exception("exception")
+    def _bootstrap_redis_peers(self):
+        # bootstrap seen monitor peers (of all the stored updates), streamed
+        # in chunks instead of being fetched all at once
+        query = "SELECT DISTINCT peer_asn FROM bgp_updates"
+        redis_pipeline = self.redis.pipeline()
+        for entries in self.ro_db.execute_iter(query, chunk_size=BOOTSTRAP_CHUNK_SIZE):
+            redis_pipeline.sadd("peer-asns", *[int(entry[0]) for entry in entries])
+        self._flush_bootstrap_pipeline(redis_pipeline, "peers_done", 1)
+
+        self.monitor_peers = self.redis.scard("peer-asns")
+        self.wo_db.execute("UPDATE stats SET monitor_peers=%s;", (self.monitor_peers,))
 
     def handle_hijack_resolve(self, message):
         message.ack()
@@ -1916,40 +2194,11 @@ class DatabaseDataWorker(ConsumerProducerMixin):
         log.debug("payload: {}".format(raw))
         try:
             redis_hijack_key = redis_key(raw["prefix"], raw["hijack_as"], raw["type"])
-            redis_hijack = self.redis.get(redis_hijack_key)
             if self.redis.sismember("persistent-keys", raw["key"]):
                 purge_redis_eph_pers_keys(self.redis, redis_hijack_key, raw["key"])
 
-            log.debug("redis-entry for {}: {}".format(redis_hijack_key, redis_hijack))
             self.wo_db.execute("DELETE FROM hijacks WHERE key=%s;", (raw["key"],))
-            if redis_hijack and classic_json.loads(redis_hijack.decode("utf-8")).get(
-                "bgpupdate_keys", []
-            ):
-                log.debug("deleting hijack using cache for bgp updates")
-                redis_hijack = classic_json.loads(redis_hijack.decode("utf-8"))
-                log.debug(
-                    "bgpupdate_keys {} for {}".format(
-                        redis_hijack["bgpupdate_keys"], redis_hijack_key
-                    )
-                )
-                self.wo_db.execute(
-                    "DELETE FROM bgp_updates WHERE %s = ANY(hijack_key) AND handled = true AND array_length(hijack_key,1) = 1 AND key = ANY(%s);",
-                    (raw["key"], list(redis_hijack["bgpupdate_keys"])),
-                )
-                self.wo_db.execute(
-                    "UPDATE bgp_updates SET hijack_key = array_remove(hijack_key, %s) WHERE handled = true AND key = ANY(%s);",
-                    (raw["key"], list(redis_hijack["bgpupdate_keys"])),
-                )
-            else:
-                log.debug("deleting hijack by querying bgp updates database")
-                self.wo_db.execute(
-                    "DELETE FROM bgp_updates WHERE %s = ANY(hijack_key) AND array_length(hijack_key,1) = 1 AND handled = true;",
-                    (raw["key"],),
-                )
-                self.wo_db.execute(
-                    "UPDATE bgp_updates SET hijack_key = array_remove(hijack_key, %s) WHERE %s = ANY(hijack_key) AND handled = true;",
-                    (raw["key"], raw["key"]),
-                )
+            delete_hijack_bgp_updates(self.wo_db, [raw["key"]])
 
         except Exception:
             log.exception("{}".format(raw))
@@ -2004,6 +2253,18 @@ class DatabaseDataWorker(ConsumerProducerMixin):
         except Exception:
             log.exception("{}".format(raw))
 
+    def on_iteration(self):
+        """
+        Hand over buffered entries to the bulk updater when traffic is low
+        """
+        self.bulk_pipeline.flush_if_stale()
+        self.deduplicator.flush()
+
+    def on_consume_end(self, connection, channel):
+        self.bulk_pipeline.flush()
+        self.deduplicator.flush()
+        super().on_consume_end(connection, channel)
+
     def stop_consumer_loop(self, message: Dict) -> NoReturn:
         """
         Callback function that stop the current consumer loop
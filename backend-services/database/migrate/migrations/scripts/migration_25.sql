@@ -0,0 +1,40 @@
+CREATE TABLE IF NOT EXISTS hijack_bgp_updates (
+    hijack_key VARCHAR ( 32 ) NOT NULL,
+    update_key VARCHAR ( 32 ) NOT NULL,
+    timestamp TIMESTAMP NOT NULL,
+    PRIMARY KEY(timestamp, hijack_key, update_key)
+);
+
+CREATE INDEX IF NOT EXISTS hijack_bgp_updates_hijack_idx
+ON hijack_bgp_updates(hijack_key, timestamp DESC);
+
+CREATE INDEX IF NOT EXISTS hijack_bgp_updates_update_idx
+ON hijack_bgp_updates(update_key, timestamp DESC);
+
+SELECT create_hypertable('hijack_bgp_updates', 'timestamp', if_not_exists => TRUE);
+
+INSERT INTO hijack_bgp_updates (hijack_key, update_key, timestamp)
+SELECT DISTINCT unnest(hijack_key), key, timestamp
+FROM bgp_updates
+WHERE hijack_key<>ARRAY[]::text[]
+ON CONFLICT DO NOTHING;
+
+CREATE OR REPLACE FUNCTION search_bgpupdates_by_hijack_key(key text)
+RETURNS SETOF view_bgpupdates AS $$
+    SELECT b.prefix, b.origin_as, b.peer_asn, b.as_path, b.service, b.type, b.communities,
+        b.timestamp, b.hijack_key, b.handled, b.matched_prefix, b.orig_path
+    FROM hijack_bgp_updates AS hb
+    JOIN bgp_updates AS b ON (b.timestamp = hb.timestamp AND b.key = hb.update_key)
+    WHERE
+        hb.hijack_key = $1
+$$ LANGUAGE sql STABLE;
+
+CREATE OR REPLACE FUNCTION search_bgpupdates_by_as_path_and_hijack_key(key text, as_paths BIGINT[])
+    RETURNS SETOF view_bgpupdates AS $$
+    SELECT b.prefix, b.origin_as, b.peer_asn, b.as_path, b.service, b.type, b.communities,
+        b.timestamp, b.hijack_key, b.handled, b.matched_prefix, b.orig_path
+    FROM hijack_bgp_updates AS hb
+    JOIN bgp_updates AS b ON (b.timestamp = hb.timestamp AND b.key = hb.update_key)
+    WHERE
+        hb.hijack_key = $1 and $2 <@ b.as_path
+$$ LANGUAGE sql STABLE;
@@ -4,21 +4,26 @@ import multiprocessing as mp
 import re
 import time
 from datetime import datetime
-from typing import Callable
 from typing import Dict
 from typing import List
 from typing import NoReturn
+from typing import Set
 from typing import Tuple
 
 import redis
+import requests
 import ujson as json
-from artemis_utils import exception_handler
+from artemis_utils import ArtemisError
+from artemis_utils import get_config_version
 from artemis_utils import get_hash
 from artemis_utils import get_ip_version
 from artemis_utils import get_logger
 from artemis_utils.constants import DATABASE_HOST
 from artemis_utils.constants import NOTIFIER_HOST
 from artemis_utils.constants import PREFIXTREE_HOST
+from artemis_utils.envvars import BULK_TIMER
+from artemis_utils.envvars import DETECTION_BATCH_SIZE
+from artemis_utils.envvars import DETECTION_PARTITIONED
 from artemis_utils.envvars import RABBITMQ_URI
 from artemis_utils.envvars import REDIS_HOST
 from artemis_utils.envvars import REDIS_PORT
@@ -27,12 +32,20 @@ from artemis_utils.envvars import RPKI_VALIDATOR_ENABLED
 from artemis_utils.envvars import RPKI_VALIDATOR_HOST
 from artemis_utils.envvars import RPKI_VALIDATOR_PORT
 from artemis_utils.envvars import TEST_ENV
+from artemis_utils.rabbitmq import accepted_wire_formats
 from artemis_utils.rabbitmq import create_exchange
 from artemis_utils.rabbitmq import create_queue
+from artemis_utils.rabbitmq import unpack_update_envelope
+from artemis_utils.rabbitmq import UpdateBatchPublisher
+from artemis_utils.rabbitmq import wire_format
+from artemis_utils.redis import MERGE_HIJACK_SCRIPT
 from artemis_utils.redis import ping_redis
 from artemis_utils.redis import purge_redis_eph_pers_keys
 from artemis_utils.redis import redis_key
+from artemis_utils.rest import BlockingRequestHandler
+from artemis_utils.rest import RestMetricsHandler
 from artemis_utils.rpki import get_rpki_val_result
+from artemis_utils.service import ProcessLauncher
 from artemis_utils.service import wait_data_worker_dependencies
 from artemis_utils.updates import clean_as_path
 from artemis_utils.updates import key_generator
@@ -53,31 +66,125 @@ shared_memory_locks = {"data_worker": mp.Lock()}
 
 # global vars
 SERVICE_NAME = "detection"
-HIJACK_DIM_COMBINATIONS = [
-    ["S", "0", "-", "-"],
-    ["S", "0", "-", "L"],
-    ["S", "1", "-", "-"],
-    ["S", "1", "-", "L"],
-    ["S", "P", "-", "-"],
-    ["S", "-", "-", "-"],
-    ["S", "-", "-", "L"],
-    ["E", "0", "-", "-"],
-    ["E", "0", "-", "L"],
-    ["E", "1", "-", "-"],
-    ["E", "1", "-", "L"],
-    ["E", "P", "-", "-"],
-    ["E", "-", "-", "L"],
-    ["Q", "0", "-", "-"],
-    ["Q", "0", "-", "L"],
-]
+HIJACK_DIM_COMBINATIONS = frozenset(
+    {
+        ("S", "0", "-", "-"),
+        ("S", "0", "-", "L"),
+        ("S", "1", "-", "-"),
+        ("S", "1", "-", "L"),
+        ("S", "P", "-", "-"),
+        ("S", "-", "-", "-"),
+        ("S", "-", "-", "L"),
+        ("E", "0", "-", "-"),
+        ("E", "0", "-", "L"),
+        ("E", "1", "-", "-"),
+        ("E", "1", "-", "L"),
+        ("E", "P", "-", "-"),
+        ("E", "-", "-", "L"),
+        ("Q", "0", "-", "-"),
+        ("Q", "0", "-", "L"),
+    }
+)
 DATA_WORKER_DEPENDENCIES = [PREFIXTREE_HOST, DATABASE_HOST, NOTIFIER_HOST]
+# number of configuration versions whose nodes are cached locally
+CONFIG_NODES_CACHE_SIZE = 5
+# timeout (sec) of fetching the configuration nodes of a version from prefixtree
+CONFIG_NODES_REQUEST_TIMEOUT = 5
+# failed merges of a pending hijack into redis, before it is dropped
+PENDING_HIJACK_MAX_RETRIES = 3
+# interval (sec) before retrying a configuration version that could not be fetched
+CONFIG_NODES_RETRY_INTERVAL = 10
+# retries of an update whose configuration version cannot be resolved, before giving up
+DEFERRED_UPDATE_MAX_RETRIES = 30
+# errors of configuration versions that may still become resolvable
+UNRESOLVED_CONFIG_ERRORS = frozenset(
+    {"unknown-config-version", "unavailable-config-version"}
+)
+
+
+def get_prefix_length(prefix: str) -> int:
+    """
+    Returns the length of a prefix (without parsing the whole network).
+    """
+    if "/" in prefix:
+        return int(prefix.rsplit("/", 1)[1])
+    if get_ip_version(prefix) == "v6":
+        return 128
+    return 32
 
 
-class ConfigHandler(RequestHandler):
+def detect_prepend_hijack(orig_path: List[int], prepend_seqs: List) -> Tuple[int, str]:
+    """
+    Type-P hijack detection.
+    In case there is a type-P hijack (i.e. no pattern matches
+    an incoming BGP update), it returns a tuple with the
+    potential hijacker AS plus the hijack type (P).
+    The potential hijacker is the first AS that differs in the
+    most specific (best matching) pattern, starting from the origin
+    AS.
+    """
+    # no hijack if no configured pattern is provided
+    if not orig_path or len(prepend_seqs) == 0:
+        return -1, "-"
+    best_match_length = 0
+    for conf_seq in prepend_seqs:
+        if len(orig_path) >= len(conf_seq) + 1:
+            # isolate the monitor event pattern that
+            # should be matched to the configured pattern
+            # (excluding the origin which is the very first hop
+            # of the incoming AS-path)
+            monitor_event_seq = orig_path[len(orig_path) - len(conf_seq) - 1 : -1]
+            if monitor_event_seq == conf_seq:
+                # patterns match (no hijack of type P)
+                return -1, "-"
+            # after reversing the pattern sequences (i.e., start with origin),
+            # find the greatest length of consecutive matches
+            this_best_match_length = 0
+            for observed_as, conf_as in zip(
+                reversed(monitor_event_seq), reversed(conf_seq)
+            ):
+                if observed_as != conf_as:
+                    # first difference, break here and register the length
+                    break
+                this_best_match_length += 1
+            # update the best matching length for all patterns found till now
+            best_match_length = max(best_match_length, this_best_match_length)
+    # the hijacker is the first AS that breaks the most specific (best matching) pattern
+    return orig_path[len(orig_path) - best_match_length - 2], "P"
+
+
+class RuleMatcher:
+    """
+    Immutable matcher compiled from a configuration node (rule conf), so that
+    detection checks do not scan the (possibly huge) ASN lists of the conf.
+    """
+
+    def __init__(self, conf: Dict) -> NoReturn:
+        self.conf = conf
+        # no origins (not even wildcards) means squatting
+        self.has_origins = bool(conf["origin_asns"])
+        self.any_origin = conf["origin_asns"] == [-1]
+        self.origin_asns = frozenset(conf["origin_asns"])
+        # [] or [-1] neighbors means "allow everything"
+        self.any_neighbor = not conf["neighbors"] or conf["neighbors"] == [-1]
+        self.neighbors = frozenset(conf["neighbors"])
+        self.prepend_seqs = tuple(list(seq) for seq in conf["prepend_seq"])
+        self.no_export = "no-export" in conf["policies"]
+
+    def origin_allowed(self, origin_asn: int) -> bool:
+        return self.any_origin or origin_asn in self.origin_asns
+
+    def neighbor_allowed(self, neighbor_asn: int) -> bool:
+        return self.any_neighbor or neighbor_asn in self.neighbors
+
+
+class ConfigHandler(BlockingRequestHandler):
     """
     REST request handler for configuration.
     """
 
+    max_concurrency = 1
+
     def initialize(self, shared_memory_manager_dict):
         self.shared_memory_manager_dict = shared_memory_manager_dict
 
@@ -136,8 +243,9 @@ class ControlHandler(RequestHandler):
     REST request handler for control commands.
     """
 
-    def initialize(self, shared_memory_manager_dict):
+    def initialize(self, shared_memory_manager_dict, data_worker_launcher):
         self.shared_memory_manager_dict = shared_memory_manager_dict
+        self.data_worker_launcher = data_worker_launcher
 
     def start_data_worker(self):
         shared_memory_locks["data_worker"].acquire()
@@ -146,17 +254,18 @@ class ControlHandler(RequestHandler):
             shared_memory_locks["data_worker"].release()
             return "already running"
         shared_memory_locks["data_worker"].release()
-        mp.Process(target=self.run_data_worker_process).start()
+        self.data_worker_launcher.launch()
         return "instructed to start"
 
-    def run_data_worker_process(self):
+    @staticmethod
+    def run_data_worker_process(shared_memory_manager_dict):
         try:
             with Connection(RABBITMQ_URI) as connection:
                 shared_memory_locks["data_worker"].acquire()
                 data_worker = DetectionDataWorker(
-                    connection, self.shared_memory_manager_dict
+                    connection, shared_memory_manager_dict
                 )
-                self.shared_memory_manager_dict["data_worker_running"] = True
+                shared_memory_manager_dict["data_worker_running"] = True
                 shared_memory_locks["data_worker"].release()
                 log.info("data worker started")
                 data_worker.run()
@@ -164,7 +273,7 @@ class ControlHandler(RequestHandler):
             log.exception("exception")
         finally:
             shared_memory_locks["data_worker"].acquire()
-            self.shared_memory_manager_dict["data_worker_running"] = False
+            shared_memory_manager_dict["data_worker_running"] = False
             shared_memory_locks["data_worker"].release()
             log.info("data worker stopped")
 
@@ -226,6 +335,11 @@ class Detection:
         self.shared_memory_manager_dict["data_worker_running"] = False
         self.shared_memory_manager_dict["service_reconfiguring"] = False
 
+        # data workers are started via a helper process (see ProcessLauncher)
+        self.data_worker_launcher = ProcessLauncher(
+            ControlHandler.run_data_worker_process, self.shared_memory_manager_dict
+        )
+
         log.info("service initiated")
 
     def make_rest_app(self):
@@ -239,17 +353,23 @@ class Detection:
                 (
                     "/control",
                     ControlHandler,
-                    dict(shared_memory_manager_dict=self.shared_memory_manager_dict),
+                    dict(
+                        shared_memory_manager_dict=self.shared_memory_manager_dict,
+                        data_worker_launcher=self.data_worker_launcher,
+                    ),
                 ),
                 (
                     "/health",
                     HealthHandler,
                     dict(shared_memory_manager_dict=self.shared_memory_manager_dict),
                 ),
+                ("/metrics", RestMetricsHandler),
             ]
         )
 
     def start_rest_app(self):
+        # fork the data worker launcher before any REST thread exists
+        self.data_worker_launcher.start()
         app = self.make_rest_app()
         app.listen(REST_PORT)
         log.info("REST worker started and listening to port {}".format(REST_PORT))
@@ -267,6 +387,19 @@ class DetectionDataWorker(ConsumerProducerMixin):
         self.connection = connection
         self.shared_memory_manager_dict = shared_memory_manager_dict
         self.rtrmanager = None
+        # configuration nodes (confs) per configuration version, as fetched from prefixtree
+        self.config_nodes = {}
+        # configuration versions that could not be fetched -> (error, retry time)
+        self.config_nodes_failures = {}
+        # updates waiting for their configuration version, per number of retries
+        self.deferred_updates = {}
+        self.deferred_updates_time = time.time()
+        # stored bgp updates waiting for batch detection
+        self.update_batch = []
+        self.update_batch_time = time.time()
+        # hijack updates aggregated in local memory, per redis hijack key
+        self.pending_hijacks = {}
+        self.pending_hijacks_time = time.time()
 
         # wait for other needed data workers to start
         wait_data_worker_dependencies(DATA_WORKER_DEPENDENCIES)
@@ -286,14 +419,31 @@ class DetectionDataWorker(ConsumerProducerMixin):
             "hijack-notification", connection, declare=True
         )
         self.command_exchange = create_exchange("command", connection, declare=True)
+        self.detection_hashing = create_exchange(
+            "detection-hashing", connection, "x-consistent-hash", declare=True
+        )
+
+        # (optionally) batched publishing of bgp updates
+        self.update_publisher = UpdateBatchPublisher()
 
         # QUEUES
-        self.update_queue = create_queue(
-            SERVICE_NAME,
-            exchange=self.update_exchange,
-            routing_key="stored-update-with-prefix-node",
-            priority=1,
-        )
+        if DETECTION_PARTITIONED == "true":
+            # updates (and ongoing hijack updates) are partitioned among detection
+            # instances by consistent hash of their matched configured prefix
+            self.update_queue = create_queue(
+                SERVICE_NAME,
+                exchange=self.detection_hashing,
+                routing_key="1",
+                priority=1,
+                random=True,
+            )
+        else:
+            self.update_queue = create_queue(
+                SERVICE_NAME,
+                exchange=self.update_exchange,
+                routing_key="stored-update-with-prefix-node",
+                priority=1,
+            )
         self.hijack_ongoing_queue = create_queue(
             SERVICE_NAME,
             exchange=self.hijack_exchange,
@@ -313,6 +463,7 @@ class DetectionDataWorker(ConsumerProducerMixin):
 
         self.redis = redis.Redis(host=REDIS_HOST, port=REDIS_PORT)
         ping_redis(self.redis)
+        self.redis_merge_hijack = self.redis.register_script(MERGE_HIJACK_SCRIPT)
 
         if RPKI_VALIDATOR_ENABLED == "true":
             from rtrlib import RTRManager
@@ -344,9 +495,11 @@ class DetectionDataWorker(ConsumerProducerMixin):
         return [
             Consumer(
                 queues=[self.update_queue],
-                on_message=self.handle_bgp_update,
-                prefetch_count=100,
-                accept=["ujson"],
+                on_message=self.handle_partitioned_updates
+                if DETECTION_PARTITIONED == "true"
+                else self.buffer_bgp_update,
+                prefetch_count=max(100, DETECTION_BATCH_SIZE),
+                accept=accepted_wire_formats(self.update_queue.exchange),
             ),
             Consumer(
                 queues=[self.hijack_ongoing_queue],
@@ -371,31 +524,250 @@ class DetectionDataWorker(ConsumerProducerMixin):
             serializer="ujson",
         )
 
+    def get_config_nodes(self, config_timestamp: float) -> Dict[str, RuleMatcher]:
+        """
+        Returns the compiled configuration nodes (confs) of a configuration version,
+        keyed by their conf ID, fetching (and compiling) them only the first time this version is seen.
+        """
+        config_version = get_config_version(config_timestamp)
+        if config_version not in self.config_nodes:
+            # do not block on prefixtree again before the retry interval passes
+            if config_version in self.config_nodes_failures:
+                error, retry_time = self.config_nodes_failures[config_version]
+                if time.time() < retry_time:
+                    raise ArtemisError(error, config_version)
+                del self.config_nodes_failures[config_version]
+            error = None
+            try:
+                r = requests.get(
+                    "http://{}:{}/configNodes".format(PREFIXTREE_HOST, REST_PORT),
+                    params={"timestamp": config_version},
+                    timeout=CONFIG_NODES_REQUEST_TIMEOUT,
+                )
+                response = r.json()
+            except (requests.exceptions.RequestException, ValueError):
+                error = "unavailable-config-version"
+            else:
+                if not response["success"]:
+                    error = "unknown-config-version"
+            if error:
+                self.config_nodes_failures[config_version] = (
+                    error,
+                    time.time() + CONFIG_NODES_RETRY_INTERVAL,
+                )
+                raise ArtemisError(error, config_version)
+            for old_config_version in sorted(self.config_nodes, key=float)[
+                : -CONFIG_NODES_CACHE_SIZE + 1
+            ]:
+                del self.config_nodes[old_config_version]
+            self.config_nodes[config_version] = {
+                conf["conf_id"]: RuleMatcher(conf) for conf in response["confs"]
+            }
+        return self.config_nodes[config_version]
+
+    def resolve_prefix_node(self, prefix_node: Dict) -> Dict:
+        """
+        Resolves a (compact) prefix node reference, i.e., prefix, conf IDs and
+        configuration timestamp, to the full prefix node with its confs and
+        their compiled matchers.
+        """
+        if "data" in prefix_node:
+            # confs embedded in the node itself
+            matchers = [RuleMatcher(conf) for conf in prefix_node["data"]["confs"]]
+        else:
+            config_nodes = self.get_config_nodes(prefix_node["timestamp"])
+            matchers = [config_nodes[conf_id] for conf_id in prefix_node["conf_ids"]]
+        return {
+            "prefix": prefix_node["prefix"],
+            "data": {"confs": [matcher.conf for matcher in matchers]},
+            "matchers": matchers,
+            "timestamp": prefix_node["timestamp"],
+        }
+
+    def resolve_monitor_event_prefix_node(self, monitor_event: Dict) -> NoReturn:
+        """
+        Replaces the prefix node reference of a monitor event with the full prefix node
+        (in-place); the event is treated as unconfigured if this is not possible.
+        Raises the ArtemisError if its configuration version is not (yet) resolvable,
+        so that the event is retried instead.
+        """
+        if "prefix_node" not in monitor_event:
+            return
+        try:
+            monitor_event["prefix_node"] = self.resolve_prefix_node(
+                monitor_event["prefix_node"]
+            )
+        except ArtemisError as e:
+            if e.type in UNRESOLVED_CONFIG_ERRORS:
+                raise
+            log.exception("could not resolve configuration node")
+            del monitor_event["prefix_node"]
+        except Exception:
+            log.exception("could not resolve configuration node")
+            del monitor_event["prefix_node"]
+
+    def defer_bgp_update(self, monitor_event: Dict, retries: int) -> NoReturn:
+        """
+        Keeps a monitor event whose configuration version could not be resolved,
+        to retry its detection after CONFIG_NODES_RETRY_INTERVAL seconds.
+        """
+        if retries >= DEFERRED_UPDATE_MAX_RETRIES:
+            log.error(
+                "giving up on BGP update with unresolvable configuration '{}'".format(
+                    monitor_event
+                )
+            )
+            return
+        if not self.deferred_updates:
+            self.deferred_updates_time = time.time()
+        self.deferred_updates.setdefault(retries, []).append(monitor_event)
+
+    def retry_deferred_updates(self) -> NoReturn:
+        """
+        Runs detection again on the deferred monitor events.
+        """
+        deferred_updates = self.deferred_updates
+        self.deferred_updates = {}
+        for retries, monitor_events in deferred_updates.items():
+            self.handle_bgp_update_batch(monitor_events, retries=retries + 1)
+
     def handle_ongoing_hijacks(self, message: Dict) -> NoReturn:
         """
         Handles ongoing hijacks from the database.
         """
         log.debug("{} ongoing hijack events".format(len(message.payload)))
         message.ack()
-        for update in message.payload:
-            self.handle_bgp_update(update)
+        self.handle_bgp_update_batch(message.payload)
+
+    def handle_partitioned_updates(self, message: Dict) -> NoReturn:
+        """
+        Callback function for the updates of this detection partition: either
+        (stored, possibly batched) bgp updates or ongoing hijack updates (lists).
+        """
+        if isinstance(message.payload, list):
+            self.handle_ongoing_hijacks(message)
+        else:
+            self.buffer_bgp_update(message)
+
+    def buffer_bgp_update(self, message: Dict) -> NoReturn:
+        """
+        Callback function that buffers (stored) bgp updates, so that they are
+        detected in batches of DETECTION_BATCH_SIZE (or after BULK_TIMER seconds).
+        """
+        # a single ack covers all the updates of a batched envelope
+        message.ack()
+        try:
+            for bgp_update in unpack_update_envelope(message.payload):
+                self.update_batch.append(self.unpack_stored_bgp_update(bgp_update))
+        except Exception:
+            log.exception("exception")
+        if len(self.update_batch) >= DETECTION_BATCH_SIZE:
+            self.flush_bgp_update_batch()
+
+    def flush_bgp_update_batch(self) -> NoReturn:
+        """
+        Runs detection on the currently buffered bgp updates.
+        """
+        update_batch = self.update_batch
+        self.update_batch = []
+        self.update_batch_time = time.time()
+        if update_batch:
+            self.handle_bgp_update_batch(update_batch)
+
+    def on_iteration(self):
+        try:
+            self.update_publisher.flush(self.producer, expired_only=True)
+            if self.update_batch and time.time() - self.update_batch_time >= BULK_TIMER:
+                self.flush_bgp_update_batch()
+            if (
+                self.pending_hijacks
+                and time.time() - self.pending_hijacks_time >= BULK_TIMER
+            ):
+                self.flush_pending_hijacks()
+            if (
+                self.deferred_updates
+                and time.time() - self.deferred_updates_time
+                >= CONFIG_NODES_RETRY_INTERVAL
+            ):
+                self.retry_deferred_updates()
+        except Exception:
+            log.exception("exception")
+
+    def on_consume_end(self, connection, channel):
+        try:
+            self.flush_bgp_update_batch()
+            self.flush_pending_hijacks()
+            self.update_publisher.flush(self.producer)
+            if self.deferred_updates:
+                log.warning(
+                    "{} BGP updates with unresolvable configuration left unhandled".format(
+                        sum(map(len, self.deferred_updates.values()))
+                    )
+                )
+        except Exception:
+            log.exception("exception")
+        super().on_consume_end(connection, channel)
+
+    @staticmethod
+    def unpack_stored_bgp_update(monitor_event: Dict) -> Dict:
+        """
+        Converts a bgp update as stored in the database to a monitor event.
+        """
+        monitor_event["path"] = monitor_event["as_path"]
+        monitor_event["timestamp"] = datetime(
+            *map(int, re.findall(r"\d+", monitor_event["timestamp"]))
+        ).timestamp()
+        return monitor_event
 
     def handle_bgp_update(self, message: Dict) -> NoReturn:
         """
-        Callback function that runs the main logic of
-        detecting hijacks for every bgp update.
+        Runs the main logic of detecting hijacks for a single bgp update
+        (either a monitor event or a message carrying a stored bgp update).
         """
         if isinstance(message, dict):
             monitor_event = message
         else:
             message.ack()
-            monitor_event = message.payload
-            monitor_event["path"] = monitor_event["as_path"]
-            monitor_event["timestamp"] = datetime(
-                *map(int, re.findall(r"\d+", monitor_event["timestamp"]))
-            ).timestamp()
+            monitor_event = self.unpack_stored_bgp_update(message.payload)
+        self.handle_bgp_update_batch([monitor_event])
 
-        raw = monitor_event.copy()
+    def handle_bgp_update_batch(
+        self, monitor_events: List[Dict], retries: int = 0
+    ) -> NoReturn:
+        """
+        Runs the main logic of detecting hijacks for a batch of bgp updates;
+        the follow-up operations of benign updates (implicit withdrawals,
+        handled marks) are issued in bulk for the whole batch.
+        Updates whose configuration version cannot be resolved yet are deferred.
+        """
+        benign_monitor_events = []
+        for monitor_event in monitor_events:
+            raw = monitor_event.copy()
+            try:
+                if self.detect_bgp_update(monitor_event):
+                    benign_monitor_events.append((monitor_event, raw))
+            except ArtemisError as e:
+                if e.type in UNRESOLVED_CONFIG_ERRORS:
+                    self.defer_bgp_update(raw, retries)
+                else:
+                    log.exception("exception")
+            except Exception:
+                log.exception("exception")
+
+        if benign_monitor_events:
+            self.gen_implicit_withdrawals(
+                [monitor_event for monitor_event, _ in benign_monitor_events]
+            )
+            self.mark_handled_batch([raw for _, raw in benign_monitor_events])
+
+    def detect_bgp_update(self, monitor_event: Dict) -> bool:
+        """
+        Detects (and commits) a hijack for a single monitor event and handles
+        outdated hijacks and withdrawals.
+        :return: True if the event is a benign announcement whose handling
+        (implicit withdrawal check, handled mark) is left to the caller
+        """
+        self.resolve_monitor_event_prefix_node(monitor_event)
 
         # mark the initial redis hijack key since it may change upon
         # outdated checks
@@ -406,176 +778,9 @@ class DetectionDataWorker(ConsumerProducerMixin):
                 monitor_event["hij_type"],
             )
 
-        is_hijack = False
-
-        if monitor_event["type"] == "A":
-            # save the original path as-is to preserve patterns (if needed)
-            monitor_event["orig_path"] = monitor_event["path"][::]
-            monitor_event["path"] = clean_as_path(monitor_event["path"])
-
-            if "prefix_node" in monitor_event:
-                prefix_node = monitor_event["prefix_node"]
-                monitor_event["matched_prefix"] = prefix_node["prefix"]
-
-                final_hij_dimensions = [
-                    "-",
-                    "-",
-                    "-",
-                    "-",
-                ]  # prefix, path, dplane, policy
-                for prefix_node_conf in prefix_node["data"]["confs"]:
-                    try:
-                        path_hijacker = -1
-                        pol_hijacker = -1
-                        hij_dimensions = [
-                            "-",
-                            "-",
-                            "-",
-                            "-",
-                        ]  # prefix, path, dplane, policy
-                        hij_dimension_index = 0
-                        for func_dim in self.__hijack_dimension_checker_gen():
-                            if hij_dimension_index == 0:
-                                # prefix dimension
-                                for func_pref in func_dim():
-                                    hij_dimensions[hij_dimension_index] = func_pref(
-                                        monitor_event, prefix_node, prefix_node_conf
-                                    )
-                                    if hij_dimensions[hij_dimension_index] != "-":
-                                        break
-                            elif hij_dimension_index == 1:
-                                # path type dimension
-                                for func_path in func_dim(len(monitor_event["path"])):
-                                    (
-                                        path_hijacker,
-                                        hij_dimensions[hij_dimension_index],
-                                    ) = func_path(
-                                        monitor_event, prefix_node, prefix_node_conf
-                                    )
-                                    if hij_dimensions[hij_dimension_index] != "-":
-                                        break
-                            elif hij_dimension_index == 2:
-                                # data plane dimension
-                                for func_dplane in func_dim():
-                                    hij_dimensions[hij_dimension_index] = func_dplane(
-                                        monitor_event, prefix_node, prefix_node_conf
-                                    )
-                                    if hij_dimensions[hij_dimension_index] != "-":
-                                        break
-                            elif hij_dimension_index == 3:
-                                # policy dimension
-                                for func_pol in func_dim(len(monitor_event["path"])):
-                                    (
-                                        pol_hijacker,
-                                        hij_dimensions[hij_dimension_index],
-                                    ) = func_pol(
-                                        monitor_event, prefix_node, prefix_node_conf
-                                    )
-                                    if hij_dimensions[hij_dimension_index] != "-":
-                                        break
-                            hij_dimension_index += 1
-                        # check if dimension combination in hijack combinations for this rule,
-                        # but do not commit hijack yet (record the last possible hijack issue)
-                        if hij_dimensions in HIJACK_DIM_COMBINATIONS:
-                            final_hij_dimensions = hij_dimensions[::]
-                            is_hijack = True
-                            # show pol hijacker only if the path hijacker is uncertain
-                            hijacker = path_hijacker
-                            if path_hijacker == -1 and pol_hijacker != -1:
-                                hijacker = pol_hijacker
-                        # benign rule matching beats hijack detection
-                        else:
-                            is_hijack = False
-                            break
-                    except Exception:
-                        log.exception("exception")
-                if is_hijack:
-                    try:
-                        hij_dimensions = final_hij_dimensions
-                        self.commit_hijack(monitor_event, hijacker, hij_dimensions)
-                    except Exception:
-                        log.exception("exception")
-            else:
-                if "hij_key" not in monitor_event:
-                    log.error(
-                        "unconfigured BGP update received '{}'".format(monitor_event)
-                    )
-                else:
-                    is_hijack = False
-
-            outdated_hijack = None
-            if not is_hijack and "hij_key" in monitor_event:
-                try:
-                    # outdated hijack, benign from now on
-                    redis_hijack_key = redis_key(
-                        monitor_event["prefix"],
-                        monitor_event["hijack_as"],
-                        monitor_event["hij_type"],
-                    )
-                    outdated_hijack = self.redis.get(redis_hijack_key)
-                    purge_redis_eph_pers_keys(
-                        self.redis, redis_hijack_key, monitor_event["hij_key"]
-                    )
-                    # mark in DB only if it is the first time this hijack was purged (pre-existent in redis)
-                    if outdated_hijack:
-                        self.mark_outdated(monitor_event["hij_key"], redis_hijack_key)
-                except Exception:
-                    log.exception("exception")
-            elif (
-                is_hijack
-                and "hij_key" in monitor_event
-                and monitor_event["initial_redis_hijack_key"]
-                != monitor_event["final_redis_hijack_key"]
-            ):
-                try:
-                    outdated_hijack = self.redis.get(
-                        monitor_event["initial_redis_hijack_key"]
-                    )
-                    # outdated hijack, but still a hijack; need key change
-                    purge_redis_eph_pers_keys(
-                        self.redis,
-                        monitor_event["initial_redis_hijack_key"],
-                        monitor_event["hij_key"],
-                    )
-                    # mark in DB only if it is the first time this hijack was purged (pre-existsent in redis)
-                    if outdated_hijack:
-                        self.mark_outdated(
-                            monitor_event["hij_key"],
-                            monitor_event["initial_redis_hijack_key"],
-                        )
-                except Exception:
-                    log.exception("exception")
-            elif not is_hijack:
-                self.gen_implicit_withdrawal(monitor_event)
-                self.mark_handled(raw)
-
-            if outdated_hijack:
-                try:
-                    outdated_hijack = classic_json.loads(
-                        outdated_hijack.decode("utf-8")
-                    )
-                    outdated_hijack["end_tag"] = "outdated"
-                    self.producer.publish(
-                        outdated_hijack,
-                        exchange=self.hijack_notification_exchange,
-                        routing_key="mail-log",
-                        retry=False,
-                        priority=1,
-                        serializer="ujson",
-                    )
-                    self.producer.publish(
-                        outdated_hijack,
-                        exchange=self.hijack_notification_exchange,
-                        routing_key="hij-log",
-                        retry=False,
-                        priority=1,
-                        serializer="ujson",
-                    )
-                except Exception:
-                    log.exception("exception")
-
-        elif monitor_event["type"] == "W":
-            self.producer.publish(
+        if monitor_event["type"] == "W":
+            self.update_publisher.publish(
+                self.producer,
                 {
                     "prefix": monitor_event["prefix"],
                     "peer_asn": monitor_event["peer_asn"],
@@ -585,287 +790,182 @@ class DetectionDataWorker(ConsumerProducerMixin):
                 exchange=self.update_exchange,
                 routing_key="withdraw",
                 priority=0,
-                serializer="ujson",
+                serializer=wire_format(self.update_exchange),
             )
+            return False
+        if monitor_event["type"] != "A":
+            return False
 
-    def __hijack_dimension_checker_gen(self) -> Callable:
-        """
-        Generator that returns hijack dimension checking functions.
-        """
-        yield self.__hijack_prefix_checker_gen
-        yield self.__hijack_path_checker_gen
-        yield self.__hijack_dplane_checker_gen
-        yield self.__hijack_pol_checker_gen
+        # save the original path as-is to preserve patterns (if needed)
+        monitor_event["orig_path"] = monitor_event["path"][::]
+        monitor_event["path"] = clean_as_path(monitor_event["path"])
 
-    def __hijack_prefix_checker_gen(self) -> Callable:
-        """
-        Generator that returns prefix dimension detection functions.
-        """
-        yield self.detect_prefix_squatting_hijack
-        yield self.detect_prefix_subprefix_hijack
+        is_hijack = False
+        if "prefix_node" in monitor_event:
+            prefix_node = monitor_event["prefix_node"]
+            monitor_event["matched_prefix"] = prefix_node["prefix"]
+            is_hijack, hijacker, hij_dimensions = self.detect_hijack_dimensions(
+                monitor_event, prefix_node
+            )
+            if is_hijack:
+                try:
+                    self.commit_hijack(monitor_event, hijacker, hij_dimensions)
+                except Exception:
+                    log.exception("exception")
+        elif "hij_key" not in monitor_event:
+            log.error("unconfigured BGP update received '{}'".format(monitor_event))
 
-    def __hijack_path_checker_gen(self, path_len: int) -> Callable:
-        """
-        Generator that returns path dimension detection functions.
-        """
-        if path_len > 0:
-            yield self.detect_path_type_0_hijack
-            if path_len > 1:
-                yield self.detect_path_type_1_hijack
-                yield self.detect_path_type_P_hijack
-                if path_len > 2:
-                    yield self.detect_path_type_N_hijack
-        yield self.detect_path_type_U_hijack
-
-    def __hijack_dplane_checker_gen(self) -> Callable:
-        """
-        Generator that returns data plane dimension detection functions.
-        """
-        yield self.detect_dplane_blackholing_hijack
-        yield self.detect_dplane_imposture_hijack
-        yield self.detect_dplane_mitm_hijack
+        outdated_hijack = None
+        if not is_hijack and "hij_key" in monitor_event:
+            try:
+                # outdated hijack, benign from now on
+                redis_hijack_key = redis_key(
+                    monitor_event["prefix"],
+                    monitor_event["hijack_as"],
+                    monitor_event["hij_type"],
+                )
+                self.pending_hijacks.pop(redis_hijack_key, None)
+                outdated_hijack = self.redis.get(redis_hijack_key)
+                purge_redis_eph_pers_keys(
+                    self.redis, redis_hijack_key, monitor_event["hij_key"]
+                )
+                # mark in DB only if it is the first time this hijack was purged (pre-existent in redis)
+                if outdated_hijack:
+                    self.mark_outdated(monitor_event["hij_key"], redis_hijack_key)
+            except Exception:
+                log.exception("exception")
+        elif (
+            is_hijack
+            and "hij_key" in monitor_event
+            and monitor_event["initial_redis_hijack_key"]
+            != monitor_event["final_redis_hijack_key"]
+        ):
+            try:
+                self.pending_hijacks.pop(
+                    monitor_event["initial_redis_hijack_key"], None
+                )
+                outdated_hijack = self.redis.get(
+                    monitor_event["initial_redis_hijack_key"]
+                )
+                # outdated hijack, but still a hijack; need key change
+                purge_redis_eph_pers_keys(
+                    self.redis,
+                    monitor_event["initial_redis_hijack_key"],
+                    monitor_event["hij_key"],
+                )
+                # mark in DB only if it is the first time this hijack was purged (pre-existsent in redis)
+                if outdated_hijack:
+                    self.mark_outdated(
+                        monitor_event["hij_key"],
+                        monitor_event["initial_redis_hijack_key"],
+                    )
+            except Exception:
+                log.exception("exception")
 
-    def __hijack_pol_checker_gen(self, path_len: int) -> Callable:
-        """
-        Generator that returns policy dimension detection functions.
-        """
-        if path_len > 3:
-            yield self.detect_pol_leak_hijack
-        yield self.detect_pol_other_hijack
+        if outdated_hijack:
+            self.publish_outdated_hijack(outdated_hijack)
 
-    @exception_handler(log)
-    def detect_prefix_squatting_hijack(
-        self,
-        monitor_event: Dict,
-        prefix_node: Dict,
-        prefix_node_conf: Dict,
-        *args,
-        **kwargs
-    ) -> str:
-        """
-        Squatting hijack detection.
-        """
-        # check if there are origin_asns defined (even wildcards)
-        if prefix_node_conf["origin_asns"]:
-            return "-"
-        return "Q"
+        return not is_hijack and "hij_key" not in monitor_event
 
-    @exception_handler(log)
-    def detect_prefix_subprefix_hijack(
-        self,
-        monitor_event: Dict,
-        prefix_node: Dict,
-        prefix_node_conf: Dict,
-        *args,
-        **kwargs
-    ) -> str:
+    def publish_outdated_hijack(self, outdated_hijack: bytes) -> NoReturn:
         """
-        Subprefix or exact prefix hijack detection.
+        Publishes an outdated hijack (as stored in redis) to the hijack logs.
         """
-        mon_prefix = ipaddress.ip_network(monitor_event["prefix"])
-        if ipaddress.ip_network(prefix_node["prefix"]).prefixlen < mon_prefix.prefixlen:
-            return "S"
-        return "E"
+        try:
+            outdated_hijack = classic_json.loads(outdated_hijack.decode("utf-8"))
+            outdated_hijack["end_tag"] = "outdated"
+            self.producer.publish(
+                outdated_hijack,
+                exchange=self.hijack_notification_exchange,
+                routing_key="mail-log",
+                retry=False,
+                priority=1,
+                serializer="ujson",
+            )
+            self.producer.publish(
+                outdated_hijack,
+                exchange=self.hijack_notification_exchange,
+                routing_key="hij-log",
+                retry=False,
+                priority=1,
+                serializer="ujson",
+            )
+        except Exception:
+            log.exception("exception")
 
-    @exception_handler(log)
-    def detect_path_type_0_hijack(
-        self,
-        monitor_event: Dict,
-        prefix_node: Dict,
-        prefix_node_conf: Dict,
-        *args,
-        **kwargs
-    ) -> Tuple[int, str]:
-        """
-        Origin hijack detection.
-        """
-        origin_asn = monitor_event["path"][-1]
-        if origin_asn in prefix_node_conf["origin_asns"] or prefix_node_conf[
-            "origin_asns"
-        ] == [-1]:
-            return -1, "-"
-        return origin_asn, "0"
-
-    @exception_handler(log)
-    def detect_path_type_1_hijack(
-        self,
-        monitor_event: Dict,
-        prefix_node: Dict,
-        prefix_node_conf: Dict,
-        *args,
-        **kwargs
-    ) -> Tuple[int, str]:
+    @staticmethod
+    def detect_hijack_dimensions(
+        monitor_event: Dict, prefix_node: Dict
+    ) -> Tuple[bool, int, List[str]]:
         """
-        Type-1 hijack detection.
+        Evaluates the hijack dimensions (prefix, path, dplane, policy) of a monitor event
+        against all the (compiled) confs of its prefix node; benign rule matching beats
+        hijack detection.
+        :return: (is_hijack, hijacker, hij_dimensions) of the last possible hijack issue
         """
-        origin_asn = monitor_event["path"][-1]
-        first_neighbor_asn = monitor_event["path"][-2]
-        # [] or [-1] neighbors means "allow everything"
-        if (
-            origin_asn in prefix_node_conf["origin_asns"]
-            or prefix_node_conf["origin_asns"] == [-1]
-        ) and (
-            (not prefix_node_conf["neighbors"])
-            or prefix_node_conf["neighbors"] == [-1]
-            or first_neighbor_asn in prefix_node_conf["neighbors"]
-        ):
-            return -1, "-"
-        return first_neighbor_asn, "1"
+        is_hijack = False
+        hijacker = -1
+        final_hij_dimensions = ["-", "-", "-", "-"]
+
+        # per-event values, shared by all the confs of the node
+        path = monitor_event["path"]
+        path_len = len(path)
+        orig_path = monitor_event.get("orig_path")
+        is_subprefix = get_prefix_length(prefix_node["prefix"]) < get_prefix_length(
+            monitor_event["prefix"]
+        )
+        prefix_dimension = "S" if is_subprefix else "E"
 
-    @exception_handler(log)
-    def detect_path_type_P_hijack(
-        self,
-        monitor_event: Dict,
-        prefix_node: Dict,
-        prefix_node_conf: Dict,
-        *args,
-        **kwargs
-    ) -> Tuple[int, str]:
-        """
-        Type-P hijack detection.
-        In case there is a type-P hijack (i.e. no pattern matches
-        an incoming BGP update), it returns a tuple with the
-        potential hijacker AS plus the hijack type (P).
-        The potential hijacker is the first AS that differs in the
-        most specific (best matching) pattern, starting from the origin
-        AS.
-        """
-        if "orig_path" not in monitor_event:
-            return -1, "-"
-        orig_path = monitor_event["orig_path"]
-        pattern_matched = False
-        pattern_hijacker = -1
-        best_match_length = 0
-        if len(prefix_node_conf["prepend_seq"]) > 0:
-            for conf_seq in prefix_node_conf["prepend_seq"]:
-                if len(orig_path) >= len(conf_seq) + 1:
-                    # isolate the monitor event pattern that
-                    # should be matched to the configured pattern
-                    # (excluding the origin which is the very first hop
-                    # of the incoming AS-path)
-                    monitor_event_seq = orig_path[
-                        len(orig_path) - len(conf_seq) - 1 : -1
-                    ]
-                    if monitor_event_seq == conf_seq:
-                        # patterns match, break (no hijack of type P)
-                        pattern_matched = True
-                        break
+        for matcher in prefix_node["matchers"]:
+            try:
+                # prefix dimension: squatting, subprefix or exact prefix
+                hij_dimensions = ["-", "-", "-", "-"]
+                if not matcher.has_origins:
+                    hij_dimensions[0] = "Q"
+                else:
+                    hij_dimensions[0] = prefix_dimension
+
+                # path dimension: type-0, type-1 or type-P
+                # (type-N and type-U detection is not supported)
+                path_hijacker = -1
+                origin_allowed = matcher.any_origin
+                if path_len > 0:
+                    origin_allowed = matcher.origin_allowed(path[-1])
+                    if not origin_allowed:
+                        path_hijacker, hij_dimensions[1] = path[-1], "0"
+                if path_len > 1 and hij_dimensions[1] == "-":
+                    if not (origin_allowed and matcher.neighbor_allowed(path[-2])):
+                        path_hijacker, hij_dimensions[1] = path[-2], "1"
                     else:
-                        # calculate the actual differences in the current pattern;
-                        # this creates a list of elements with values 0 on matched
-                        # elements and !0 otherwise
-                        pattern_diffs = [
-                            observed_as - conf_as
-                            for observed_as, conf_as in zip(monitor_event_seq, conf_seq)
-                        ]
-                        this_best_match_length = 0
-                        # after reversing the pattern difference sequence (i.e., start with
-                        # origin), find the greatest length of consecutive 0s (i.e., non-differences/matches)
-                        for diff in pattern_diffs[::-1]:
-                            if diff == 0:
-                                # match found, continue increasing the best match length
-                                this_best_match_length += 1
-                            else:
-                                # first difference, break here and register the length
-                                break
-                        # update the best matching length for all patterns found till now
-                        best_match_length = max(
-                            best_match_length, this_best_match_length
+                        path_hijacker, hij_dimensions[1] = detect_prepend_hijack(
+                            orig_path, matcher.prepend_seqs
                         )
-        # no hijack (either pattern matching achieved or no configured pattern provided)
-        if len(prefix_node_conf["prepend_seq"]) == 0 or pattern_matched:
-            return -1, "-"
-        # the hijacker is the first AS that breaks the most specific (best matching) pattern
-        pattern_hijacker = orig_path[len(orig_path) - best_match_length - 2]
-        return pattern_hijacker, "P"
-
-    @exception_handler(log)
-    def detect_path_type_N_hijack(
-        self,
-        monitor_event: Dict,
-        prefix_node: Dict,
-        prefix_node_conf: Dict,
-        *args,
-        **kwargs
-    ) -> Tuple[int, str]:
-        # Placeholder for type-N detection (not supported)
-        return -1, "-"
-
-    @exception_handler(log)
-    def detect_path_type_U_hijack(
-        self,
-        monitor_event: Dict,
-        prefix_node: Dict,
-        prefix_node_conf: Dict,
-        *args,
-        **kwargs
-    ) -> Tuple[int, str]:
-        # Placeholder for type-U detection (not supported)
-        return -1, "-"
-
-    @exception_handler(log)
-    def detect_dplane_blackholing_hijack(
-        self,
-        monitor_event: Dict,
-        prefix_node: Dict,
-        prefix_node_conf: Dict,
-        *args,
-        **kwargs
-    ) -> str:
-        # Placeholder for blackholing detection  (not supported)
-        return "-"
-
-    @exception_handler(log)
-    def detect_dplane_imposture_hijack(
-        self,
-        monitor_event: Dict,
-        prefix_node: Dict,
-        prefix_node_conf: Dict,
-        *args,
-        **kwargs
-    ) -> str:
-        # Placeholder for imposture detection  (not supported)
-        return "-"
-
-    @exception_handler(log)
-    def detect_dplane_mitm_hijack(
-        self,
-        monitor_event: Dict,
-        prefix_node: Dict,
-        prefix_node_conf: Dict,
-        *args,
-        **kwargs
-    ) -> str:
-        # Placeholder for mitm detection  (not supported)
-        return "-"
-
-    @exception_handler(log)
-    def detect_pol_leak_hijack(
-        self,
-        monitor_event: Dict,
-        prefix_node: Dict,
-        prefix_node_conf: Dict,
-        *args,
-        **kwargs
-    ) -> Tuple[int, str]:
-        """
-        Route leak hijack detection
-        """
-        if "no-export" in prefix_node_conf["policies"]:
-            return monitor_event["path"][-2], "L"
-        return -1, "-"
 
-    @exception_handler(log)
-    def detect_pol_other_hijack(
-        self,
-        monitor_event: Dict,
-        prefix_node: Dict,
-        prefix_node_conf: Dict,
-        *args,
-        **kwargs
-    ) -> Tuple[int, str]:
-        # Placeholder for policy violation detection (not supported)
-        return -1, "-"
+                # data plane dimension (blackholing, imposture and mitm detection
+                # is not supported)
+
+                # policy dimension: route leak
+                # (other policy violations are not supported)
+                pol_hijacker = -1
+                if path_len > 3 and matcher.no_export:
+                    pol_hijacker, hij_dimensions[3] = path[-2], "L"
+
+                # check if dimension combination in hijack combinations for this rule,
+                # but do not commit hijack yet (record the last possible hijack issue)
+                if tuple(hij_dimensions) in HIJACK_DIM_COMBINATIONS:
+                    final_hij_dimensions = hij_dimensions
+                    is_hijack = True
+                    # show pol hijacker only if the path hijacker is uncertain
+                    hijacker = path_hijacker
+                    if path_hijacker == -1 and pol_hijacker != -1:
+                        hijacker = pol_hijacker
+                # benign rule matching beats hijack detection
+                else:
+                    is_hijack = False
+                    break
+            except Exception:
+                log.exception("exception")
+        return is_hijack, hijacker, final_hij_dimensions
 
     def commit_hijack(
         self, monitor_event: Dict, hijacker: int, hij_dimensions: List[str]
@@ -948,74 +1048,139 @@ class DetectionDataWorker(ConsumerProducerMixin):
         elif len(monitor_event["path"]) > 2:
             hijack_value["asns_inf"] = set(monitor_event["path"][:-3])
 
-        # make the following operation atomic using blpop (blocking)
-        # first, make sure that the semaphore is initialized
-        if self.redis.getset("{}token_active".format(redis_hijack_key), 1) != b"1":
-            redis_pipeline = self.redis.pipeline()
-            redis_pipeline.lpush("{}token".format(redis_hijack_key), "token")
-            # lock, by extracting the token (other processes that access
-            # it at the same time will be blocked)
-            # attention: it is important that this command is batched in the
-            # pipeline since the db may async delete
-            # the token
-            redis_pipeline.blpop("{}token".format(redis_hijack_key))
-            redis_pipeline.execute()
-        else:
-            # lock, by extracting the token (other processes that access it
-            # at the same time will be blocked)
-            token = self.redis.blpop("{}token".format(redis_hijack_key), timeout=60)
-            # if timeout after 60 seconds, return without hijack alert
-            # since this means that sth has been purged in the meanwhile (e.g., due to outdated hijack
-            # in another instance; a detector cannot be stuck for a whole minute in a single hijack BGP update)
-            if not token:
-                log.info(
-                    "Monitor event {} encountered redis token timeout and will be cleared as benign for hijack {}".format(
-                        str(monitor_event), redis_hijack_key
-                    )
-                )
-                return
+        # the fields used only if the hijack is new
+        hijack_value["time_detected"] = time.time()
+        hijack_value["key"] = get_hash(
+            [
+                monitor_event["prefix"],
+                hijacker,
+                hij_type,
+                "{0:.6f}".format(hijack_value["time_detected"]),
+            ]
+        )
+        hijack_value["bgpupdate_keys"] = {monitor_event["key"]}
+
+        # store the origin, neighbor combination for this hijack BGP update
+        origin = None
+        neighbor = None
+        if monitor_event["path"]:
+            origin = monitor_event["path"][-1]
+        if len(monitor_event["path"]) > 1:
+            neighbor = monitor_event["path"][-2]
+        registrations = {
+            (
+                "hij_orig_neighb_{}".format(redis_hijack_key),
+                "{}_{}".format(origin, neighbor),
+            ),
+            # store the prefix and peer ASN for this hijack BGP update
+            (
+                "prefix_{}_peer_{}_hijacks".format(
+                    monitor_event["prefix"], monitor_event["peer_asn"]
+                ),
+                redis_hijack_key,
+            ),
+            (
+                "hijack_{}_prefixes_peers".format(redis_hijack_key),
+                "{}_{}".format(monitor_event["prefix"], monitor_event["peer_asn"]),
+            ),
+        }
+
+        self.aggregate_hijack(
+            monitor_event, redis_hijack_key, hijack_value, registrations
+        )
+        # partitioned instances own the hijacks of their partition and flush periodically
+        if DETECTION_PARTITIONED != "true":
+            self.flush_pending_hijacks()
+
+    def aggregate_hijack(
+        self,
+        monitor_event: Dict,
+        redis_hijack_key: str,
+        hijack_value: Dict,
+        registrations: Set[Tuple[str, str]],
+    ) -> NoReturn:
+        """
+        Aggregates a hijack update in local memory, until it is flushed to redis
+        (and published to the database).
+        """
+        pending_hijack = self.pending_hijacks.get(redis_hijack_key)
+        if not pending_hijack:
+            self.comm_annotate_hijack(monitor_event, hijack_value)
+            self.pending_hijacks[redis_hijack_key] = {
+                "hijack": hijack_value,
+                "annotation_priority": self.get_comm_annotation_priority(monitor_event),
+                "registrations": registrations,
+            }
+            return
+        hijack = pending_hijack["hijack"]
+        hijack["time_started"] = min(
+            hijack["time_started"], hijack_value["time_started"]
+        )
+        hijack["time_last"] = max(hijack["time_last"], hijack_value["time_last"])
+        # monitor keys are also aggregated, since the db has not seen them yet
+        for field in ["peers_seen", "monitor_keys", "asns_inf", "bgpupdate_keys"]:
+            hijack[field].update(hijack_value[field])
+        hijack["outdated_parent"] = hijack_value["outdated_parent"]
+        hijack["rpki_status"] = hijack_value["rpki_status"]
+        self.comm_annotate_hijack(monitor_event, hijack)
+        pending_hijack["registrations"].update(registrations)
+
+    def flush_pending_hijacks(self) -> NoReturn:
+        """
+        Merges the locally aggregated hijacks atomically (server-side) into the stored
+        ones, if any, and registers their BGP updates, all in a single round-trip;
+        the merged hijacks are then published.
+        """
+        self.pending_hijacks_time = time.time()
+        if not self.pending_hijacks:
+            return
+        pending_hijacks = self.pending_hijacks
+        self.pending_hijacks = {}
 
-        # proceed now that we have clearance
         redis_pipeline = self.redis.pipeline()
+        for redis_hijack_key, pending_hijack in pending_hijacks.items():
+            hijack = dict(pending_hijack["hijack"])
+            for field in ["peers_seen", "monitor_keys", "asns_inf", "bgpupdate_keys"]:
+                hijack[field] = list(hijack[field])
+            self.redis_merge_hijack(
+                keys=[redis_hijack_key, "persistent-keys"],
+                args=[
+                    json.dumps(hijack),
+                    json.dumps(pending_hijack["annotation_priority"]),
+                    0,
+                ],
+                client=redis_pipeline,
+            )
+            for registration_key, registration_value in pending_hijack["registrations"]:
+                redis_pipeline.sadd(registration_key, registration_value)
         try:
-            result = self.redis.get(redis_hijack_key)
-            if result:
-                result = classic_json.loads(result.decode("utf-8"))
-                result["time_started"] = min(
-                    result["time_started"], hijack_value["time_started"]
-                )
-                result["time_last"] = max(
-                    result["time_last"], hijack_value["time_last"]
+            # the results of failed commands are returned in their place
+            results = iter(redis_pipeline.execute(raise_on_error=False))
+        except Exception:
+            # redis unreachable; their updates have already been acked,
+            # so retry on the next flush
+            self.pending_hijacks = pending_hijacks
+            raise
+
+        for redis_hijack_key, pending_hijack in pending_hijacks.items():
+            merge_result = next(results)
+            for registration in pending_hijack["registrations"]:
+                registration_result = next(results)
+                if isinstance(registration_result, Exception):
+                    log.error(
+                        "could not register hijack '{}' in '{}': {}".format(
+                            redis_hijack_key, registration[0], registration_result
+                        )
+                    )
+            if isinstance(merge_result, Exception):
+                self.requeue_pending_hijack(
+                    redis_hijack_key, pending_hijack, merge_result
                 )
-                result["peers_seen"] = set(result["peers_seen"])
-                result["peers_seen"].update(hijack_value["peers_seen"])
-
-                result["asns_inf"] = set(result["asns_inf"])
-                result["asns_inf"].update(hijack_value["asns_inf"])
-
-                # no update since db already knows!
-                result["monitor_keys"] = hijack_value["monitor_keys"]
-                self.comm_annotate_hijack(monitor_event, result)
-                result["outdated_parent"] = hijack_value["outdated_parent"]
+                continue
+            is_new, result = merge_result
+            result = classic_json.loads(result)
 
-                result["bgpupdate_keys"] = set(result["bgpupdate_keys"])
-                result["bgpupdate_keys"].add(monitor_event["key"])
-
-                result["rpki_status"] = hijack_value["rpki_status"]
-            else:
-                hijack_value["time_detected"] = time.time()
-                hijack_value["key"] = get_hash(
-                    [
-                        monitor_event["prefix"],
-                        hijacker,
-                        hij_type,
-                        "{0:.6f}".format(hijack_value["time_detected"]),
-                    ]
-                )
-                hijack_value["bgpupdate_keys"] = {monitor_event["key"]}
-                redis_pipeline.sadd("persistent-keys", hijack_value["key"])
-                result = hijack_value
-                self.comm_annotate_hijack(monitor_event, result)
+            if is_new:
                 self.producer.publish(
                     result,
                     exchange=self.hijack_notification_exchange,
@@ -1024,36 +1189,6 @@ class DetectionDataWorker(ConsumerProducerMixin):
                     priority=1,
                     serializer="ujson",
                 )
-            redis_pipeline.set(redis_hijack_key, json.dumps(result))
-
-            # store the origin, neighbor combination for this hijack BGP update
-            origin = None
-            neighbor = None
-            if monitor_event["path"]:
-                origin = monitor_event["path"][-1]
-            if len(monitor_event["path"]) > 1:
-                neighbor = monitor_event["path"][-2]
-            redis_pipeline.sadd(
-                "hij_orig_neighb_{}".format(redis_hijack_key),
-                "{}_{}".format(origin, neighbor),
-            )
-
-            # store the prefix and peer ASN for this hijack BGP update
-            redis_pipeline.sadd(
-                "prefix_{}_peer_{}_hijacks".format(
-                    monitor_event["prefix"], monitor_event["peer_asn"]
-                ),
-                redis_hijack_key,
-            )
-            redis_pipeline.sadd(
-                "hijack_{}_prefixes_peers".format(redis_hijack_key),
-                "{}_{}".format(monitor_event["prefix"], monitor_event["peer_asn"]),
-            )
-        except Exception:
-            log.exception("exception")
-        finally:
-            # execute whatever has been accumulated in redis till now
-            redis_pipeline.execute()
 
             # publish hijack
             self.publish_hijack_fun(result, redis_hijack_key)
@@ -1067,12 +1202,30 @@ class DetectionDataWorker(ConsumerProducerMixin):
                 serializer="ujson",
             )
 
-            # unlock, by pushing back the token (at most one other process
-            # waiting will be unlocked)
-            redis_pipeline = self.redis.pipeline()
-            redis_pipeline.set("{}token_active".format(redis_hijack_key), 1)
-            redis_pipeline.lpush("{}token".format(redis_hijack_key), "token")
-            redis_pipeline.execute()
+    def requeue_pending_hijack(
+        self, redis_hijack_key: str, pending_hijack: Dict, error: Exception
+    ) -> NoReturn:
+        """
+        Keeps a hijack whose merge failed for the next flush, unless it has
+        already failed PENDING_HIJACK_MAX_RETRIES times (then it is dropped).
+        """
+        pending_hijack["failures"] = pending_hijack.get("failures", 0) + 1
+        if pending_hijack["failures"] > PENDING_HIJACK_MAX_RETRIES:
+            log.error(
+                "dropping hijack '{}' after {} failed merges ({}): {}".format(
+                    redis_hijack_key,
+                    pending_hijack["failures"],
+                    error,
+                    pending_hijack["hijack"],
+                )
+            )
+            return
+        log.warning(
+            "could not merge hijack '{}', retrying on the next flush: {}".format(
+                redis_hijack_key, error
+            )
+        )
+        self.pending_hijacks[redis_hijack_key] = pending_hijack
 
     def mark_handled(self, monitor_event: Dict) -> NoReturn:
         """
@@ -1087,6 +1240,18 @@ class DetectionDataWorker(ConsumerProducerMixin):
             serializer="ujson",
         )
 
+    def mark_handled_batch(self, monitor_events: List[Dict]) -> NoReturn:
+        """
+        Marks a batch of bgp updates as handled on the database (single message).
+        """
+        self.producer.publish(
+            [monitor_event["key"] for monitor_event in monitor_events],
+            exchange=self.handled_exchange,
+            routing_key="update",
+            priority=1,
+            serializer="ujson",
+        )
+
     def mark_outdated(self, hij_key: str, redis_hij_key: str) -> NoReturn:
         """
         Marks a hijack as outdated on the database.
@@ -1159,12 +1324,46 @@ class DetectionDataWorker(ConsumerProducerMixin):
             ):
                 withdraw_msg["prefix"] = str(super_prefix)
             key_generator(withdraw_msg)
-            self.producer.publish(
+            self.update_publisher.publish(
+                self.producer,
                 withdraw_msg,
                 exchange=self.update_exchange,
                 routing_key="update",
-                serializer="ujson",
+                serializer=wire_format(self.update_exchange),
+            )
+
+    def gen_implicit_withdrawals(self, monitor_events: List[Dict]) -> NoReturn:
+        """
+        Checks if a batch of benign BGP updates should trigger implicit withdrawals;
+        the hijack existence checks are pipelined in a single redis round-trip.
+        """
+        redis_pipeline = self.redis.pipeline()
+        for monitor_event in monitor_events:
+            prefix = monitor_event["prefix"]
+            super_prefix = ipaddress.ip_network(prefix).supernet()
+            peer_asn = monitor_event["peer_asn"]
+            redis_pipeline.exists(
+                "prefix_{}_peer_{}_hijacks".format(prefix, peer_asn),
+                "prefix_{}_peer_{}_hijacks".format(super_prefix, peer_asn),
             )
+        for monitor_event, hijack_keys_exist in zip(
+            monitor_events, redis_pipeline.execute()
+        ):
+            if hijack_keys_exist:
+                self.gen_implicit_withdrawal(monitor_event)
+
+    @staticmethod
+    def get_comm_annotation_priority(monitor_event: Dict) -> List[str]:
+        """
+        Returns the community annotations of the matched confs in order of priority.
+        """
+        annotations = []
+        if "prefix_node" in monitor_event:
+            for item in monitor_event["prefix_node"]["data"]["confs"]:
+                for annotation_element in item.get("community_annotations", []):
+                    for annotation in annotation_element:
+                        annotations.append(annotation)
+        return annotations
 
     def comm_annotate_hijack(self, monitor_event: Dict, hijack: Dict) -> NoReturn:
         """
@@ -3,6 +3,8 @@ from unittest.mock import MagicMock
 from unittest.mock import patch
 
 import detection
+from artemis_utils.rabbitmq import UPDATE_ENVELOPE_SCHEMA_VERSION
+from artemis_utils.rabbitmq import UpdateBatchPublisher
 
 
 class BGPHandlerTester(unittest.TestCase):
@@ -677,6 +679,354 @@ class BGPHandlerTester(unittest.TestCase):
         self.assertEqual(mock_commit_hijack.call_args[0][1], 100)
         self.assertEqual(mock_commit_hijack.call_args[0][2], ["S", "P", "-", "-"])
 
+    @patch("detection.DetectionDataWorker.mark_handled_batch")
+    @patch("detection.DetectionDataWorker.gen_implicit_withdrawals")
+    @patch("detection.DetectionDataWorker.commit_hijack")
+    def test_handle_bgp_update_batch(
+        self, mock_commit_hijack, mock_gen_implicit_withdrawals, mock_mark_handled_batch
+    ):
+        prefix_node = {
+            "prefix": "10.0.0.0/24",
+            "data": {
+                "confs": [
+                    {
+                        "prefixes": ["10.0.0.0/24"],
+                        "origin_asns": [1],
+                        "neighbors": [2],
+                        "prepend_seq": [],
+                        "mitigation": ["manual"],
+                        "policies": [],
+                        "community_annotations": [],
+                    }
+                ]
+            },
+            "timestamp": 1,
+        }
+        messages = [
+            {
+                "key": str(i),
+                "timestamp": 1,
+                "orig_path": [],
+                "communities": [],
+                "service": "a",
+                "type": "A",
+                "path": path,
+                "prefix": "10.0.0.0/24",
+                "peer_asn": 4,
+                "prefix_node": prefix_node,
+            }
+            for i, path in enumerate([[4, 3, 2, 1], [4, 3, 2, 100], [4, 3, 2, 1]])
+        ]
+        self.detectionDataWorker.handle_bgp_update_batch(messages)
+
+        self.assertEqual(mock_commit_hijack.call_count, 1)
+        self.assertEqual(mock_commit_hijack.call_args[0][0]["key"], "1")
+        self.assertEqual(mock_commit_hijack.call_args[0][1], 100)
+        self.assertEqual(mock_commit_hijack.call_args[0][2], ["E", "0", "-", "-"])
+        handled_keys = [
+            monitor_event["key"]
+            for monitor_event in mock_mark_handled_batch.call_args[0][0]
+        ]
+        self.assertEqual(handled_keys, ["0", "2"])
+        self.assertTrue(mock_gen_implicit_withdrawals.called)
+
+    @patch("detection.DetectionDataWorker.commit_hijack")
+    def test_handle_bgp_update_conf_ids(self, mock_commit_hijack):
+        self.detectionDataWorker.config_nodes["1.000000"] = {
+            "c0": detection.RuleMatcher(
+                {
+                    "conf_id": "c0",
+                    "origin_asns": list(range(1, 100000)),
+                    "neighbors": [-1],
+                    "prepend_seq": [],
+                    "mitigation": "manual",
+                    "policies": [],
+                    "community_annotations": [],
+                }
+            )
+        }
+        message = {
+            "key": "1",
+            "timestamp": 1,
+            "orig_path": [],
+            "communities": [],
+            "service": "a",
+            "type": "A",
+            "path": [4, 3, 2, 100000],
+            "prefix": "10.0.0.0/24",
+            "peer_asn": 4,
+            "prefix_node": {
+                "prefix": "10.0.0.0/24",
+                "conf_ids": ["c0"],
+                "timestamp": 1,
+            },
+        }
+        self.detectionDataWorker.handle_bgp_update(message)
+
+        self.assertTrue(mock_commit_hijack.called)
+        self.assertEqual(mock_commit_hijack.call_args[0][1], 100000)
+        self.assertEqual(mock_commit_hijack.call_args[0][2], ["E", "0", "-", "-"])
+
+    @patch("detection.requests.get")
+    def test_resolve_prefix_node_unavailable(self, mock_get):
+        mock_get.side_effect = detection.requests.exceptions.Timeout()
+        monitor_event = {
+            "prefix": "10.0.0.0/24",
+            "prefix_node": {
+                "prefix": "10.0.0.0/24",
+                "conf_ids": ["c0"],
+                "timestamp": 2,
+            },
+        }
+        with self.assertRaises(detection.ArtemisError):
+            self.detectionDataWorker.resolve_monitor_event_prefix_node(monitor_event)
+
+        self.assertEqual(
+            mock_get.call_args[1]["timeout"], detection.CONFIG_NODES_REQUEST_TIMEOUT
+        )
+        self.assertIn("prefix_node", monitor_event)
+        self.assertNotIn("2.000000", self.detectionDataWorker.config_nodes)
+
+        # no new request before the retry interval
+        with self.assertRaises(detection.ArtemisError):
+            self.detectionDataWorker.resolve_monitor_event_prefix_node(monitor_event)
+        self.assertEqual(mock_get.call_count, 1)
+
+    @patch("detection.DetectionDataWorker.mark_handled_batch")
+    @patch("detection.DetectionDataWorker.gen_implicit_withdrawals")
+    @patch("detection.requests.get")
+    def test_defer_unresolved_bgp_update(
+        self, mock_get, mock_gen_implicit_withdrawals, mock_mark_handled_batch
+    ):
+        mock_get.return_value.json.return_value = {
+            "success": False,
+            "config_timestamp": "3.000000",
+            "confs": [],
+        }
+        message = {
+            "key": "1",
+            "timestamp": 1,
+            "orig_path": [],
+            "communities": [],
+            "service": "a",
+            "type": "A",
+            "path": [4, 3, 2, 100000],
+            "prefix": "10.0.0.0/24",
+            "peer_asn": 4,
+            "prefix_node": {
+                "prefix": "10.0.0.0/24",
+                "conf_ids": ["c0"],
+                "timestamp": 3,
+            },
+        }
+        self.detectionDataWorker.handle_bgp_update_batch([dict(message)])
+
+        self.assertFalse(mock_mark_handled_batch.called)
+        self.assertEqual(self.detectionDataWorker.deferred_updates, {0: [message]})
+
+        # the configuration version becomes resolvable
+        self.detectionDataWorker.config_nodes["3.000000"] = {
+            "c0": detection.RuleMatcher(
+                {
+                    "conf_id": "c0",
+                    "origin_asns": [100000],
+                    "neighbors": [2],
+                    "prepend_seq": [],
+                    "mitigation": "manual",
+                    "policies": [],
+                    "community_annotations": [],
+                }
+            )
+        }
+        self.detectionDataWorker.retry_deferred_updates()
+
+        self.assertEqual(self.detectionDataWorker.deferred_updates, {})
+        handled_keys = [
+            monitor_event["key"]
+            for monitor_event in mock_mark_handled_batch.call_args[0][0]
+        ]
+        self.assertEqual(handled_keys, ["1"])
+
+    @patch("detection.DetectionDataWorker.producer")
+    def test_aggregate_and_flush_hijacks(self, mock_producer):
+        monitor_event = {
+            "key": "1",
+            "communities": [],
+            "prefix_node": {"prefix": "10.0.0.0/24", "data": {"confs": []}},
+        }
+        hijack_value = {
+            "time_started": 2,
+            "time_last": 2,
+            "peers_seen": {4},
+            "monitor_keys": {"1"},
+            "asns_inf": {4},
+            "bgpupdate_keys": {"1"},
+            "outdated_parent": None,
+            "rpki_status": "NA",
+        }
+        self.detectionDataWorker.aggregate_hijack(
+            monitor_event, "hij", dict(hijack_value), {("a", "b")}
+        )
+        self.detectionDataWorker.aggregate_hijack(
+            dict(monitor_event, key="2"),
+            "hij",
+            dict(
+                hijack_value,
+                time_started=1,
+                time_last=3,
+                peers_seen={5},
+                monitor_keys={"2"},
+                bgpupdate_keys={"2"},
+            ),
+            {("a", "c")},
+        )
+        hijack = self.detectionDataWorker.pending_hijacks["hij"]["hijack"]
+        self.assertEqual(hijack["time_started"], 1)
+        self.assertEqual(hijack["time_last"], 3)
+        self.assertEqual(hijack["peers_seen"], {4, 5})
+        self.assertEqual(hijack["monitor_keys"], {"1", "2"})
+        self.assertEqual(hijack["bgpupdate_keys"], {"1", "2"})
+
+        redis_pipeline = self.detectionDataWorker.redis.pipeline.return_value
+        redis_pipeline.execute.return_value = [[1, b'{"key": "k"}'], 1, 1]
+        self.detectionDataWorker.redis_merge_hijack = MagicMock()
+        mock_publish_hijack_fun = MagicMock()
+        self.detectionDataWorker.publish_hijack_fun = mock_publish_hijack_fun
+        self.detectionDataWorker.flush_pending_hijacks()
+
+        self.assertEqual(self.detectionDataWorker.pending_hijacks, {})
+        self.assertEqual(self.detectionDataWorker.redis_merge_hijack.call_count, 1)
+        self.assertEqual(redis_pipeline.sadd.call_count, 2)
+        mock_publish_hijack_fun.assert_called_once_with({"key": "k"}, "hij")
+
+    @patch("detection.DetectionDataWorker.producer")
+    def test_flush_hijacks_redis_failure(self, mock_producer):
+        monitor_event = {
+            "key": "1",
+            "communities": [],
+            "prefix_node": {"prefix": "10.0.0.0/24", "data": {"confs": []}},
+        }
+        hijack_value = {
+            "time_started": 1,
+            "time_last": 1,
+            "peers_seen": {4},
+            "monitor_keys": {"1"},
+            "asns_inf": {4},
+            "bgpupdate_keys": {"1"},
+            "outdated_parent": None,
+            "rpki_status": "NA",
+        }
+        self.detectionDataWorker.aggregate_hijack(
+            monitor_event, "hij", dict(hijack_value), {("a", "b")}
+        )
+        self.detectionDataWorker.redis = MagicMock()
+        redis_pipeline = self.detectionDataWorker.redis.pipeline.return_value
+        redis_pipeline.execute.side_effect = ConnectionError()
+        self.detectionDataWorker.redis_merge_hijack = MagicMock()
+        self.detectionDataWorker.pending_hijacks_time = 0
+        self.detectionDataWorker.on_iteration()
+
+        # kept for the next flush, still aggregatable
+        hijack = self.detectionDataWorker.pending_hijacks["hij"]["hijack"]
+        self.assertEqual(hijack["peers_seen"], {4})
+        self.detectionDataWorker.aggregate_hijack(
+            monitor_event, "hij", dict(hijack_value, peers_seen={5}), set()
+        )
+        self.assertEqual(hijack["peers_seen"], {4, 5})
+
+    @patch("detection.DetectionDataWorker.producer")
+    def test_flush_hijacks_merge_failure(self, mock_producer):
+        monitor_event = {
+            "key": "1",
+            "communities": [],
+            "prefix_node": {"prefix": "10.0.0.0/24", "data": {"confs": []}},
+        }
+        hijack_value = {
+            "time_started": 1,
+            "time_last": 1,
+            "peers_seen": {4},
+            "monitor_keys": {"1"},
+            "asns_inf": {4},
+            "bgpupdate_keys": {"1"},
+            "outdated_parent": None,
+            "rpki_status": "NA",
+        }
+        self.detectionDataWorker.aggregate_hijack(
+            monitor_event, "bad", dict(hijack_value), {("a", "b")}
+        )
+        self.detectionDataWorker.aggregate_hijack(
+            dict(monitor_event, key="2"), "good", dict(hijack_value), {("a", "c")}
+        )
+        self.detectionDataWorker.redis = MagicMock()
+        redis_pipeline = self.detectionDataWorker.redis.pipeline.return_value
+        redis_pipeline.execute.return_value = [
+            detection.redis.exceptions.ResponseError("script error"),
+            1,
+            [1, b'{"key": "k"}'],
+            1,
+        ]
+        self.detectionDataWorker.redis_merge_hijack = MagicMock()
+        mock_publish_hijack_fun = MagicMock()
+        self.detectionDataWorker.publish_hijack_fun = mock_publish_hijack_fun
+        self.detectionDataWorker.flush_pending_hijacks()
+
+        redis_pipeline.execute.assert_called_with(raise_on_error=False)
+        # only the failed hijack is kept for the next flush
+        self.assertEqual(list(self.detectionDataWorker.pending_hijacks), ["bad"])
+        mock_publish_hijack_fun.assert_called_once_with({"key": "k"}, "good")
+        mail_logs = [
+            call
+            for call in mock_producer.publish.call_args_list
+            if call[1]["routing_key"] == "mail-log"
+        ]
+        self.assertEqual(len(mail_logs), 1)
+
+        # dropped after failing repeatedly
+        redis_pipeline.execute.return_value = [
+            detection.redis.exceptions.ResponseError("script error"),
+            1,
+        ]
+        for _ in range(detection.PENDING_HIJACK_MAX_RETRIES):
+            self.detectionDataWorker.flush_pending_hijacks()
+        self.assertEqual(self.detectionDataWorker.pending_hijacks, {})
+
+    @patch("detection.DetectionDataWorker.producer")
+    def test_batched_update_envelopes(self, mock_producer):
+        stored_update = {
+            "key": "1",
+            "type": "W",
+            "as_path": [],
+            "timestamp": "2020-01-01 00:00:00",
+        }
+        message = MagicMock()
+        message.payload = {
+            "schema_version": UPDATE_ENVELOPE_SCHEMA_VERSION,
+            "updates": [dict(stored_update), dict(stored_update, key="2")],
+        }
+        self.detectionDataWorker.buffer_bgp_update(message)
+        message.ack.assert_called_once()
+        self.assertEqual(
+            [update["key"] for update in self.detectionDataWorker.update_batch],
+            ["1", "2"],
+        )
+
+        update_publisher = UpdateBatchPublisher(max_batch_size=2, linger=0)
+        exchange = MagicMock()
+        update_publisher.publish(mock_producer, {"key": "1"}, exchange, "withdraw")
+        self.assertFalse(mock_producer.publish.called)
+        update_publisher.publish(mock_producer, {"key": "2"}, exchange, "withdraw")
+        self.assertEqual(
+            mock_producer.publish.call_args[0][0],
+            {
+                "schema_version": UPDATE_ENVELOPE_SCHEMA_VERSION,
+                "updates": [{"key": "1"}, {"key": "2"}],
+            },
+        )
+        update_publisher.publish(mock_producer, {"key": "3"}, exchange, "withdraw")
+        update_publisher.flush(mock_producer, expired_only=True)
+        self.assertEqual(mock_producer.publish.call_count, 2)
+        self.assertEqual(update_publisher.batches, {})
+
 
 if __name__ == "__main__":
     unittest.main()
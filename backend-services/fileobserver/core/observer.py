@@ -7,6 +7,9 @@ import ujson as json
 from artemis_utils import get_logger
 from artemis_utils.constants import CONFIGURATION_HOST
 from artemis_utils.envvars import REST_PORT
+from artemis_utils.rest import BlockingRequestHandler
+from artemis_utils.rest import RestMetricsHandler
+from artemis_utils.service import ProcessLauncher
 from tornado.ioloop import IOLoop
 from tornado.web import Application
 from tornado.web import RequestHandler
@@ -23,11 +26,13 @@ shared_memory_locks = {"data_worker": mp.Lock()}
 SERVICE_NAME = "fileobserver"
 
 
-class ConfigHandler(RequestHandler):
+class ConfigHandler(BlockingRequestHandler):
     """
     REST request handler for configuration.
     """
 
+    max_concurrency = 1
+
     def initialize(self, shared_memory_manager_dict):
         self.shared_memory_manager_dict = shared_memory_manager_dict
 
@@ -84,8 +89,9 @@ class ControlHandler(RequestHandler):
     REST request handler for control commands.
     """
 
-    def initialize(self, shared_memory_manager_dict):
+    def initialize(self, shared_memory_manager_dict, data_worker_launcher):
         self.shared_memory_manager_dict = shared_memory_manager_dict
+        self.data_worker_launcher = data_worker_launcher
 
     def start_data_worker(self):
         shared_memory_locks["data_worker"].acquire()
@@ -94,29 +100,28 @@ class ControlHandler(RequestHandler):
             shared_memory_locks["data_worker"].release()
             return "already running"
         shared_memory_locks["data_worker"].release()
-        mp.Process(target=self.run_data_worker_process).start()
+        self.data_worker_launcher.launch()
         return "instructed to start"
 
-    def run_data_worker_process(self):
+    @staticmethod
+    def run_data_worker_process(shared_memory_manager_dict):
         shared_memory_locks["data_worker"].acquire()
         observer = WatchObserver()
         try:
             event_handler = Handler(
-                self.shared_memory_manager_dict["dirname"],
-                self.shared_memory_manager_dict["filename"],
+                shared_memory_manager_dict["dirname"],
+                shared_memory_manager_dict["filename"],
             )
             observer.schedule(
-                event_handler,
-                self.shared_memory_manager_dict["dirname"],
-                recursive=False,
+                event_handler, shared_memory_manager_dict["dirname"], recursive=False
             )
             observer.start()
-            self.shared_memory_manager_dict["data_worker_running"] = True
+            shared_memory_manager_dict["data_worker_running"] = True
             shared_memory_locks["data_worker"].release()
             log.info("data worker started")
             while True:
                 time.sleep(5)
-                if not self.shared_memory_manager_dict["data_worker_running"]:
+                if not shared_memory_manager_dict["data_worker_running"]:
                     break
         except Exception:
             log.exception("exception")
@@ -125,7 +130,7 @@ class ControlHandler(RequestHandler):
             observer.stop()
             observer.join()
             shared_memory_locks["data_worker"].acquire()
-            self.shared_memory_manager_dict["data_worker_running"] = False
+            shared_memory_manager_dict["data_worker_running"] = False
             shared_memory_locks["data_worker"].release()
             log.info("data worker stopped")
 
@@ -176,6 +181,11 @@ class FileObserver:
         self.shared_memory_manager_dict["dirname"] = "/etc/artemis"
         self.shared_memory_manager_dict["filename"] = "config.yaml"
 
+        # data workers are started via a helper process (see ProcessLauncher)
+        self.data_worker_launcher = ProcessLauncher(
+            ControlHandler.run_data_worker_process, self.shared_memory_manager_dict
+        )
+
         log.info("service initiated")
 
     def make_rest_app(self):
@@ -189,17 +199,23 @@ class FileObserver:
                 (
                     "/control",
                     ControlHandler,
-                    dict(shared_memory_manager_dict=self.shared_memory_manager_dict),
+                    dict(
+                        shared_memory_manager_dict=self.shared_memory_manager_dict,
+                        data_worker_launcher=self.data_worker_launcher,
+                    ),
                 ),
                 (
                     "/health",
                     HealthHandler,
                     dict(shared_memory_manager_dict=self.shared_memory_manager_dict),
                 ),
+                ("/metrics", RestMetricsHandler),
             ]
         )
 
     def start_rest_app(self):
+        # fork the data worker launcher before any REST thread exists
+        self.data_worker_launcher.start()
         app = self.make_rest_app()
         app.listen(REST_PORT)
         log.info("REST worker started and listening to port {}".format(REST_PORT))
@@ -12,6 +12,9 @@ from artemis_utils.envvars import RABBITMQ_URI
 from artemis_utils.envvars import REST_PORT
 from artemis_utils.rabbitmq import create_exchange
 from artemis_utils.rabbitmq import create_queue
+from artemis_utils.rest import BlockingRequestHandler
+from artemis_utils.rest import RestMetricsHandler
+from artemis_utils.service import ProcessLauncher
 from artemis_utils.service import wait_data_worker_dependencies
 from kombu import Connection
 from kombu import Producer
@@ -32,11 +35,13 @@ SERVICE_NAME = "mitigation"
 DATA_WORKER_DEPENDENCIES = [PREFIXTREE_HOST, DATABASE_HOST]
 
 
-class ConfigHandler(RequestHandler):
+class ConfigHandler(BlockingRequestHandler):
     """
     REST request handler for configuration.
     """
 
+    max_concurrency = 1
+
     def initialize(self, shared_memory_manager_dict):
         self.shared_memory_manager_dict = shared_memory_manager_dict
 
@@ -84,8 +89,9 @@ class ControlHandler(RequestHandler):
     REST request handler for control commands.
     """
 
-    def initialize(self, shared_memory_manager_dict):
+    def initialize(self, shared_memory_manager_dict, data_worker_launcher):
         self.shared_memory_manager_dict = shared_memory_manager_dict
+        self.data_worker_launcher = data_worker_launcher
 
     def start_data_worker(self):
         shared_memory_locks["data_worker"].acquire()
@@ -94,17 +100,18 @@ class ControlHandler(RequestHandler):
             shared_memory_locks["data_worker"].release()
             return "already running"
         shared_memory_locks["data_worker"].release()
-        mp.Process(target=self.run_data_worker_process).start()
+        self.data_worker_launcher.launch()
         return "instructed to start"
 
-    def run_data_worker_process(self):
+    @staticmethod
+    def run_data_worker_process(shared_memory_manager_dict):
         try:
             with Connection(RABBITMQ_URI) as connection:
                 shared_memory_locks["data_worker"].acquire()
                 data_worker = MitigationDataWorker(
-                    connection, self.shared_memory_manager_dict
+                    connection, shared_memory_manager_dict
                 )
-                self.shared_memory_manager_dict["data_worker_running"] = True
+                shared_memory_manager_dict["data_worker_running"] = True
                 shared_memory_locks["data_worker"].release()
                 log.info("data worker started")
                 data_worker.run()
@@ -112,7 +119,7 @@ class ControlHandler(RequestHandler):
             log.exception("exception")
         finally:
             shared_memory_locks["data_worker"].acquire()
-            self.shared_memory_manager_dict["data_worker_running"] = False
+            shared_memory_manager_dict["data_worker_running"] = False
             shared_memory_locks["data_worker"].release()
             log.info("data worker stopped")
 
@@ -174,6 +181,11 @@ class Mitigation:
         self.shared_memory_manager_dict["data_worker_running"] = False
         self.shared_memory_manager_dict["service_reconfiguring"] = False
 
+        # data workers are started via a helper process (see ProcessLauncher)
+        self.data_worker_launcher = ProcessLauncher(
+            ControlHandler.run_data_worker_process, self.shared_memory_manager_dict
+        )
+
         log.info("service initiated")
 
     def make_rest_app(self):
@@ -187,17 +199,23 @@ class Mitigation:
                 (
                     "/control",
                     ControlHandler,
-                    dict(shared_memory_manager_dict=self.shared_memory_manager_dict),
+                    dict(
+                        shared_memory_manager_dict=self.shared_memory_manager_dict,
+                        data_worker_launcher=self.data_worker_launcher,
+                    ),
                 ),
                 (
                     "/health",
                     HealthHandler,
                     dict(shared_memory_manager_dict=self.shared_memory_manager_dict),
                 ),
+                ("/metrics", RestMetricsHandler),
             ]
         )
 
     def start_rest_app(self):
+        # fork the data worker launcher before any REST thread exists
+        self.data_worker_launcher.start()
         app = self.make_rest_app()
         app.listen(REST_PORT)
         log.info("REST worker started and listening to port {}".format(REST_PORT))
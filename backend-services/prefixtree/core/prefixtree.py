@@ -1,4 +1,5 @@
 import multiprocessing as mp
+from ipaddress import ip_network as str2ip
 from typing import Dict
 from typing import List
 from typing import NoReturn
@@ -8,19 +9,29 @@ import redis
 import requests
 import ujson as json
 from artemis_utils import flatten
+from artemis_utils import get_config_version
+from artemis_utils import get_hash
 from artemis_utils import get_ip_version
 from artemis_utils import get_logger
 from artemis_utils import search_worst_prefix
 from artemis_utils.constants import CONFIGURATION_HOST
+from artemis_utils.envvars import DETECTION_PARTITIONED
 from artemis_utils.envvars import RABBITMQ_URI
 from artemis_utils.envvars import REDIS_HOST
 from artemis_utils.envvars import REDIS_PORT
 from artemis_utils.envvars import REST_PORT
+from artemis_utils.rabbitmq import accepted_wire_formats
 from artemis_utils.rabbitmq import create_exchange
 from artemis_utils.rabbitmq import create_queue
+from artemis_utils.rabbitmq import unpack_update_envelope
+from artemis_utils.rabbitmq import UpdateBatchPublisher
+from artemis_utils.rabbitmq import wire_format
 from artemis_utils.redis import ping_redis
+from artemis_utils.rest import BlockingRequestHandler
+from artemis_utils.rest import RestMetricsHandler
+from artemis_utils.service import ProcessLauncher
+from artemis_utils.translations import rfc2622_to_range
 from artemis_utils.translations import translate_asn_range
-from artemis_utils.translations import translate_rfc2622
 from kombu import Connection
 from kombu import Consumer
 from kombu import Producer
@@ -47,11 +58,29 @@ shared_memory_locks = {
     "monitored_prefixes": mp.Lock(),
     "configured_prefix_count": mp.Lock(),
     "config_timestamp": mp.Lock(),
+    "config_nodes": mp.Lock(),
     "service_reconfiguring": mp.Lock(),
 }
 
+# latest version of each of the shared prefix trees; kept in shared memory (and
+# inherited by the data worker) so that lookups can check it without locks/IPC
+shared_tree_versions = {
+    "prefix_tree": mp.Value("L", 0, lock=False),
+    "autoignore_prefix_tree": mp.Value("L", 0, lock=False),
+}
+
+# lock guarding each of the shared prefix trees
+SHARED_TREE_LOCKS = {
+    "prefix_tree": "prefix_tree",
+    "autoignore_prefix_tree": "autoignore",
+}
+
 # global vars
 SERVICE_NAME = "prefixtree"
+# number of configuration versions whose nodes are kept resolvable by consumers
+CONFIG_NODES_HISTORY = 5
+# number of prefix tree versions whose changes are kept for in-place updates
+PREFIX_TREE_DELTA_HISTORY = 5
 
 
 def pytricia_to_dict(pyt_tree):
@@ -61,15 +90,199 @@ def pytricia_to_dict(pyt_tree):
     return pyt_dict
 
 
-def dict_to_pytricia(dict_tree, size=32):
-    pyt_tree = pytricia.PyTricia(size)
-    for prefix in dict_tree:
-        pyt_tree.insert(prefix, dict_tree[prefix])
-    return pyt_tree
+def new_rule_set():
+    """
+    Empty set of (prefix) rules, keyed by rule ID, along with their ranks
+    (position in the configuration) and the prefix tree of their ranges.
+    """
+    return {
+        "rules": {},
+        "rule_ranks": {},
+        "tree": {"v4": pytricia.PyTricia(32), "v6": pytricia.PyTricia(128)},
+    }
+
+
+# rule sets of the current configuration in this (REST) process; reconfiguration
+# is diffed against them, so that only the changed rules are applied and published
+configured_rule_sets = {
+    "prefix_tree": new_rule_set(),
+    "autoignore_prefix_tree": new_rule_set(),
+}
+
+
+def diff_rule_sets(old_rule_set, new_rules, new_rule_ranks):
+    """
+    Compute the changes that turn a rule set into another one; since rules are
+    keyed by their (content-based) ID, changed rules are removed and re-added.
+    :param old_rule_set: <dict> rule set (see new_rule_set)
+    :param new_rules: <dict> rule ID -> rule
+    :param new_rule_ranks: <dict> rule ID -> rank
+    :return: {"remove": [<rule ID>], "add": {<rule ID>: <rule>},
+    "ranks": {<rule ID>: <new or changed rank>}}
+    """
+    old_rules = old_rule_set["rules"]
+    old_rule_ranks = old_rule_set["rule_ranks"]
+    return {
+        "remove": [rule_id for rule_id in old_rules if rule_id not in new_rules],
+        "add": {
+            rule_id: rule
+            for rule_id, rule in new_rules.items()
+            if rule_id not in old_rules
+        },
+        "ranks": {
+            rule_id: rank
+            for rule_id, rank in new_rule_ranks.items()
+            if old_rule_ranks.get(rule_id) != rank
+        },
+    }
+
+
+def apply_rule_changes(rule_set, changes):
+    """
+    Apply the changes computed by diff_rule_sets to a rule set in place, touching
+    only the prefix ranges of the removed and added rules in its tree.
+    :param rule_set: <dict> rule set (see new_rule_set)
+    :param changes: {"remove": [<rule ID>], "add": {<rule ID>: <rule>},
+    "ranks": {<rule ID>: <rank>}}
+    """
+    for rule_id in changes["remove"]:
+        for prefix in rule_set["rules"].pop(rule_id)["prefixes"]:
+            remove_prefix_range(
+                rule_set["tree"][get_ip_version(prefix)], prefix, rule_id
+            )
+        del rule_set["rule_ranks"][rule_id]
+    for rule_id, rule in changes["add"].items():
+        rule_set["rules"][rule_id] = rule
+        for prefix in rule["prefixes"]:
+            insert_prefix_range(
+                rule_set["tree"][get_ip_version(prefix)], prefix, {"rule_id": rule_id}
+            )
+    rule_set["rule_ranks"].update(changes["ranks"])
+
+
+def publish_rule_changes(shared_memory_manager_dict, tree_name, changes, timestamp):
+    """
+    Store a new version of a rule set as its changes from the previous version,
+    so that the data worker can update its own tree in place, and apply them to
+    the rule set of this process. Only the changed rules are transferred; the
+    full rule set is kept per rule in shared memory, for reloading from scratch.
+    :param shared_memory_manager_dict: <dict> shared memory
+    :param tree_name: <str> "prefix_tree" | "autoignore_prefix_tree"
+    :param changes: <dict> changes computed by diff_rule_sets
+    :param timestamp: <timestamp> of the configuration that the changes come from
+    """
+    lock = shared_memory_locks[SHARED_TREE_LOCKS[tree_name]]
+    lock.acquire()
+    try:
+        version = shared_tree_versions[tree_name].value + 1
+        deltas = dict(shared_memory_manager_dict["{}_deltas".format(tree_name)])
+        deltas[version] = dict(changes, timestamp=timestamp)
+        for old_version in sorted(deltas)[:-PREFIX_TREE_DELTA_HISTORY]:
+            del deltas[old_version]
+        shared_rules = shared_memory_manager_dict["{}_rules".format(tree_name)]
+        shared_rule_ranks = shared_memory_manager_dict[
+            "{}_rule_ranks".format(tree_name)
+        ]
+        for rule_id in changes["remove"]:
+            shared_rules.pop(rule_id)
+            shared_rule_ranks.pop(rule_id)
+        shared_rules.update(changes["add"])
+        shared_rule_ranks.update(changes["ranks"])
+        shared_memory_manager_dict["{}_deltas".format(tree_name)] = deltas
+        apply_rule_changes(configured_rule_sets[tree_name], changes)
+    finally:
+        lock.release()
+    # the changes are in place before the new version becomes visible
+    shared_tree_versions[tree_name].value = version
+
+
+def insert_prefix_range(pyt_tree, input_prefix, range_entry):
+    """
+    Store a (possibly RFC2622-ranged) prefix in the tree under its base prefix,
+    without expanding the range to all its more specifics.
+    :param pyt_tree: <pytricia> tree keyed by base prefix
+    :param input_prefix: <str> prefix, optionally followed by an RFC2622 operator
+    :param range_entry: <dict> payload to associate with the prefix range
+    :return: <str> the base prefix that the range was stored under
+    """
+    base_prefix, min_length, max_length = rfc2622_to_range(input_prefix)
+    if pyt_tree.has_key(base_prefix):
+        node = pyt_tree[base_prefix]
+    else:
+        node = {"prefix": base_prefix, "ranges": []}
+        pyt_tree.insert(base_prefix, node)
+    range_entry["min_length"] = min_length
+    range_entry["max_length"] = max_length
+    node["ranges"].append(range_entry)
+    return base_prefix
+
+
+def remove_prefix_range(pyt_tree, input_prefix, rule_id):
+    """
+    Remove the range entries of a rule for a (possibly RFC2622-ranged) prefix,
+    along with its base prefix node if no other ranges are stored under it.
+    :param pyt_tree: <pytricia> tree keyed by base prefix
+    :param input_prefix: <str> prefix, optionally followed by an RFC2622 operator
+    :param rule_id: <str> ID of the rule that the range entries belong to
+    """
+    base_prefix, min_length, max_length = rfc2622_to_range(input_prefix)
+    if not pyt_tree.has_key(base_prefix):
+        return
+    node = pyt_tree[base_prefix]
+    node["ranges"] = [
+        range_entry
+        for range_entry in node["ranges"]
+        if (
+            range_entry["rule_id"],
+            range_entry["min_length"],
+            range_entry["max_length"],
+        )
+        != (rule_id, min_length, max_length)
+    ]
+    if not node["ranges"]:
+        pyt_tree.delete(base_prefix)
+
+
+def lookup_prefix_ranges(pyt_tree, prefix):
+    """
+    Find the best (most specific) configured prefix matching a prefix, checking
+    the length ranges of all covering base prefixes at lookup time.
+    Equivalent to a longest-prefix match on the tree of expanded RFC2622 ranges.
+    :param pyt_tree: <pytricia> tree keyed by base prefix
+    :param prefix: <str> prefix to look up
+    :return: (<str> best matching prefix, <list> matching range entries),
+    or (None, []) if no range matches
+    """
+    if prefix not in pyt_tree:
+        return None, []
+    prefix_length = int(prefix.split("/")[1])
+    best_length = -1
+    best_entries = []
+    node_prefix = pyt_tree.get_key(prefix)
+    while node_prefix:
+        for range_entry in pyt_tree[node_prefix]["ranges"]:
+            if range_entry["min_length"] > prefix_length:
+                continue
+            matched_length = min(prefix_length, range_entry["max_length"])
+            if matched_length > best_length:
+                best_length = matched_length
+                best_entries = [range_entry]
+            elif matched_length == best_length:
+                best_entries.append(range_entry)
+        node_prefix = pyt_tree.parent(node_prefix)
+    if not best_entries:
+        return None, []
+    if best_length == prefix_length:
+        return prefix, best_entries
+    return (
+        str(str2ip(prefix, strict=False).supernet(new_prefix=best_length)),
+        best_entries,
+    )
 
 
 def configure_prefixtree(msg, shared_memory_manager_dict):
     config = msg
+    config_timestamp = None
     try:
         # check newer config
         config_timestamp = shared_memory_manager_dict["config_timestamp"]
@@ -78,133 +291,159 @@ def configure_prefixtree(msg, shared_memory_manager_dict):
             shared_memory_manager_dict["service_reconfiguring"] = True
             shared_memory_locks["service_reconfiguring"].release()
 
-            # calculate prefix tree
-            prefix_tree = {"v4": pytricia.PyTricia(32), "v6": pytricia.PyTricia(128)}
-            rules = config.get("rules", [])
-            for rule in rules:
+            # calculate the prefix rules, keyed by a hash of their content so that
+            # unchanged rules keep their ID (and tree entries) across configurations
+            rules = {}
+            rule_ranks = {}
+            config_nodes = []
+            for rule in config.get("rules", []):
                 rule_translated_origin_asn_set = set()
                 for asn in rule["origin_asns"]:
                     this_translated_asn_list = flatten(translate_asn_range(asn))
                     rule_translated_origin_asn_set.update(set(this_translated_asn_list))
-                rule["origin_asns"] = list(rule_translated_origin_asn_set)
+                rule["origin_asns"] = sorted(rule_translated_origin_asn_set)
                 rule_translated_neighbor_set = set()
                 for asn in rule["neighbors"]:
                     this_translated_asn_list = flatten(translate_asn_range(asn))
                     rule_translated_neighbor_set.update(set(this_translated_asn_list))
-                rule["neighbors"] = list(rule_translated_neighbor_set)
+                rule["neighbors"] = sorted(rule_translated_neighbor_set)
 
                 conf_obj = {
                     "origin_asns": rule["origin_asns"],
                     "neighbors": rule["neighbors"],
                     "prepend_seq": rule.get("prepend_seq", []),
-                    "policies": list(set(rule.get("policies", []))),
+                    "policies": sorted(set(rule.get("policies", []))),
                     "community_annotations": rule.get("community_annotations", []),
                     "mitigation": rule.get("mitigation", "manual"),
                 }
+                conf_id = get_hash([conf_obj, rule["prefixes"]])
+                if conf_id in rules:
+                    continue
+                conf_obj["conf_id"] = conf_id
+                # prefix ranges (RFC2622) are stored as-is and matched at lookup time;
+                # they are checked here, before any change is applied
                 for prefix in rule["prefixes"]:
-                    for translated_prefix in translate_rfc2622(prefix):
-                        ip_version = get_ip_version(translated_prefix)
-                        if prefix_tree[ip_version].has_key(translated_prefix):
-                            node = prefix_tree[ip_version][translated_prefix]
-                        else:
-                            node = {
-                                "prefix": translated_prefix,
-                                "data": {"confs": []},
-                                "timestamp": config["timestamp"],
-                            }
-                            prefix_tree[ip_version].insert(translated_prefix, node)
-                        node["data"]["confs"].append(conf_obj)
-
-            # calculate the monitored and configured prefixes
-            configured_prefix_count = 0
-            monitored_prefixes = set()
-            for ip_version in prefix_tree:
-                for prefix in prefix_tree[ip_version]:
-                    configured_prefix_count += 1
-                    monitored_prefix = search_worst_prefix(
-                        prefix, prefix_tree[ip_version]
-                    )
-                    if monitored_prefix:
-                        monitored_prefixes.add(monitored_prefix)
+                    rfc2622_to_range(prefix)
+                    get_ip_version(prefix)
+                rules[conf_id] = {"conf": conf_obj, "prefixes": rule["prefixes"]}
+                rule_ranks[conf_id] = len(rule_ranks)
+                config_nodes.append(conf_obj)
+            prefix_tree_changes = diff_rule_sets(
+                configured_rule_sets["prefix_tree"], rules, rule_ranks
+            )
 
             # extract autoignore rules
             autoignore_rules = config.get("autoignore", {})
 
-            # calculate autoignore prefix tree
-            autoignore_prefix_tree = {
-                "v4": pytricia.PyTricia(32),
-                "v6": pytricia.PyTricia(128),
-            }
-
+            # calculate the autoignore prefix rules
+            rules = {}
+            rule_ranks = {}
             for key in autoignore_rules:
-                rule = autoignore_rules[key]
+                rule = {"rule_key": key, "prefixes": autoignore_rules[key]["prefixes"]}
                 for prefix in rule["prefixes"]:
-                    for translated_prefix in translate_rfc2622(prefix):
-                        ip_version = get_ip_version(translated_prefix)
-                        if not autoignore_prefix_tree[ip_version].has_key(
-                            translated_prefix
-                        ):
-                            node = {"prefix": translated_prefix, "rule_key": key}
-                            autoignore_prefix_tree[ip_version].insert(
-                                translated_prefix, node
-                            )
-
-            # note that the object should be picklable (e.g., dict instead of pytricia tree,
-            # see also: https://github.com/jsommers/pytricia/issues/20)
-            shared_memory_locks["prefix_tree"].acquire()
-            dict_prefix_tree = {
-                "v4": pytricia_to_dict(prefix_tree["v4"]),
-                "v6": pytricia_to_dict(prefix_tree["v6"]),
-            }
-            shared_memory_manager_dict["prefix_tree"] = dict_prefix_tree
-            shared_memory_manager_dict["prefix_tree_recalculate"] = True
-            shared_memory_locks["prefix_tree"].release()
-
-            shared_memory_locks["monitored_prefixes"].acquire()
-            shared_memory_manager_dict["monitored_prefixes"] = list(monitored_prefixes)
-            shared_memory_locks["monitored_prefixes"].release()
-
-            shared_memory_locks["configured_prefix_count"].acquire()
-            shared_memory_manager_dict[
-                "configured_prefix_count"
-            ] = configured_prefix_count
-            shared_memory_locks["configured_prefix_count"].release()
-
-            # note that the object should be picklable (e.g., dict instead of pytricia tree,
-            # see also: https://github.com/jsommers/pytricia/issues/20)
-            dict_autoignore_prefix_tree = {
-                "v4": pytricia_to_dict(autoignore_prefix_tree["v4"]),
-                "v6": pytricia_to_dict(autoignore_prefix_tree["v6"]),
-            }
-            shared_memory_locks["autoignore"].acquire()
-            shared_memory_manager_dict["autoignore_rules"] = autoignore_rules
-            shared_memory_manager_dict[
-                "autoignore_prefix_tree"
-            ] = dict_autoignore_prefix_tree
-            shared_memory_manager_dict["autoignore_recalculate"] = True
-            shared_memory_locks["autoignore"].release()
+                    rfc2622_to_range(prefix)
+                    get_ip_version(prefix)
+                rule_id = get_hash(rule)
+                rules[rule_id] = rule
+                rule_ranks[rule_id] = len(rule_ranks)
+            autoignore_prefix_tree_changes = diff_rule_sets(
+                configured_rule_sets["autoignore_prefix_tree"], rules, rule_ranks
+            )
+
+            # register the configuration nodes of this version (and keep a few older
+            # ones for messages that are still in flight) before publishing any
+            # tree, so that every node stamped with it can be resolved
+            shared_memory_locks["config_nodes"].acquire()
+            registry = dict(shared_memory_manager_dict["config_nodes"])
+            registry[get_config_version(config["timestamp"])] = config_nodes
+            for config_version in sorted(registry, key=float)[:-CONFIG_NODES_HISTORY]:
+                del registry[config_version]
+            shared_memory_manager_dict["config_nodes"] = registry
+            shared_memory_locks["config_nodes"].release()
 
             shared_memory_locks["config_timestamp"].acquire()
             shared_memory_manager_dict["config_timestamp"] = config["timestamp"]
             shared_memory_locks["config_timestamp"].release()
 
+            # only the changed rules are applied and published (the version is
+            # bumped in any case, for the new configuration timestamp)
+            publish_rule_changes(
+                shared_memory_manager_dict,
+                "prefix_tree",
+                prefix_tree_changes,
+                config["timestamp"],
+            )
+
+            if prefix_tree_changes["remove"] or prefix_tree_changes["add"]:
+                prefix_tree = configured_rule_sets["prefix_tree"]["tree"]
+
+                # calculate the monitored prefixes
+                monitored_prefixes = set()
+                # distinct (base prefix, min length, max length) ranges
+                configured_prefix_count = 0
+                for ip_version in prefix_tree:
+                    for prefix in prefix_tree[ip_version]:
+                        monitored_prefix = search_worst_prefix(
+                            prefix, prefix_tree[ip_version]
+                        )
+                        if monitored_prefix:
+                            monitored_prefixes.add(monitored_prefix)
+                        configured_prefix_count += len(
+                            {
+                                (range_entry["min_length"], range_entry["max_length"])
+                                for range_entry in prefix_tree[ip_version][prefix][
+                                    "ranges"
+                                ]
+                            }
+                        )
+
+                shared_memory_locks["monitored_prefixes"].acquire()
+                shared_memory_manager_dict["monitored_prefixes"] = list(
+                    monitored_prefixes
+                )
+                shared_memory_locks["monitored_prefixes"].release()
+
+                shared_memory_locks["configured_prefix_count"].acquire()
+                shared_memory_manager_dict[
+                    "configured_prefix_count"
+                ] = configured_prefix_count
+                shared_memory_locks["configured_prefix_count"].release()
+
+            shared_memory_locks["autoignore"].acquire()
+            shared_memory_manager_dict["autoignore_rules"] = autoignore_rules
+            shared_memory_locks["autoignore"].release()
+            publish_rule_changes(
+                shared_memory_manager_dict,
+                "autoignore_prefix_tree",
+                autoignore_prefix_tree_changes,
+                config["timestamp"],
+            )
+
         shared_memory_locks["service_reconfiguring"].acquire()
         shared_memory_manager_dict["service_reconfiguring"] = False
         shared_memory_locks["service_reconfiguring"].release()
         return {"success": True, "message": "configured"}
     except Exception:
         log.exception("exception")
+        # the timestamp is registered before the trees are published;
+        # roll it back so that the same configuration can be retried
+        if config_timestamp is not None:
+            shared_memory_locks["config_timestamp"].acquire()
+            shared_memory_manager_dict["config_timestamp"] = config_timestamp
+            shared_memory_locks["config_timestamp"].release()
         shared_memory_locks["service_reconfiguring"].acquire()
         shared_memory_manager_dict["service_reconfiguring"] = False
         shared_memory_locks["service_reconfiguring"].release()
         return {"success": False, "message": "error during service configuration"}
 
 
-class ConfigHandler(RequestHandler):
+class ConfigHandler(BlockingRequestHandler):
     """
     REST request handler for configuration.
     """
 
+    max_concurrency = 1
+
     def initialize(self, shared_memory_manager_dict):
         self.shared_memory_manager_dict = shared_memory_manager_dict
 
@@ -217,7 +456,7 @@ class ConfigHandler(RequestHandler):
                 "v4": <dict>,
                 "v6": <dict>
             },
-            "prefix_tree_recalculate": <bool>,
+            "prefix_tree_version": <int>,
             "monitored_prefixes": <list>,
             "configured_prefix_count": <int>,
             "autoignore_rules": <dict>,
@@ -225,16 +464,20 @@ class ConfigHandler(RequestHandler):
                 "v4": <dict>,
                 "v6": <dict>
             },
-            "autoignore_recalculate": <bool>,
+            "autoignore_prefix_tree_version": <int>,
             "config_timestamp": <timestamp>
         }
         """
         ret_dict = {}
 
-        ret_dict["prefix_tree"] = self.shared_memory_manager_dict["prefix_tree"]
-        ret_dict["prefix_tree_recalculate"] = self.shared_memory_manager_dict[
-            "prefix_tree_recalculate"
-        ]
+        shared_memory_locks["prefix_tree"].acquire()
+        prefix_tree = configured_rule_sets["prefix_tree"]["tree"]
+        ret_dict["prefix_tree"] = {
+            "v4": pytricia_to_dict(prefix_tree["v4"]),
+            "v6": pytricia_to_dict(prefix_tree["v6"]),
+        }
+        shared_memory_locks["prefix_tree"].release()
+        ret_dict["prefix_tree_version"] = shared_tree_versions["prefix_tree"].value
 
         ret_dict["monitored_prefixes"] = self.shared_memory_manager_dict[
             "monitored_prefixes"
@@ -247,12 +490,16 @@ class ConfigHandler(RequestHandler):
         ret_dict["autoignore_rules"] = self.shared_memory_manager_dict[
             "autoignore_rules"
         ]
-        ret_dict["autoignore_prefix_tree"] = self.shared_memory_manager_dict[
+        shared_memory_locks["autoignore"].acquire()
+        autoignore_prefix_tree = configured_rule_sets["autoignore_prefix_tree"]["tree"]
+        ret_dict["autoignore_prefix_tree"] = {
+            "v4": pytricia_to_dict(autoignore_prefix_tree["v4"]),
+            "v6": pytricia_to_dict(autoignore_prefix_tree["v6"]),
+        }
+        shared_memory_locks["autoignore"].release()
+        ret_dict["autoignore_prefix_tree_version"] = shared_tree_versions[
             "autoignore_prefix_tree"
-        ]
-        ret_dict["autoignore_recalculate"] = self.shared_memory_manager_dict[
-            "autoignore_recalculate"
-        ]
+        ].value
 
         ret_dict["config_timestamp"] = self.shared_memory_manager_dict[
             "config_timestamp"
@@ -274,6 +521,45 @@ class ConfigHandler(RequestHandler):
             )
 
 
+class ConfigNodesHandler(RequestHandler):
+    """
+    REST request handler for configuration nodes (rule confs) of a configuration version.
+    """
+
+    def initialize(self, shared_memory_manager_dict):
+        self.shared_memory_manager_dict = shared_memory_manager_dict
+
+    def get(self):
+        """
+        Provides the configuration nodes, indexed by their "conf_id", of the configuration
+        with the requested timestamp (or of the current one, if no timestamp is given).
+        Format:
+        {
+            "success": True | False,
+            "config_timestamp": <timestamp>,
+            "confs": <list>
+        }
+        """
+        config_timestamp = self.get_query_argument(
+            "timestamp", self.shared_memory_manager_dict["config_timestamp"]
+        )
+        try:
+            confs = self.shared_memory_manager_dict["config_nodes"][
+                get_config_version(config_timestamp)
+            ]
+            self.write(
+                {
+                    "success": True,
+                    "config_timestamp": float(config_timestamp),
+                    "confs": confs,
+                }
+            )
+        except Exception:
+            self.write(
+                {"success": False, "config_timestamp": config_timestamp, "confs": []}
+            )
+
+
 class HealthHandler(RequestHandler):
     """
     REST request handler for health checks.
@@ -302,8 +588,9 @@ class ControlHandler(RequestHandler):
     REST request handler for control commands.
     """
 
-    def initialize(self, shared_memory_manager_dict):
+    def initialize(self, shared_memory_manager_dict, data_worker_launcher):
         self.shared_memory_manager_dict = shared_memory_manager_dict
+        self.data_worker_launcher = data_worker_launcher
 
     def start_data_worker(self):
         shared_memory_locks["data_worker"].acquire()
@@ -312,17 +599,18 @@ class ControlHandler(RequestHandler):
             shared_memory_locks["data_worker"].release()
             return "already running"
         shared_memory_locks["data_worker"].release()
-        mp.Process(target=self.run_data_worker_process).start()
+        self.data_worker_launcher.launch()
         return "instructed to start"
 
-    def run_data_worker_process(self):
+    @staticmethod
+    def run_data_worker_process(shared_memory_manager_dict):
         try:
             with Connection(RABBITMQ_URI) as connection:
                 shared_memory_locks["data_worker"].acquire()
                 data_worker = PrefixTreeDataWorker(
-                    connection, self.shared_memory_manager_dict
+                    connection, shared_memory_manager_dict
                 )
-                self.shared_memory_manager_dict["data_worker_running"] = True
+                shared_memory_manager_dict["data_worker_running"] = True
                 shared_memory_locks["data_worker"].release()
                 log.info("data worker started")
                 data_worker.run()
@@ -330,7 +618,7 @@ class ControlHandler(RequestHandler):
             log.exception("exception")
         finally:
             shared_memory_locks["data_worker"].acquire()
-            self.shared_memory_manager_dict["data_worker_running"] = False
+            shared_memory_manager_dict["data_worker_running"] = False
             shared_memory_locks["data_worker"].release()
             log.info("data worker stopped")
 
@@ -433,14 +721,31 @@ class PrefixTree:
         self.shared_memory_manager_dict = shared_memory_manager.dict()
         self.shared_memory_manager_dict["data_worker_running"] = False
         self.shared_memory_manager_dict["service_reconfiguring"] = False
-        self.shared_memory_manager_dict["prefix_tree"] = {"v4": {}, "v6": {}}
-        self.shared_memory_manager_dict["prefix_tree_recalculate"] = True
+        # per-rule (nested) dicts, so that only the changed rules are transferred
+        self.shared_memory_manager_dict[
+            "prefix_tree_rules"
+        ] = shared_memory_manager.dict()
+        self.shared_memory_manager_dict[
+            "prefix_tree_rule_ranks"
+        ] = shared_memory_manager.dict()
+        self.shared_memory_manager_dict["prefix_tree_deltas"] = {}
         self.shared_memory_manager_dict["monitored_prefixes"] = list()
         self.shared_memory_manager_dict["configured_prefix_count"] = 0
         self.shared_memory_manager_dict["autoignore_rules"] = {}
-        self.shared_memory_manager_dict["autoignore_prefix_tree"] = {"v4": {}, "v6": {}}
-        self.shared_memory_manager_dict["autoignore_recalculate"] = True
+        self.shared_memory_manager_dict[
+            "autoignore_prefix_tree_rules"
+        ] = shared_memory_manager.dict()
+        self.shared_memory_manager_dict[
+            "autoignore_prefix_tree_rule_ranks"
+        ] = shared_memory_manager.dict()
+        self.shared_memory_manager_dict["autoignore_prefix_tree_deltas"] = {}
         self.shared_memory_manager_dict["config_timestamp"] = -1
+        self.shared_memory_manager_dict["config_nodes"] = {}
+
+        # data workers are started via a helper process (see ProcessLauncher)
+        self.data_worker_launcher = ProcessLauncher(
+            ControlHandler.run_data_worker_process, self.shared_memory_manager_dict
+        )
 
         log.info("service initiated")
 
@@ -452,16 +757,25 @@ class PrefixTree:
                     ConfigHandler,
                     dict(shared_memory_manager_dict=self.shared_memory_manager_dict),
                 ),
+                (
+                    "/configNodes",
+                    ConfigNodesHandler,
+                    dict(shared_memory_manager_dict=self.shared_memory_manager_dict),
+                ),
                 (
                     "/control",
                     ControlHandler,
-                    dict(shared_memory_manager_dict=self.shared_memory_manager_dict),
+                    dict(
+                        shared_memory_manager_dict=self.shared_memory_manager_dict,
+                        data_worker_launcher=self.data_worker_launcher,
+                    ),
                 ),
                 (
                     "/health",
                     HealthHandler,
                     dict(shared_memory_manager_dict=self.shared_memory_manager_dict),
                 ),
+                ("/metrics", RestMetricsHandler),
                 (
                     "/configuredPrefixCount",
                     ConfiguredPrefixCountHandler,
@@ -476,6 +790,8 @@ class PrefixTree:
         )
 
     def start_rest_app(self):
+        # fork the data worker launcher before any REST thread exists
+        self.data_worker_launcher.start()
         app = self.make_rest_app()
         app.listen(REST_PORT)
         log.info("REST worker started and listening to port {}".format(REST_PORT))
@@ -495,45 +811,15 @@ class PrefixTreeDataWorker(ConsumerProducerMixin):
         ping_redis(self.redis)
         self.shared_memory_manager_dict = shared_memory_manager_dict
 
-        self.prefix_tree = {"v4": pytricia.PyTricia(32), "v6": pytricia.PyTricia(128)}
-        shared_memory_locks["prefix_tree"].acquire()
-        if self.shared_memory_manager_dict["prefix_tree_recalculate"]:
-            for ip_version in ["v4", "v6"]:
-                if ip_version == "v4":
-                    size = 32
-                else:
-                    size = 128
-                self.prefix_tree[ip_version] = dict_to_pytricia(
-                    self.shared_memory_manager_dict["prefix_tree"][ip_version], size
-                )
-                log.info(
-                    "{} pytricia tree parsed from configuration".format(ip_version)
-                )
-                self.shared_memory_manager_dict["prefix_tree_recalculate"] = False
-        shared_memory_locks["prefix_tree"].release()
-
-        self.autoignore_prefix_tree = {
-            "v4": pytricia.PyTricia(32),
-            "v6": pytricia.PyTricia(128),
+        # local rule sets (and trees), kept up to date with the configured versions
+        self.rule_sets = {
+            "prefix_tree": new_rule_set(),
+            "autoignore_prefix_tree": new_rule_set(),
         }
-        shared_memory_locks["autoignore"].acquire()
-        if self.shared_memory_manager_dict["autoignore_recalculate"]:
-            for ip_version in ["v4", "v6"]:
-                if ip_version == "v4":
-                    size = 32
-                else:
-                    size = 128
-                self.autoignore_prefix_tree[ip_version] = dict_to_pytricia(
-                    self.shared_memory_manager_dict["autoignore_prefix_tree"][
-                        ip_version
-                    ],
-                    size,
-                )
-                log.info(
-                    "{} pytricia tree parsed from configuration".format(ip_version)
-                )
-                self.shared_memory_manager_dict["autoignore_recalculate"] = False
-        shared_memory_locks["autoignore"].release()
+        self.tree_versions = {"prefix_tree": -1, "autoignore_prefix_tree": -1}
+        self.tree_timestamps = {"prefix_tree": -1, "autoignore_prefix_tree": -1}
+        self.sync_prefix_tree("prefix_tree")
+        self.sync_prefix_tree("autoignore_prefix_tree")
 
         # EXCHANGES
         self.update_exchange = create_exchange("bgp-update", connection, declare=True)
@@ -549,6 +835,12 @@ class PrefixTreeDataWorker(ConsumerProducerMixin):
             "autoignore", connection, declare=True
         )
         self.command_exchange = create_exchange("command", connection, declare=True)
+        self.detection_hashing = create_exchange(
+            "detection-hashing", connection, "x-consistent-hash", declare=True
+        )
+
+        # (optionally) batched publishing of bgp updates
+        self.update_publisher = UpdateBatchPublisher()
 
         # QUEUES
         self.update_queue = create_queue(
@@ -610,7 +902,7 @@ class PrefixTreeDataWorker(ConsumerProducerMixin):
                 queues=[self.update_queue],
                 on_message=self.annotate_bgp_update,
                 prefetch_count=100,
-                accept=["ujson"],
+                accept=accepted_wire_formats(self.update_exchange),
             ),
             Consumer(
                 queues=[self.hijack_ongoing_queue],
@@ -656,49 +948,101 @@ class PrefixTreeDataWorker(ConsumerProducerMixin):
             ),
         ]
 
-    def find_prefix_node(self, prefix):
-        ip_version = get_ip_version(prefix)
-        prefix_node = None
-        shared_memory_locks["prefix_tree"].acquire()
-        if ip_version == "v4":
-            size = 32
+    def sync_prefix_tree(self, tree_name):
+        """
+        Bring a local tree up to date with the latest configured version,
+        applying the rule changes of the newer versions in place (or rebuilding
+        it from the full rule set if it has fallen too far behind).
+        Cheap (no locks or IPC) when the local tree is already up to date.
+        """
+        if shared_tree_versions[tree_name].value == self.tree_versions[tree_name]:
+            return
+        shared_memory_locks[SHARED_TREE_LOCKS[tree_name]].acquire()
+        deltas = self.shared_memory_manager_dict["{}_deltas".format(tree_name)]
+        rules = None
+        if self.tree_versions[tree_name] + 1 not in deltas:
+            rules = self.shared_memory_manager_dict["{}_rules".format(tree_name)].copy()
+            rule_ranks = self.shared_memory_manager_dict[
+                "{}_rule_ranks".format(tree_name)
+            ].copy()
+        shared_memory_locks[SHARED_TREE_LOCKS[tree_name]].release()
+        # the deltas are read along with the rules, so they tell their version
+        # (which may already be newer than the one that triggered the update)
+        version = max(deltas, default=0)
+
+        if rules is None:
+            for delta_version in range(self.tree_versions[tree_name] + 1, version + 1):
+                apply_rule_changes(self.rule_sets[tree_name], deltas[delta_version])
+            log.info("{} updated in place to version {}".format(tree_name, version))
         else:
-            size = 128
-        # need to turn to pytricia tree since this means that the tree has changed due to re-configuration
-        if self.shared_memory_manager_dict["prefix_tree_recalculate"]:
-            self.prefix_tree[ip_version] = dict_to_pytricia(
-                self.shared_memory_manager_dict["prefix_tree"][ip_version], size
+            rule_set = new_rule_set()
+            apply_rule_changes(
+                rule_set, {"remove": [], "add": rules, "ranks": rule_ranks}
             )
-            log.info("{} pytricia tree re-parsed from configuration".format(ip_version))
-            self.shared_memory_manager_dict["prefix_tree_recalculate"] = False
-        if prefix in self.prefix_tree[ip_version]:
-            prefix_node = self.prefix_tree[ip_version][prefix]
-        shared_memory_locks["prefix_tree"].release()
+            self.rule_sets[tree_name] = rule_set
+            log.info("{} parsed from configuration".format(tree_name))
+        self.tree_versions[tree_name] = version
+        if version in deltas:
+            self.tree_timestamps[tree_name] = deltas[version]["timestamp"]
+
+    def find_matching_rules(self, tree_name, prefix):
+        """
+        Find the best (most specific) configured prefix matching a prefix, along
+        with the (distinct) rules of its matching ranges, in rule order.
+        :return: (<str> best matching prefix, <list> of (<rule ID>, <rule>)),
+        or (None, []) if no range matches
+        """
+        self.sync_prefix_tree(tree_name)
+        rule_set = self.rule_sets[tree_name]
+        matched_prefix, range_entries = lookup_prefix_ranges(
+            rule_set["tree"][get_ip_version(prefix)], prefix
+        )
+        # rules in configuration order, as if all the ranges were expanded
+        rule_ids = sorted(
+            {range_entry["rule_id"] for range_entry in range_entries},
+            key=rule_set["rule_ranks"].get,
+        )
+        return (
+            matched_prefix,
+            [(rule_id, rule_set["rules"][rule_id]) for rule_id in rule_ids],
+        )
+
+    def find_prefix_node(self, prefix):
+        prefix_node = None
+        matched_prefix, matching_rules = self.find_matching_rules("prefix_tree", prefix)
+        if matched_prefix:
+            prefix_node = {
+                "prefix": matched_prefix,
+                "data": {"confs": [rule["conf"] for _, rule in matching_rules]},
+                "conf_ids": [rule_id for rule_id, _ in matching_rules],
+                "timestamp": self.tree_timestamps["prefix_tree"],
+            }
         return prefix_node
 
+    @staticmethod
+    def compact_prefix_node(prefix_node):
+        """
+        Reference form of a prefix node that is attached to published messages;
+        consumers resolve the confs from the "/configNodes" registry of the
+        configuration version (timestamp) instead of receiving them in every message.
+        """
+        return {
+            "prefix": prefix_node["prefix"],
+            "conf_ids": prefix_node["conf_ids"],
+            "timestamp": prefix_node["timestamp"],
+        }
+
     def find_autoignore_prefix_node(self, prefix):
-        ip_version = get_ip_version(prefix)
         prefix_node = None
-        shared_memory_locks["autoignore"].acquire()
-        if ip_version == "v4":
-            size = 32
-        else:
-            size = 128
-        # need to turn to pytricia tree since this means that the tree has changed due to re-configuration
-        if self.shared_memory_manager_dict["autoignore_recalculate"]:
-            self.autoignore_prefix_tree[ip_version] = dict_to_pytricia(
-                self.shared_memory_manager_dict["autoignore_prefix_tree"][ip_version],
-                size,
-            )
-            log.info(
-                "{} autoignore pytricia tree re-parsed from configuration".format(
-                    ip_version
-                )
-            )
-            self.shared_memory_manager_dict["autoignore_recalculate"] = False
-        if prefix in self.autoignore_prefix_tree[ip_version]:
-            prefix_node = self.autoignore_prefix_tree[ip_version][prefix]
-        shared_memory_locks["autoignore"].release()
+        matched_prefix, matching_rules = self.find_matching_rules(
+            "autoignore_prefix_tree", prefix
+        )
+        if matched_prefix:
+            # the first matching rule wins, as if all the ranges were expanded
+            prefix_node = {
+                "prefix": matched_prefix,
+                "rule_key": matching_rules[0][1]["rule_key"],
+            }
         return prefix_node
 
     def annotate_bgp_update(self, message: Dict) -> NoReturn:
@@ -707,21 +1051,29 @@ class PrefixTreeDataWorker(ConsumerProducerMixin):
         configuration node (otherwise it discards it).
         """
         message.ack()
-        bgp_update = message.payload
         try:
-            prefix_node = self.find_prefix_node(bgp_update["prefix"])
-            if prefix_node:
-                bgp_update["prefix_node"] = prefix_node
-                self.producer.publish(
-                    bgp_update,
-                    exchange=self.update_exchange,
-                    routing_key="update-with-prefix-node",
-                    serializer="ujson",
-                )
-            else:
-                log.warning("unconfigured BGP update received '{}'".format(bgp_update))
+            bgp_updates = unpack_update_envelope(message.payload)
         except Exception:
             log.exception("exception")
+            return
+        for bgp_update in bgp_updates:
+            try:
+                prefix_node = self.find_prefix_node(bgp_update["prefix"])
+                if prefix_node:
+                    bgp_update["prefix_node"] = self.compact_prefix_node(prefix_node)
+                    self.update_publisher.publish(
+                        self.producer,
+                        bgp_update,
+                        exchange=self.update_exchange,
+                        routing_key="update-with-prefix-node",
+                        serializer=wire_format(self.update_exchange),
+                    )
+                else:
+                    log.warning(
+                        "unconfigured BGP update received '{}'".format(bgp_update)
+                    )
+            except Exception:
+                log.exception("exception")
 
     def annotate_stored_bgp_update(self, message: Dict) -> NoReturn:
         """
@@ -733,13 +1085,24 @@ class PrefixTreeDataWorker(ConsumerProducerMixin):
         try:
             prefix_node = self.find_prefix_node(bgp_update["prefix"])
             if prefix_node:
-                bgp_update["prefix_node"] = prefix_node
-                self.producer.publish(
-                    bgp_update,
-                    exchange=self.update_exchange,
-                    routing_key="stored-update-with-prefix-node",
-                    serializer="ujson",
-                )
+                bgp_update["prefix_node"] = self.compact_prefix_node(prefix_node)
+                if DETECTION_PARTITIONED == "true":
+                    # partition detection by matched configured prefix
+                    self.update_publisher.publish(
+                        self.producer,
+                        bgp_update,
+                        exchange=self.detection_hashing,
+                        routing_key=prefix_node["prefix"],
+                        serializer=wire_format(self.detection_hashing),
+                    )
+                else:
+                    self.update_publisher.publish(
+                        self.producer,
+                        bgp_update,
+                        exchange=self.update_exchange,
+                        routing_key="stored-update-with-prefix-node",
+                        serializer=wire_format(self.update_exchange),
+                    )
             else:
                 log.warning(
                     "unconfigured stored BGP update received '{}'".format(bgp_update)
@@ -758,10 +1121,24 @@ class PrefixTreeDataWorker(ConsumerProducerMixin):
             try:
                 prefix_node = self.find_prefix_node(bgp_update["prefix"])
                 if prefix_node:
-                    bgp_update["prefix_node"] = prefix_node
+                    bgp_update["prefix_node"] = self.compact_prefix_node(prefix_node)
                 bgp_updates.append(bgp_update)
             except Exception:
                 log.exception("exception")
+        if DETECTION_PARTITIONED == "true":
+            # partition detection by matched configured prefix
+            partitioned_bgp_updates = {}
+            for bgp_update in bgp_updates:
+                partition_key = bgp_update.get("prefix_node", bgp_update)["prefix"]
+                partitioned_bgp_updates.setdefault(partition_key, []).append(bgp_update)
+            for partition_key, partition_bgp_updates in partitioned_bgp_updates.items():
+                self.producer.publish(
+                    partition_bgp_updates,
+                    exchange=self.detection_hashing,
+                    routing_key=partition_key,
+                    serializer=wire_format(self.detection_hashing),
+                )
+            return
         self.producer.publish(
             bgp_updates,
             exchange=self.hijack_exchange,
@@ -914,6 +1291,16 @@ class PrefixTreeDataWorker(ConsumerProducerMixin):
             serializer="ujson",
         )
 
+    def on_iteration(self):
+        self.update_publisher.flush(self.producer, expired_only=True)
+
+    def on_consume_end(self, connection, channel):
+        try:
+            self.update_publisher.flush(self.producer)
+        except Exception:
+            log.exception("exception")
+        super().on_consume_end(connection, channel)
+
     def stop_consumer_loop(self, message: Dict) -> NoReturn:
         """
         Callback function that stop the current consumer loop
@@ -1,8 +1,14 @@
+import collections
 import csv
+import functools
 import glob
+import heapq
+import itertools
 import multiprocessing as mp
 import os
+import shutil
 import signal
+import tempfile
 import time
 
 import pytricia
@@ -10,13 +16,21 @@ import requests
 import ujson as json
 from artemis_utils import get_ip_version
 from artemis_utils import get_logger
+from artemis_utils.archive import ARCHIVE_EXTENSION
+from artemis_utils.archive import ArchiveReader
 from artemis_utils.constants import CONFIGURATION_HOST
 from artemis_utils.constants import DATABASE_HOST
 from artemis_utils.constants import MAX_DATA_WORKER_WAIT_TIMEOUT
 from artemis_utils.constants import PREFIXTREE_HOST
+from artemis_utils.envvars import HISTORICAL_REPLAY_MODE
+from artemis_utils.envvars import HISTORICAL_REPLAY_RATE
+from artemis_utils.envvars import HISTORICAL_REPLAY_SPEEDUP
 from artemis_utils.envvars import RABBITMQ_URI
 from artemis_utils.envvars import REST_PORT
 from artemis_utils.rabbitmq import create_exchange
+from artemis_utils.rabbitmq import UpdateBatchPublisher
+from artemis_utils.rabbitmq import wire_format
+from artemis_utils.rest import RestMetricsHandler
 from artemis_utils.updates import key_generator
 from artemis_utils.updates import MformatValidator
 from artemis_utils.updates import normalize_msg_path
@@ -40,6 +54,190 @@ shared_memory_locks = {
 
 # global vars
 SERVICE_NAME = "bgpstreamhisttap"
+PARSER_PROCESSES = 4
+# files parsed ahead of publishing ("fast" and "rate" replay modes)
+PARSER_PENDING_FILES = PARSER_PROCESSES
+REPLAY_BATCH_SIZE = 1000
+REPLAY_MAX_QUEUE_DEPTH = 50000
+REPLAY_BACKPRESSURE_INTERVAL = 0.1
+REPLAY_BACKPRESSURE_QUEUE = "prefixtree.bgp-update.update"
+
+# per parser process state, set up by init_hist_parser
+parser_state = {}
+
+
+def init_hist_parser(prefixes):
+    # build monitored prefix tree
+    prefix_tree = {"v4": pytricia.PyTricia(32), "v6": pytricia.PyTricia(128)}
+    for prefix in prefixes:
+        ip_version = get_ip_version(prefix)
+        prefix_tree[ip_version].insert(prefix, "")
+    parser_state["prefix_tree"] = prefix_tree
+    parser_state["validator"] = MformatValidator()
+
+
+def is_monitored(prefix):
+    return prefix in parser_state["prefix_tree"][get_ip_version(prefix)]
+
+
+def read_hist_csv(csv_file):
+    """
+    Yields the BGP updates of a historical CSV file on the monitored prefixes.
+    """
+    with open(csv_file, "r") as f:
+        csv_reader = csv.reader(f, delimiter="|")
+        for row in csv_reader:
+            try:
+                if len(row) != 9:
+                    continue
+                if row[0].startswith("#"):
+                    continue
+                # example row: 139.91.0.0/16|8522|1403|1403 6461 2603 21320
+                # 5408
+                # 8522|routeviews|route-views2|A|"[{""asn"":1403,""value"":6461}]"|1517446677
+                this_prefix = row[0]
+                if not is_monitored(this_prefix):
+                    continue
+                if row[6] == "A":
+                    as_path = row[3].split(" ")
+                    communities = json.loads(row[7])
+                else:
+                    as_path = []
+                    communities = []
+                yield {
+                    "type": row[6],
+                    "timestamp": float(row[8]),
+                    "path": as_path,
+                    "service": "historical|{}|{}".format(row[4], row[5]),
+                    "communities": communities,
+                    "prefix": this_prefix,
+                    "peer_asn": int(row[2]),
+                }
+            except Exception:
+                log.exception("row")
+
+
+def read_hist_archive(archive_file):
+    """
+    Yields the BGP updates of a historical archive on the monitored prefixes;
+    the records of non-monitored prefixes are skipped via the archive prefix index.
+    """
+    with ArchiveReader(archive_file) as archive:
+        for record in archive.records(prefix_filter=is_monitored):
+            if record["type"] == "A":
+                as_path = record["path"].split(" ")
+                communities = record["communities"]
+            else:
+                as_path = []
+                communities = []
+            yield {
+                "type": record["type"],
+                "timestamp": record["timestamp"],
+                "path": as_path,
+                "service": "historical|{}|{}".format(
+                    record["project"], record["collector"]
+                ),
+                "communities": communities,
+                "prefix": record["prefix"],
+                "peer_asn": record["peer_asn"],
+            }
+
+
+def parse_hist_file(hist_file):
+    """
+    Parses a historical (CSV or archive) file into keyed, normalized BGP updates
+    on the monitored prefixes (sorted by timestamp in "timestamp" replay mode).
+    """
+    validator = parser_state["validator"]
+    msgs = []
+    try:
+        if hist_file.endswith(ARCHIVE_EXTENSION):
+            hist_msgs = read_hist_archive(hist_file)
+        else:
+            hist_msgs = read_hist_csv(hist_file)
+        for msg in hist_msgs:
+            try:
+                if validator.validate(msg):
+                    for norm_msg in normalize_msg_path(msg):
+                        key_generator(norm_msg)
+                        msgs.append(norm_msg)
+                else:
+                    log.warning("Invalid format message: {}".format(msg))
+            except BaseException:
+                log.exception("Error when normalizing BGP message: {}".format(msg))
+    except Exception:
+        log.exception("exception")
+    if HISTORICAL_REPLAY_MODE == "timestamp":
+        msgs.sort(key=lambda msg: msg["timestamp"])
+    return msgs
+
+
+def parse_hist_files(parser_pool, hist_files):
+    """
+    Yields the parsed BGP updates of historical files (in file order), with at most
+    PARSER_PENDING_FILES files being parsed (or waiting to be consumed) at a time,
+    so that parsing does not run ahead of publishing.
+    """
+    hist_files = iter(hist_files)
+    pending = collections.deque(
+        parser_pool.apply_async(parse_hist_file, (hist_file,))
+        for hist_file in itertools.islice(hist_files, PARSER_PENDING_FILES)
+    )
+    while pending:
+        msgs = pending.popleft().get()
+        for hist_file in itertools.islice(hist_files, 1):
+            pending.append(parser_pool.apply_async(parse_hist_file, (hist_file,)))
+        yield from msgs
+
+
+def spill_hist_file(spill_dir, hist_file):
+    """
+    Parses a historical file into its (timestamp-sorted) BGP updates and spills
+    them to a file (one JSON update per line), so that the files can be merged
+    lazily into a single timeline.
+    :return: <str> path of the spill file
+    """
+    spill_file = os.path.join(spill_dir, "{}.json".format(os.path.basename(hist_file)))
+    with open(spill_file, "w") as f:
+        for msg in parse_hist_file(hist_file):
+            f.write(json.dumps(msg))
+            f.write("\n")
+    return spill_file
+
+
+def read_spill_file(spill_file):
+    with open(spill_file, "r") as f:
+        for line in f:
+            yield json.loads(line)
+
+
+class TokenBucket:
+    """
+    Token bucket rate limiter (rate tokens/sec, up to capacity tokens in bursts).
+    """
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.last_refill = time.time()
+
+    def consume(self, tokens, sleep=time.sleep):
+        """
+        Waits (via the given sleep function) until the tokens are available.
+        :return: False if the sleep function was interrupted, True otherwise
+        """
+        while True:
+            now = time.time()
+            self.tokens = min(
+                self.capacity, self.tokens + (now - self.last_refill) * self.rate
+            )
+            self.last_refill = now
+            if self.tokens >= tokens:
+                self.tokens -= tokens
+                return True
+            if sleep((tokens - self.tokens) / self.rate) is False:
+                return False
 
 
 def start_data_worker(shared_memory_manager_dict):
@@ -342,6 +540,7 @@ class BGPStreamHistTap:
                     HealthHandler,
                     dict(shared_memory_manager_dict=self.shared_memory_manager_dict),
                 ),
+                ("/metrics", RestMetricsHandler),
             ]
         )
 
@@ -362,6 +561,8 @@ class BGPStreamHistDataWorker:
         self.shared_memory_manager_dict = shared_memory_manager_dict
         self.prefixes = self.shared_memory_manager_dict["monitored_prefixes"]
         self.input_dir = shared_memory_manager_dict["input_dir"]
+        self.queue_depth_channel = None
+        self.update_publisher = UpdateBatchPublisher()
 
         # EXCHANGES
         self.update_exchange = create_exchange(
@@ -371,85 +572,43 @@ class BGPStreamHistDataWorker:
         log.info("data worker initiated")
 
     def run(self):
-        # build monitored prefix tree
-        prefix_tree = {"v4": pytricia.PyTricia(32), "v6": pytricia.PyTricia(128)}
-        for prefix in self.prefixes:
-            ip_version = get_ip_version(prefix)
-            prefix_tree[ip_version].insert(prefix, "")
-
-        # start producing
-        validator = MformatValidator()
-        with Producer(self.connection) as producer:
-            for csv_file in glob.glob("{}/*.csv".format(self.input_dir)):
-                if not self.shared_memory_manager_dict["data_worker_should_run"]:
-                    break
-
-                try:
-                    with open(csv_file, "r") as f:
-                        csv_reader = csv.reader(f, delimiter="|")
-                        for row in csv_reader:
-                            if not self.shared_memory_manager_dict[
-                                "data_worker_should_run"
-                            ]:
-                                break
-
-                            try:
-                                if len(row) != 9:
-                                    continue
-                                if row[0].startswith("#"):
-                                    continue
-                                # example row: 139.91.0.0/16|8522|1403|1403 6461 2603 21320
-                                # 5408
-                                # 8522|routeviews|route-views2|A|"[{""asn"":1403,""value"":6461}]"|1517446677
-                                this_prefix = row[0]
-                                if row[6] == "A":
-                                    as_path = row[3].split(" ")
-                                    communities = json.loads(row[7])
-                                else:
-                                    as_path = []
-                                    communities = []
-                                service = "historical|{}|{}".format(row[4], row[5])
-                                type_ = row[6]
-                                timestamp = float(row[8])
-                                peer_asn = int(row[2])
-                                ip_version = get_ip_version(this_prefix)
-                                if this_prefix in prefix_tree[ip_version]:
-                                    msg = {
-                                        "type": type_,
-                                        "timestamp": timestamp,
-                                        "path": as_path,
-                                        "service": service,
-                                        "communities": communities,
-                                        "prefix": this_prefix,
-                                        "peer_asn": peer_asn,
-                                    }
-                                    try:
-                                        if validator.validate(msg):
-                                            msgs = normalize_msg_path(msg)
-                                            for msg in msgs:
-                                                key_generator(msg)
-                                                log.debug(msg)
-                                                producer.publish(
-                                                    msg,
-                                                    exchange=self.update_exchange,
-                                                    routing_key="update",
-                                                    serializer="ujson",
-                                                )
-                                                time.sleep(0.01)
-                                        else:
-                                            log.warning(
-                                                "Invalid format message: {}".format(msg)
-                                            )
-                                    except BaseException:
-                                        log.exception(
-                                            "Error when normalizing BGP message: {}".format(
-                                                msg
-                                            )
-                                        )
-                            except Exception:
-                                log.exception("row")
-                except Exception:
-                    log.exception("exception")
+        hist_files = sorted(
+            glob.glob("{}/*.csv".format(self.input_dir))
+            + glob.glob("{}/*{}".format(self.input_dir, ARCHIVE_EXTENSION))
+        )
+        log.info(
+            "replaying {} files in '{}' mode".format(
+                len(hist_files), HISTORICAL_REPLAY_MODE
+            )
+        )
+
+        # the parsers build their own monitored prefix trees
+        parser_pool = mp.Pool(
+            processes=PARSER_PROCESSES,
+            initializer=init_hist_parser,
+            initargs=(list(self.prefixes),),
+        )
+        spill_dir = tempfile.mkdtemp(prefix="bgpstreamhist-")
+        try:
+            if HISTORICAL_REPLAY_MODE == "timestamp":
+                # replay all files as a single timeline, merged lazily from the
+                # (sorted) spill files instead of holding all updates in memory
+                spill_files = parser_pool.map(
+                    functools.partial(spill_hist_file, spill_dir), hist_files
+                )
+                msgs = heapq.merge(
+                    *map(read_spill_file, spill_files), key=lambda msg: msg["timestamp"]
+                )
+            else:
+                msgs = parse_hist_files(parser_pool, hist_files)
+            with Producer(self.connection) as producer:
+                self.replay(msgs, producer)
+        except Exception:
+            log.exception("exception")
+        finally:
+            parser_pool.terminate()
+            parser_pool.join()
+            shutil.rmtree(spill_dir, ignore_errors=True)
 
         # run until instructed to stop
         while True:
@@ -457,6 +616,97 @@ class BGPStreamHistDataWorker:
                 break
             time.sleep(1)
 
+    def should_run(self):
+        return self.shared_memory_manager_dict["data_worker_should_run"]
+
+    def replay(self, msgs, producer):
+        """
+        Publishes the parsed BGP updates in batches, paced according to the replay mode:
+        "fast" publishes as fast as the consumers keep up, "rate" caps publishing to
+        HISTORICAL_REPLAY_RATE updates/sec (token bucket) and "timestamp" follows the
+        update timestamps, sped up by HISTORICAL_REPLAY_SPEEDUP.
+        """
+        token_bucket = None
+        if HISTORICAL_REPLAY_MODE == "rate":
+            token_bucket = TokenBucket(HISTORICAL_REPLAY_RATE, REPLAY_BATCH_SIZE)
+        replay_start = None
+        batch = []
+        for msg in msgs:
+            if HISTORICAL_REPLAY_MODE == "timestamp":
+                if replay_start is None:
+                    replay_start = (time.time(), msg["timestamp"])
+                delay = (
+                    replay_start[0]
+                    + (msg["timestamp"] - replay_start[1]) / HISTORICAL_REPLAY_SPEEDUP
+                    - time.time()
+                )
+                if delay > 0:
+                    # publish what is due before waiting for the next update
+                    if batch and not self.publish_batch(batch, producer):
+                        return
+                    batch = []
+                    if not self.sleep(delay):
+                        return
+            batch.append(msg)
+            if len(batch) == REPLAY_BATCH_SIZE:
+                if token_bucket and not token_bucket.consume(len(batch), self.sleep):
+                    return
+                if not self.publish_batch(batch, producer):
+                    return
+                batch = []
+        if batch:
+            if token_bucket and not token_bucket.consume(len(batch), self.sleep):
+                return
+            self.publish_batch(batch, producer)
+
+    def publish_batch(self, batch, producer):
+        """
+        Publishes a batch of BGP updates, once the depth of the (prefixtree)
+        BGP update queue allows it.
+        :return: False if the data worker should stop, True otherwise
+        """
+        while self.queue_depth() > REPLAY_MAX_QUEUE_DEPTH:
+            if not self.sleep(REPLAY_BACKPRESSURE_INTERVAL):
+                return False
+        if not self.should_run():
+            return False
+        for msg in batch:
+            log.debug(msg)
+            self.update_publisher.publish(
+                producer,
+                msg,
+                exchange=self.update_exchange,
+                routing_key="update",
+                serializer=wire_format(self.update_exchange),
+            )
+        self.update_publisher.flush(producer)
+        return True
+
+    def queue_depth(self):
+        try:
+            if self.queue_depth_channel is None:
+                self.queue_depth_channel = self.connection.channel()
+            return self.queue_depth_channel.queue_declare(
+                queue=REPLAY_BACKPRESSURE_QUEUE, passive=True
+            ).message_count
+        except Exception:
+            # e.g., the queue is not declared yet; do not throttle
+            self.queue_depth_channel = None
+            return 0
+
+    def sleep(self, duration):
+        """
+        Sleeps for the given duration, while checking if the data worker should stop.
+        :return: False if the data worker should stop, True otherwise
+        """
+        wake_time = time.time() + duration
+        while self.should_run():
+            remaining = wake_time - time.time()
+            if remaining <= 0:
+                return True
+            time.sleep(min(remaining, 1))
+        return False
+
 
 def main():
     # initiate BGPStream Kafka tap service with REST
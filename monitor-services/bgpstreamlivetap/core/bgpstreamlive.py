@@ -15,14 +15,17 @@ from artemis_utils.constants import DATABASE_HOST
 from artemis_utils.constants import MAX_DATA_WORKER_WAIT_TIMEOUT
 from artemis_utils.constants import PREFIXTREE_HOST
 from artemis_utils.constants import START_TIME_OFFSET
-from artemis_utils.envvars import MON_TIMEOUT_LAST_BGP_UPDATE
 from artemis_utils.envvars import RABBITMQ_URI
 from artemis_utils.envvars import REDIS_HOST
 from artemis_utils.envvars import REDIS_PORT
 from artemis_utils.envvars import REST_PORT
 from artemis_utils.rabbitmq import create_exchange
+from artemis_utils.rabbitmq import UpdateBatchPublisher
+from artemis_utils.rabbitmq import wire_format
 from artemis_utils.redis import ping_redis
 from artemis_utils.redis import RedisExpiryChecker
+from artemis_utils.redis import RedisHeartbeat
+from artemis_utils.rest import RestMetricsHandler
 from artemis_utils.updates import key_generator
 from artemis_utils.updates import MformatValidator
 from artemis_utils.updates import normalize_msg_path
@@ -356,6 +359,7 @@ class BGPStreamLiveTap:
                     HealthHandler,
                     dict(shared_memory_manager_dict=self.shared_memory_manager_dict),
                 ),
+                ("/metrics", RestMetricsHandler),
             ]
         )
 
@@ -387,7 +391,8 @@ class BGPStreamLiveDataWorker:
     def run(self):
         # update redis
         ping_redis(redis)
-        redis.set("bgpstreamlive_seen_bgp_update", "1", ex=MON_TIMEOUT_LAST_BGP_UPDATE)
+        self.heartbeat = RedisHeartbeat(redis=redis, monitor="bgpstreamlive")
+        self.heartbeat.start()
 
         # create a new bgpstream instance and a reusable bgprecord instance
         stream = _pybgpstream.BGPStream()
@@ -427,10 +432,13 @@ class BGPStreamLiveDataWorker:
 
         # start producing
         validator = MformatValidator()
+        update_publisher = UpdateBatchPublisher()
         with Producer(self.connection) as producer:
             while True:
                 if not self.shared_memory_manager_dict["data_worker_should_run"]:
+                    update_publisher.flush(producer)
                     break
+                update_publisher.flush(producer, expired_only=True)
 
                 # get next record
                 try:
@@ -452,11 +460,7 @@ class BGPStreamLiveDataWorker:
                         break
 
                     if elem.type in {"A", "W"}:
-                        redis.set(
-                            "bgpstreamlive_seen_bgp_update",
-                            "1",
-                            ex=MON_TIMEOUT_LAST_BGP_UPDATE,
-                        )
+                        self.heartbeat.beat()
                         this_prefix = str(elem.fields["prefix"])
                         service = "bgpstreamlive|{}|{}".format(
                             str(rec.project), str(rec.collector)
@@ -494,11 +498,14 @@ class BGPStreamLiveDataWorker:
                                     for msg in msgs:
                                         key_generator(msg)
                                         log.debug(msg)
-                                        producer.publish(
+                                        update_publisher.publish(
+                                            producer,
                                             msg,
                                             exchange=self.update_exchange,
                                             routing_key="update",
-                                            serializer="ujson",
+                                            serializer=wire_format(
+                                                self.update_exchange
+                                            ),
                                         )
                                 else:
                                     log.warning(
@@ -513,6 +520,8 @@ class BGPStreamLiveDataWorker:
                     except BaseException:
                         continue
 
+        self.heartbeat.stop()
+
 
 def main():
     # initiate BGPStream Live tap service with REST
@@ -11,14 +11,17 @@ from artemis_utils import get_logger
 from artemis_utils.constants import CONFIGURATION_HOST
 from artemis_utils.constants import DATABASE_HOST
 from artemis_utils.constants import PREFIXTREE_HOST
-from artemis_utils.envvars import MON_TIMEOUT_LAST_BGP_UPDATE
 from artemis_utils.envvars import RABBITMQ_URI
 from artemis_utils.envvars import REDIS_HOST
 from artemis_utils.envvars import REDIS_PORT
 from artemis_utils.envvars import REST_PORT
 from artemis_utils.rabbitmq import create_exchange
+from artemis_utils.rabbitmq import UpdateBatchPublisher
+from artemis_utils.rabbitmq import wire_format
 from artemis_utils.redis import ping_redis
 from artemis_utils.redis import RedisExpiryChecker
+from artemis_utils.redis import RedisHeartbeat
+from artemis_utils.rest import RestMetricsHandler
 from artemis_utils.updates import key_generator
 from artemis_utils.updates import MformatValidator
 from artemis_utils.updates import normalize_msg_path
@@ -47,6 +50,8 @@ shared_memory_locks = {
 # global vars
 redis = redis.Redis(host=REDIS_HOST, port=REDIS_PORT)
 AUTOCONF_INTERVAL = 10
+PUBLISH_BATCH_SIZE = 100
+PUBLISH_BATCH_TIMEOUT = 0.5
 SERVICE_NAME = "exabgptap"
 
 
@@ -337,6 +342,7 @@ class ExaBGPTap:
                     HealthHandler,
                     dict(shared_memory_manager_dict=self.shared_memory_manager_dict),
                 ),
+                ("/metrics", RestMetricsHandler),
             ]
         )
 
@@ -484,8 +490,61 @@ class ExaBGPDataWorker:
             # set up message validator
             validator = MformatValidator()
 
+            # set up (per host process) coalesced heartbeat
+            heartbeat = RedisHeartbeat(redis=redis, monitor="exabgp")
+            heartbeat.start()
+
+            # process-local buffers, flushed in micro-batches
+            publish_buffer = []
+            update_publisher = UpdateBatchPublisher()
+            autoconf_buffer = {}
+            last_flush = [time.time()]
+
+            def flush(producer):
+                last_flush[0] = time.time()
+                if publish_buffer:
+                    # (re-)connects to the broker if needed; the messages that are
+                    # not handed over to the publisher are kept for the next flush,
+                    # and the publisher keeps the batches it could not publish
+                    accepted = 0
+                    try:
+                        for msg in publish_buffer:
+                            update_publisher.publish(
+                                producer,
+                                msg,
+                                exchange=self.update_exchange,
+                                routing_key="update",
+                                serializer=wire_format(self.update_exchange),
+                                retry=True,
+                            )
+                            accepted += 1
+                        update_publisher.flush(producer)
+                    finally:
+                        del publish_buffer[:accepted]
+                if autoconf_buffer:
+                    # hand the autoconf updates off to the autoconf updater
+                    shared_memory_locks["autoconf_updates"].acquire()
+                    try:
+                        autoconf_updates = self.shared_memory_manager_dict[
+                            "autoconf_updates"
+                        ]
+                        autoconf_updates.update(autoconf_buffer)
+                        self.shared_memory_manager_dict[
+                            "autoconf_updates"
+                        ] = autoconf_updates
+                        # mark the autoconf BGP updates for configuration
+                        # processing in redis
+                        redis.sadd(
+                            "autoconf-update-keys-to-process", *autoconf_buffer.keys()
+                        )
+                    except Exception:
+                        log.exception("exception")
+                    finally:
+                        shared_memory_locks["autoconf_updates"].release()
+                    autoconf_buffer.clear()
+
             def handle_exabgp_msg(bgp_message):
-                redis.set("exabgp_seen_bgp_update", "1", ex=MON_TIMEOUT_LAST_BGP_UPDATE)
+                heartbeat.beat()
                 msg = {
                     "type": bgp_message["type"],
                     "communities": bgp_message.get("communities", []),
@@ -506,66 +565,57 @@ class ExaBGPDataWorker:
                                 key_generator(msg)
                                 log.debug(msg)
                                 if autoconf:
-                                    try:
-                                        if learn_neighbors:
-                                            msg["learn_neighbors"] = True
-                                        shared_memory_locks[
-                                            "autoconf_updates"
-                                        ].acquire()
-                                        autoconf_updates = self.shared_memory_manager_dict[
-                                            "autoconf_updates"
-                                        ]
-                                        autoconf_updates[msg["key"]] = msg
-                                        self.shared_memory_manager_dict[
-                                            "autoconf_updates"
-                                        ] = autoconf_updates
-                                        # mark the autoconf BGP updates for configuration
-                                        # processing in redis
-                                        redis_pipeline = redis.pipeline()
-                                        redis_pipeline.sadd(
-                                            "autoconf-update-keys-to-process",
-                                            msg["key"],
-                                        )
-                                        redis_pipeline.execute()
-                                    except Exception:
-                                        log.exception("exception")
-                                    finally:
-                                        shared_memory_locks[
-                                            "autoconf_updates"
-                                        ].release()
+                                    if learn_neighbors:
+                                        msg["learn_neighbors"] = True
+                                    autoconf_buffer[msg["key"]] = msg
                                 else:
-                                    with Producer(self.connection) as producer:
-                                        producer.publish(
-                                            msg,
-                                            exchange=self.update_exchange,
-                                            routing_key="update",
-                                            serializer="ujson",
-                                        )
+                                    publish_buffer.append(msg)
                         else:
                             log.warning("Invalid format message: {}".format(msg))
                     except BaseException:
                         log.exception(
                             "Error when normalizing BGP message: {}".format(msg)
                         )
-
-            # set up socket-io client
-            sio = SocketIO("http://" + host, namespace=BaseNamespace)
-            log.info("'{}' client ready to receive sio messages".format(host))
-            sio.on("exa_message", handle_exabgp_msg)
-            sio.emit("exa_subscribe", {"prefixes": prefixes})
-            if autoconf:
-                route_refresh_command_v4 = "announce route-refresh ipv4 unicast"
-                sio.emit("route_command", {"command": route_refresh_command_v4})
-                route_refresh_command_v6 = "announce route-refresh ipv6 unicast"
-                sio.emit("route_command", {"command": route_refresh_command_v6})
-            sio.wait()
+                if (
+                    len(publish_buffer) + len(autoconf_buffer) >= PUBLISH_BATCH_SIZE
+                    or time.time() - last_flush[0] >= PUBLISH_BATCH_TIMEOUT
+                ):
+                    try:
+                        flush(producer)
+                    except Exception:
+                        log.exception("exception")
+
+            # long-lived (per host process) connection and producer
+            connection = Connection(RABBITMQ_URI)
+            producer = Producer(connection)
+            try:
+                # set up socket-io client
+                sio = SocketIO("http://" + host, namespace=BaseNamespace)
+                log.info("'{}' client ready to receive sio messages".format(host))
+                sio.on("exa_message", handle_exabgp_msg)
+                sio.emit("exa_subscribe", {"prefixes": prefixes})
+                if autoconf:
+                    route_refresh_command_v4 = "announce route-refresh ipv4 unicast"
+                    sio.emit("route_command", {"command": route_refresh_command_v4})
+                    route_refresh_command_v6 = "announce route-refresh ipv6 unicast"
+                    sio.emit("route_command", {"command": route_refresh_command_v6})
+                while self.shared_memory_manager_dict["data_worker_should_run"]:
+                    sio.wait(seconds=PUBLISH_BATCH_TIMEOUT)
+                    # flush leftovers of quiet periods
+                    try:
+                        flush(producer)
+                    except Exception:
+                        log.exception("exception")
+            finally:
+                producer.close()
+                connection.release()
+                heartbeat.stop()
         except Exception:
             log.exception("exception")
 
     def run(self):
-        # update redis
+        # update redis (refreshed by the heartbeats of the host processes)
         ping_redis(redis)
-        redis.set("exabgp_seen_bgp_update", "1", ex=MON_TIMEOUT_LAST_BGP_UPDATE)
 
         autoconf_running = self.shared_memory_manager_dict["autoconf_running"]
         if not autoconf_running:
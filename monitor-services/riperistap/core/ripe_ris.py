@@ -1,8 +1,8 @@
+import asyncio
 import multiprocessing as mp
 import os
 import signal
 import time
-from copy import deepcopy
 
 import pytricia
 import redis
@@ -14,15 +14,18 @@ from artemis_utils.constants import CONFIGURATION_HOST
 from artemis_utils.constants import DATABASE_HOST
 from artemis_utils.constants import MAX_DATA_WORKER_WAIT_TIMEOUT
 from artemis_utils.constants import PREFIXTREE_HOST
-from artemis_utils.envvars import MON_TIMEOUT_LAST_BGP_UPDATE
 from artemis_utils.envvars import RABBITMQ_URI
 from artemis_utils.envvars import REDIS_HOST
 from artemis_utils.envvars import REDIS_PORT
 from artemis_utils.envvars import REST_PORT
 from artemis_utils.envvars import RIS_ID
 from artemis_utils.rabbitmq import create_exchange
+from artemis_utils.rabbitmq import UpdateBatchPublisher
+from artemis_utils.rabbitmq import wire_format
 from artemis_utils.redis import ping_redis
 from artemis_utils.redis import RedisExpiryChecker
+from artemis_utils.redis import RedisHeartbeat
+from artemis_utils.rest import RestMetricsHandler
 from artemis_utils.updates import key_generator
 from artemis_utils.updates import MformatValidator
 from artemis_utils.updates import normalize_msg_path
@@ -31,6 +34,7 @@ from kombu import Producer
 from tornado.ioloop import IOLoop
 from tornado.web import Application
 from tornado.web import RequestHandler
+from tornado.websocket import websocket_connect
 
 # logger
 log = get_logger()
@@ -47,8 +51,73 @@ shared_memory_locks = {
 # global vars
 update_to_type = {"announcements": "A", "withdrawals": "W"}
 update_types = ["announcements", "withdrawals"]
+# RIS Live fields not carried over to the normalized messages
+ris_only_fields = {
+    "type",
+    "raw",
+    "origin",
+    "id",
+    "host",
+    "community",
+    "announcements",
+    "withdrawals",
+}
 redis = redis.Redis(host=REDIS_HOST, port=REDIS_PORT)
 SERVICE_NAME = "riperistap"
+RIS_LIVE_URL = "wss://ris-live.ripe.net/v1/ws/?client=artemis-{}"
+NORMALIZER_PROCESSES = 4
+NORMALIZER_BATCH_SIZE = 100
+NORMALIZER_BATCH_TIMEOUT = 0.5
+MAX_PENDING_BATCHES = 4 * NORMALIZER_PROCESSES
+
+# per normalizer process state
+normalizer_state = {}
+
+
+def init_ris_normalizer(prefixes, hosts):
+    """
+    Initializes a normalizer process with its own monitored prefix tree.
+    """
+    prefix_tree = {"v4": pytricia.PyTricia(32), "v6": pytricia.PyTricia(128)}
+    for prefix in prefixes:
+        ip_version = get_ip_version(prefix)
+        prefix_tree[ip_version].insert(prefix, "")
+    normalizer_state["prefix_tree"] = prefix_tree
+    normalizer_state["hosts"] = set(hosts)
+    normalizer_state["validator"] = MformatValidator()
+
+
+def normalize_ris_batch(raw_msgs):
+    """
+    Parses, filters, normalizes and validates a batch of raw RIS Live messages
+    (executed within the normalizer processes).
+    :return: the normalized (and keyed) BGP updates, in order
+    """
+    prefix_tree = normalizer_state["prefix_tree"]
+    hosts = normalizer_state["hosts"]
+    validator = normalizer_state["validator"]
+    norm_path_msgs = []
+    for raw_msg in raw_msgs:
+        try:
+            parsed = json.loads(raw_msg)
+            msg = parsed["data"]
+            if "type" in parsed and parsed["type"] == "ris_error":
+                log.error(msg)
+                continue
+            # also check if ris host is in the configuration
+            if (
+                "type" not in msg
+                or msg["type"] != "UPDATE"
+                or (hosts and msg["host"] not in hosts)
+            ):
+                continue
+            norm_path_msgs.extend(
+                RipeRisTapDataWorker.normalize_ripe_ris(msg, prefix_tree, validator)
+            )
+        except Exception:
+            log.exception("exception")
+            log.error("exception message {}".format(raw_msg))
+    return norm_path_msgs
 
 
 def start_data_worker(shared_memory_manager_dict):
@@ -352,6 +421,7 @@ class RipeRisTap:
                     HealthHandler,
                     dict(shared_memory_manager_dict=self.shared_memory_manager_dict),
                 ),
+                ("/metrics", RestMetricsHandler),
             ]
         )
 
@@ -383,182 +453,206 @@ class RipeRisTapDataWorker:
     def run(self):
         # update redis
         ping_redis(redis)
-        redis.set("ris_seen_bgp_update", "1", ex=MON_TIMEOUT_LAST_BGP_UPDATE)
-
-        # build monitored prefix tree
-        prefix_tree = {"v4": pytricia.PyTricia(32), "v6": pytricia.PyTricia(128)}
+        self.heartbeat = RedisHeartbeat(redis=redis, monitor="ris")
+        self.heartbeat.start()
+
+        # the normalizers build their own monitored prefix trees
+        normalizer_pool = mp.Pool(
+            processes=NORMALIZER_PROCESSES,
+            initializer=init_ris_normalizer,
+            initargs=(list(self.prefixes), list(self.hosts)),
+        )
+        # the process is forked from the (running) REST loop, so it needs its own
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        try:
+            with Producer(self.connection) as producer:
+                self.loop.run_until_complete(self.stream(normalizer_pool, producer))
+        finally:
+            normalizer_pool.terminate()
+            normalizer_pool.join()
+            self.heartbeat.stop()
+            self.loop.close()
+
+    def subscriptions(self):
+        """
+        RIS Live subscriptions (filtered server-side) for the monitored prefixes
+        and their more specifics.
+        """
         for prefix in self.prefixes:
-            ip_version = get_ip_version(prefix)
-            prefix_tree[ip_version].insert(prefix, "")
-
-        # set RIS suffix on connection
-        ris_suffix = RIS_ID
+            yield {
+                "type": "ris_subscribe",
+                "data": {
+                    "type": "UPDATE",
+                    "prefix": prefix,
+                    "moreSpecific": True,
+                    "lessSpecific": False,
+                    "socketOptions": {"includeRaw": False},
+                },
+            }
+
+    async def stream(self, normalizer_pool, producer):
+        """
+        Streams RIS Live messages over the websocket in batches to the normalizer
+        pool; the normalized batches are published in order, as they complete.
+        """
+        loop = self.loop
+        # bounded, so that a slow pool (or publishing) throttles reading
+        pending_batches = asyncio.Queue(maxsize=MAX_PENDING_BATCHES)
+        update_publisher = UpdateBatchPublisher()
+        batch = []
+        running = True
+
+        async def submit_batch():
+            nonlocal batch
+            if not batch:
+                return
+            raw_msgs = batch
+            batch = []
+            future = loop.create_future()
+            normalizer_pool.apply_async(
+                normalize_ris_batch,
+                (raw_msgs,),
+                callback=lambda result: loop.call_soon_threadsafe(
+                    future.set_result, result
+                ),
+                error_callback=lambda error: loop.call_soon_threadsafe(
+                    future.set_exception, error
+                ),
+            )
+            await pending_batches.put(future)
 
-        # main loop to process BGP updates
-        validator = MformatValidator()
-        with Producer(self.connection) as producer:
-            while True:
-                if not self.shared_memory_manager_dict["data_worker_should_run"]:
-                    break
+        async def read():
+            while running:
                 try:
-                    events = requests.get(
-                        "https://ris-live.ripe.net/v1/stream/?format=json&client=artemis-{}".format(
-                            ris_suffix
-                        ),
-                        stream=True,
-                        timeout=10,
+                    websocket = await websocket_connect(
+                        RIS_LIVE_URL.format(RIS_ID), ping_interval=30
                     )
-                    # http://docs.python-requests.org/en/latest/user/advanced/#streaming-requests
-                    iterator = events.iter_lines()
-                    next(iterator)
-                    for data in iterator:
-                        if not self.shared_memory_manager_dict[
-                            "data_worker_should_run"
-                        ]:
+                    for subscription in self.subscriptions():
+                        await websocket.write_message(json.dumps(subscription))
+                    while running:
+                        raw_msg = await websocket.read_message()
+                        if raw_msg is None:
                             break
-                        try:
-                            parsed = json.loads(data)
-                            msg = parsed["data"]
-                            if "type" in parsed and parsed["type"] == "ris_error":
-                                log.error(msg)
-                            # also check if ris host is in the configuration
-                            elif (
-                                "type" in msg
-                                and msg["type"] == "UPDATE"
-                                and (not self.hosts or msg["host"] in self.hosts)
-                            ):
-                                norm_ris_msgs = self.normalize_ripe_ris(
-                                    msg, prefix_tree
-                                )
-                                for norm_ris_msg in norm_ris_msgs:
-                                    redis.set(
-                                        "ris_seen_bgp_update",
-                                        "1",
-                                        ex=MON_TIMEOUT_LAST_BGP_UPDATE,
-                                    )
-                                    try:
-                                        if validator.validate(norm_ris_msg):
-                                            norm_path_msgs = normalize_msg_path(
-                                                norm_ris_msg
-                                            )
-                                            for norm_path_msg in norm_path_msgs:
-                                                key_generator(norm_path_msg)
-                                                log.debug(norm_path_msg)
-                                                producer.publish(
-                                                    norm_path_msg,
-                                                    exchange=self.update_exchange,
-                                                    routing_key="update",
-                                                    serializer="ujson",
-                                                )
-                                        else:
-                                            log.warning(
-                                                "Invalid format message: {}".format(msg)
-                                            )
-                                    except BaseException:
-                                        log.exception("exception")
-                                        log.error(
-                                            "Error when normalizing BGP message: {}".format(
-                                                norm_ris_msg
-                                            )
-                                        )
-                        except Exception:
-                            log.exception("exception")
-                            log.error("exception message {}".format(data))
-                    log.warning(
-                        "Iterator ran out of data; the connection will be retried"
-                    )
+                        batch.append(raw_msg)
+                        if len(batch) >= NORMALIZER_BATCH_SIZE:
+                            await submit_batch()
+                    websocket.close()
+                    if running:
+                        log.warning(
+                            "Websocket ran out of data; the connection will be retried"
+                        )
                 except Exception:
                     log.exception("exception")
+                if running:
                     log.info(
                         "RIPE RIS Server closed connection. Restarting socket in 10 seconds.."
                     )
-                    time.sleep(10)
+                    await asyncio.sleep(10)
+
+        async def flush():
+            nonlocal running
+            while running:
+                await asyncio.sleep(NORMALIZER_BATCH_TIMEOUT)
+                running = self.shared_memory_manager_dict["data_worker_should_run"]
+                await submit_batch()
+            await pending_batches.put(None)
+
+        async def publish():
+            while True:
+                future = await pending_batches.get()
+                if future is None:
+                    break
+                try:
+                    norm_path_msgs = await future
+                except Exception:
+                    log.exception("exception")
+                    continue
+                if not norm_path_msgs:
+                    continue
+                self.heartbeat.beat()
+                for norm_path_msg in norm_path_msgs:
+                    log.debug(norm_path_msg)
+                    update_publisher.publish(
+                        producer,
+                        norm_path_msg,
+                        exchange=self.update_exchange,
+                        routing_key="update",
+                        serializer=wire_format(self.update_exchange),
+                    )
+                update_publisher.flush(producer)
+
+        reader = asyncio.ensure_future(read())
+        await asyncio.gather(flush(), publish())
+        reader.cancel()
 
     @staticmethod
-    def normalize_ripe_ris(msg, prefix_tree):
+    def normalize_ripe_ris(msg, prefix_tree, validator):
+        """
+        Normalizes a RIS Live UPDATE into keyed per-prefix BGP updates.
+        The parts shared by all prefixes of the same update type (path, communities,
+        service, peer, timestamp) are built, validated and path-normalized once;
+        the per-prefix messages are shallow copies referencing them.
+        """
         msgs = []
-        if isinstance(msg, dict):
-            msg["key"] = None  # initial placeholder before passing the validator
-            if "community" in msg:
-                msg["communities"] = [
-                    {"asn": comm[0], "value": comm[1]} for comm in msg["community"]
-                ]
-                del msg["community"]
-            if "host" in msg:
-                msg["service"] = "ripe-ris|" + msg["host"]
-                del msg["host"]
-            if "peer_asn" in msg:
-                msg["peer_asn"] = int(msg["peer_asn"])
-            if "path" not in msg:
-                msg["path"] = []
-            if "timestamp" in msg:
-                msg["timestamp"] = float(msg["timestamp"])
-            if "type" in msg:
-                del msg["type"]
-            if "raw" in msg:
-                del msg["raw"]
-            if "origin" in msg:
-                del msg["origin"]
-            if "id" in msg:
-                del msg["id"]
-            if "announcements" in msg and "withdrawals" in msg:
-                # need 2 separate messages
-                # one for announcements
-                msg_ann = deepcopy(msg)
-                msg_ann["type"] = update_to_type["announcements"]
-                prefixes = []
-                for element in msg_ann["announcements"]:
-                    if "prefixes" in element:
-                        prefixes.extend(element["prefixes"])
-                for prefix in prefixes:
-                    ip_version = get_ip_version(prefix)
-                    try:
-                        if prefix in prefix_tree[ip_version]:
-                            new_msg = deepcopy(msg_ann)
-                            new_msg["prefix"] = prefix
-                            del new_msg["announcements"]
-                            del new_msg["withdrawals"]
-                            msgs.append(new_msg)
-                    except Exception:
-                        log.exception("exception")
-                # one for withdrawals
-                msg_wit = deepcopy(msg)
-                msg_wit["type"] = update_to_type["withdrawals"]
-                msg_wit["path"] = []
-                msg_wit["communities"] = []
-                prefixes = msg_wit["withdrawals"]
-                for prefix in prefixes:
-                    ip_version = get_ip_version(prefix)
-                    try:
-                        if prefix in prefix_tree[ip_version]:
-                            new_msg = deepcopy(msg_wit)
-                            new_msg["prefix"] = prefix
-                            del new_msg["announcements"]
-                            del new_msg["withdrawals"]
-                            msgs.append(new_msg)
-                    except Exception:
-                        log.exception("exception")
-            else:
-                for update_type in update_types:
-                    if update_type in msg:
-                        msg["type"] = update_to_type[update_type]
-                        prefixes = []
-                        for element in msg[update_type]:
-                            if update_type == "announcements":
-                                if "prefixes" in element:
-                                    prefixes.extend(element["prefixes"])
-                            elif update_type == "withdrawals":
-                                prefixes.append(element)
-                        for prefix in prefixes:
-                            ip_version = get_ip_version(prefix)
-                            try:
-                                if prefix in prefix_tree[ip_version]:
-                                    new_msg = deepcopy(msg)
-                                    new_msg["prefix"] = prefix
-                                    del new_msg[update_type]
-                                    msgs.append(new_msg)
-                            except Exception:
-                                log.exception("exception")
+        if not isinstance(msg, dict):
+            return msgs
+        shared = {
+            field: value for field, value in msg.items() if field not in ris_only_fields
+        }
+        shared["key"] = None  # initial placeholder before passing the validator
+        shared["communities"] = [
+            {"asn": comm[0], "value": comm[1]} for comm in msg.get("community", [])
+        ]
+        if "host" in msg:
+            shared["service"] = "ripe-ris|" + msg["host"]
+        if "peer_asn" in msg:
+            shared["peer_asn"] = int(msg["peer_asn"])
+        if "path" not in msg:
+            shared["path"] = []
+        if "timestamp" in msg:
+            shared["timestamp"] = float(msg["timestamp"])
+
+        for update_type in update_types:
+            if update_type not in msg:
+                continue
+            prefixes = []
+            for element in msg[update_type]:
+                if update_type == "announcements":
+                    prefixes.extend(element.get("prefixes", []))
+                else:
+                    prefixes.append(element)
+            matched_prefixes = []
+            for prefix in prefixes:
+                ip_version = get_ip_version(prefix)
+                try:
+                    if prefix in prefix_tree[ip_version]:
+                        matched_prefixes.append(prefix)
+                except Exception:
+                    log.exception("exception")
+            if not matched_prefixes:
+                continue
+
+            template = dict(shared)
+            template["type"] = update_to_type[update_type]
+            template["prefix"] = matched_prefixes[0]
+            if update_type == "withdrawals" and "announcements" in msg:
+                template["path"] = []
+                template["communities"] = []
+            try:
+                if not validator.validate(template):
+                    log.warning("Invalid format message: {}".format(msg))
+                    continue
+                template_path_msgs = normalize_msg_path(template)
+                for prefix in matched_prefixes:
+                    for template_path_msg in template_path_msgs:
+                        norm_msg = dict(template_path_msg)
+                        norm_msg["prefix"] = prefix
+                        key_generator(norm_msg)
+                        msgs.append(norm_msg)
+            except BaseException:
+                log.exception("exception")
+                log.error("Error when normalizing BGP message: {}".format(template))
         return msgs
 
 
@@ -8,6 +8,8 @@ import netaddr
 import ujson
 from _pybgpstream import BGPRecord
 from _pybgpstream import BGPStream
+from artemis_utils.archive import ARCHIVE_EXTENSION
+from artemis_utils.archive import ArchiveWriter
 
 # install as described in https://bgpstream.caida.org/docs/install/pybgpstream
 
@@ -27,17 +29,18 @@ def is_valid_ip_prefix(pref_str=None):
     return True
 
 
-def run_bgpstream(prefix, start, end, out_file):
+def run_bgpstream(prefix, start, end, out_file, out_format="archive"):
     """
     Retrieve all records related to a certain prefix for a certain time period
-    and save them on a .csv file
+    and save them on a columnar archive (.bgpa) or .csv file
     https://bgpstream.caida.org/docs/api/pybgpstream/_pybgpstream.html
 
     :param prefix: <str> input prefix
     :param start: <int> start timestamp in UNIX epochs
     :param end: <int> end timestamp in UNIX epochs
-    :param out_file: <str> .csv file to store information
-    format: PREFIX|ORIGIN_AS|PEER_AS|AS_PATH|PROJECT|COLLECTOR|TYPE|COMMUNITIES|TIME
+    :param out_file: <str> .bgpa/.csv file to store information
+    :param out_format: <str> "archive" (columnar archive, see artemis_utils.archive)
+    or "csv" (PREFIX|ORIGIN_AS|PEER_AS|AS_PATH|PROJECT|COLLECTOR|TYPE|COMMUNITIES|TIME)
     :return: -
     """
     # create a new bgpstream instance and a reusable bgprecord instance
@@ -60,23 +63,49 @@ def run_bgpstream(prefix, start, end, out_file):
     # start the stream
     stream.start()
 
-    # set the csv writer
-    with open(out_file, "w") as f:
+    if out_format == "archive":
+        archive_writer = ArchiveWriter()
+    else:
+        # set the csv writer
+        f = open(out_file, "w")
         csv_writer = csv.writer(f, delimiter="|")
 
-        # get next record
-        while stream.get_next_record(rec):
-            if (rec.status != "valid") or (rec.type != "update"):
-                continue
+    # get next record
+    while stream.get_next_record(rec):
+        if (rec.status != "valid") or (rec.type != "update"):
+            continue
 
-            # get next element
-            elem = rec.get_next_elem()
+        # get next element
+        elem = rec.get_next_elem()
 
-            while elem:
-                if elem.type in ["A", "W"]:
-                    elem_csv_list = []
+        while elem:
+            if elem.type in ["A", "W"]:
+                if out_format == "archive":
                     if elem.type == "A":
-                        elem_csv_list = [
+                        archive_writer.add(
+                            str(elem.fields["prefix"]),
+                            elem.peer_asn,
+                            str(elem.fields["as-path"]),
+                            str(rec.project),
+                            str(rec.collector),
+                            str(elem.type),
+                            elem.fields["communities"],
+                            elem.time,
+                        )
+                    else:
+                        archive_writer.add(
+                            str(elem.fields["prefix"]),
+                            elem.peer_asn,
+                            "",
+                            str(rec.project),
+                            str(rec.collector),
+                            str(elem.type),
+                            [],
+                            rec.time,
+                        )
+                elif elem.type == "A":
+                    csv_writer.writerow(
+                        [
                             str(elem.fields["prefix"]),
                             str(elem.fields["as-path"].split(" ")[-1]),
                             str(elem.peer_asn),
@@ -87,8 +116,10 @@ def run_bgpstream(prefix, start, end, out_file):
                             ujson.dumps(elem.fields["communities"]),
                             str(elem.time),
                         ]
-                    else:
-                        elem_csv_list = [
+                    )
+                else:
+                    csv_writer.writerow(
+                        [
                             str(elem.fields["prefix"]),
                             "",
                             str(elem.peer_asn),
@@ -99,8 +130,13 @@ def run_bgpstream(prefix, start, end, out_file):
                             ujson.dumps([]),
                             str(rec.time),
                         ]
-                    csv_writer.writerow(elem_csv_list)
-                elem = rec.get_next_elem()
+                    )
+            elem = rec.get_next_elem()
+
+    if out_format == "archive":
+        archive_writer.write(out_file)
+    else:
+        f.close()
 
     # release resources
     del rec
@@ -138,6 +174,15 @@ def main():
         help="output dir to store the retrieved information",
         required=True,
     )
+    parser.add_argument(
+        "-f",
+        "--format",
+        dest="output_format",
+        type=str,
+        choices=["archive", "csv"],
+        default="archive",
+        help="output format (columnar archive or csv)",
+    )
     args = parser.parse_args()
 
     if not is_valid_ip_prefix(args.prefix):
@@ -156,10 +201,16 @@ def main():
     output_dir = args.output_dir.rstrip("/")
     if not os.path.isdir(output_dir):
         os.mkdir(output_dir)
-    out_file = "{}/PREFIX_{}-START_{}-END_{}.csv".format(
-        args.output_dir, args.prefix.replace("/", "+"), args.start_time, args.end_time
+    out_file = "{}/PREFIX_{}-START_{}-END_{}{}".format(
+        args.output_dir,
+        args.prefix.replace("/", "+"),
+        args.start_time,
+        args.end_time,
+        ARCHIVE_EXTENSION if args.output_format == "archive" else ".csv",
+    )
+    run_bgpstream(
+        args.prefix, args.start_time, args.end_time, out_file, args.output_format
     )
-    run_bgpstream(args.prefix, args.start_time, args.end_time, out_file)
 
 
 if __name__ == "__main__":
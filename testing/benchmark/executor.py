@@ -3,6 +3,7 @@ import sys
 import time
 from multiprocessing import Process
 
+import msgpack
 import requests
 import ujson as json
 from kombu import Connection
@@ -19,6 +20,13 @@ serialization.register(
     content_type="application/x-ujson",
     content_encoding="utf-8",
 )
+serialization.register(
+    "msgpack",
+    lambda obj: msgpack.packb(obj, use_bin_type=True),
+    lambda data: msgpack.unpackb(data, raw=False, strict_map_key=False),
+    content_type="application/x-msgpack",
+    content_encoding="binary",
+)
 
 # global vars
 CONFIGURATION_HOST = "configuration"
@@ -31,6 +39,8 @@ DATA_WORKER_DEPENDENCIES = [
     "prefixtree",
 ]
 REST_PORT = 3000
+SERIALIZERS = ["ujson", "msgpack"]
+SERIALIZER_ROUNDS = 100000
 RABBITMQ_USER = os.getenv("RABBITMQ_USER", "guest")
 RABBITMQ_PASS = os.getenv("RABBITMQ_PASS", "guest")
 RABBITMQ_HOST = os.getenv("RABBITMQ_HOST", "rabbitmq")
@@ -81,6 +91,50 @@ def wait_data_worker_dependencies(data_worker_dependencies):
         time.sleep(1)
 
 
+def benchmark_serializers():
+    msg_ = {
+        "prefix": "10.0.0.0/24",
+        "key": "0-0",
+        "orig_path": [],
+        "communities": [{"asn": 8, "value": 100}, {"asn": 8, "value": 200}],
+        "service": "ripe-ris|rrc00",
+        "type": "A",
+        "path": [8, 4, 3, 2, 1],
+        "peer_asn": 8,
+        "timestamp": 1594632000.0,
+    }
+
+    for serializer in SERIALIZERS:
+        content_type, content_encoding, payload = serialization.dumps(
+            msg_, serializer=serializer
+        )
+
+        start = time.time()
+        for _ in range(SERIALIZER_ROUNDS):
+            serialization.dumps(msg_, serializer=serializer)
+        encode_rate = SERIALIZER_ROUNDS / (time.time() - start)
+
+        start = time.time()
+        for _ in range(SERIALIZER_ROUNDS):
+            serialization.loads(
+                payload, content_type, content_encoding, accept=[content_type]
+            )
+        decode_rate = SERIALIZER_ROUNDS / (time.time() - start)
+
+        print(
+            "[!] Serializer {}: encode = {} msg/s, decode = {} msg/s, size = {} B".format(
+                serializer, encode_rate, decode_rate, len(payload)
+            )
+        )
+        for metric, value in (
+            ("encode", encode_rate),
+            ("decode", decode_rate),
+            ("size", len(payload)),
+        ):
+            with open("serializer-{}-{}".format(serializer, metric), "w") as f:
+                f.write(str(int(value)))
+
+
 def send():
     send_cnt = 0
     msg_ = {
@@ -176,6 +230,9 @@ def receive(exchange_name, routing_key):
 if __name__ == "__main__":
     print("[+] Starting")
 
+    # serializer encode/decode benchmarks (no dependencies needed)
+    benchmark_serializers()
+
     # wait for dependencies data workers to start
     wait_data_worker_dependencies(DATA_WORKER_DEPENDENCIES)
 
@@ -22,7 +22,7 @@ CREATE TRIGGER db_details_no_delete
 BEFORE DELETE ON db_details
 FOR EACH ROW EXECUTE PROCEDURE db_version_no_delete();
 
-INSERT INTO db_details (version, upgraded_on) VALUES (24, now());
+INSERT INTO db_details (version, upgraded_on) VALUES (25, now());
 
 CREATE TABLE IF NOT EXISTS bgp_updates (
     key VARCHAR ( 32 ) NOT NULL,
@@ -50,6 +50,21 @@ ON bgp_updates(handled);
 
 SELECT create_hypertable('bgp_updates', 'timestamp', if_not_exists => TRUE);
 
+CREATE TABLE IF NOT EXISTS hijack_bgp_updates (
+    hijack_key VARCHAR ( 32 ) NOT NULL,
+    update_key VARCHAR ( 32 ) NOT NULL,
+    timestamp TIMESTAMP NOT NULL,
+    PRIMARY KEY(timestamp, hijack_key, update_key)
+);
+
+CREATE INDEX hijack_bgp_updates_hijack_idx
+ON hijack_bgp_updates(hijack_key, timestamp DESC);
+
+CREATE INDEX hijack_bgp_updates_update_idx
+ON hijack_bgp_updates(update_key, timestamp DESC);
+
+SELECT create_hypertable('hijack_bgp_updates', 'timestamp', if_not_exists => TRUE);
+
 create trigger send_insert_test_event
 after insert on bgp_updates
 for each row execute procedure rabbitmq.on_row_change('update-insert');
@@ -253,16 +268,20 @@ $$ LANGUAGE sql STABLE;
 
 CREATE FUNCTION search_bgpupdates_by_hijack_key(key text)
 RETURNS SETOF view_bgpupdates AS $$
-    SELECT *
-    FROM view_bgpupdates
+    SELECT b.prefix, b.origin_as, b.peer_asn, b.as_path, b.service, b.type, b.communities,
+        b.timestamp, b.hijack_key, b.handled, b.matched_prefix, b.orig_path
+    FROM hijack_bgp_updates AS hb
+    JOIN bgp_updates AS b ON (b.timestamp = hb.timestamp AND b.key = hb.update_key)
     WHERE
-        key = ANY(view_bgpupdates.hijack_key)
+        hb.hijack_key = $1
 $$ LANGUAGE sql STABLE;
 
 CREATE FUNCTION search_bgpupdates_by_as_path_and_hijack_key(key text, as_paths BIGINT[])
     RETURNS SETOF view_bgpupdates AS $$
-    SELECT *
-    FROM view_bgpupdates
+    SELECT b.prefix, b.origin_as, b.peer_asn, b.as_path, b.service, b.type, b.communities,
+        b.timestamp, b.hijack_key, b.handled, b.matched_prefix, b.orig_path
+    FROM hijack_bgp_updates AS hb
+    JOIN bgp_updates AS b ON (b.timestamp = hb.timestamp AND b.key = hb.update_key)
     WHERE
-        key = ANY(view_bgpupdates.hijack_key) and as_paths <@ view_bgpupdates.as_path
+        hb.hijack_key = $1 and $2 <@ b.as_path
 $$ LANGUAGE sql STABLE;
@@ -17,6 +17,47 @@ serialization.register(
     content_encoding="utf-8",
 )
 
+try:
+    import msgpack
+except ImportError:  # optional binary wire format
+    msgpack = None
+
+# msgpack extension type code of (frozen)sets
+MSGPACK_SET_EXT_TYPE = 1
+
+
+def msgpack_default(obj):
+    if isinstance(obj, (set, frozenset)):
+        return msgpack.ExtType(MSGPACK_SET_EXT_TYPE, msgpack_dumps(list(obj)))
+    raise TypeError("cannot serialize {}".format(type(obj)))
+
+
+def msgpack_ext_hook(code, data):
+    if code == MSGPACK_SET_EXT_TYPE:
+        return set(msgpack_loads(data))
+    return msgpack.ExtType(code, data)
+
+
+def msgpack_dumps(obj):
+    return msgpack.packb(obj, use_bin_type=True, default=msgpack_default)
+
+
+def msgpack_loads(data):
+    return msgpack.unpackb(
+        data, raw=False, ext_hook=msgpack_ext_hook, strict_map_key=False
+    )
+
+
+if msgpack is not None:
+    # binary wire format with native integers and sets
+    serialization.register(
+        "msgpack",
+        msgpack_dumps,
+        msgpack_loads,
+        content_type="application/x-msgpack",
+        content_encoding="binary",
+    )
+
 
 def get_logger(path="/etc/artemis/logging.yaml"):
     if os.path.exists(path):
@@ -131,3 +172,8 @@ def chunk_list(bucket, n):
     """Yield successive n-sized chunks from bucket."""
     for i in range(0, len(bucket), n):
         yield bucket[i : i + n]
+
+
+def get_config_version(timestamp):
+    """Stable string key of a configuration timestamp (float), e.g. for registries."""
+    return "{:.6f}".format(float(timestamp))
@@ -0,0 +1,283 @@
+# columnar archive of historical BGP updates
+#
+# layout (little-endian):
+# - header: magic, version, number of records, number of prefixes and the offsets
+#   of the sections that follow
+# - fixed-width record columns, sorted by (prefix, timestamp):
+#   timestamp (float64), peer ASN (uint32), path ID (uint32), communities ID (uint32),
+#   service ID (uint16), type (uint8, "A"/"W")
+# - prefix index: (first record, record count, min timestamp, max timestamp) per prefix
+# - string tables (uint32 offsets + utf-8 blob): prefixes, (interned) AS-paths,
+#   (interned) communities and the dictionary-encoded "<project>|<collector>" services
+import bisect
+import mmap
+import struct
+import sys
+
+ARCHIVE_EXTENSION = ".bgpa"
+ARCHIVE_MAGIC = b"ARTBGPA\x00"
+ARCHIVE_VERSION = 1
+
+HEADER = struct.Struct("<8sHxxII11Q")
+PREFIX_INDEX_ENTRY = struct.Struct("<IIdd")
+COLUMNS = (
+    ("timestamp", "d"),
+    ("peer_asn", "I"),
+    ("path_id", "I"),
+    ("communities_id", "I"),
+    ("service_id", "H"),
+    ("type", "B"),
+)
+STRING_TABLES = ("prefixes", "paths", "communities", "services")
+
+
+def _align(offset):
+    return (offset + 7) & ~7
+
+
+def encode_communities(communities):
+    return " ".join("{}:{}".format(comm["asn"], comm["value"]) for comm in communities)
+
+
+def decode_communities(communities):
+    if not communities:
+        return []
+    return [
+        {"asn": int(asn), "value": int(value)}
+        for asn, value in (comm.split(":") for comm in communities.split(" "))
+    ]
+
+
+class StringTable:
+    """
+    Interns strings to consecutive IDs.
+    """
+
+    def __init__(self):
+        self.ids = {}
+        self.strings = []
+
+    def intern(self, string):
+        string_id = self.ids.get(string)
+        if string_id is None:
+            string_id = len(self.strings)
+            self.ids[string] = string_id
+            self.strings.append(string)
+        return string_id
+
+    def encode(self):
+        blob = bytearray()
+        offsets = [0]
+        for string in self.strings:
+            blob += string.encode("utf-8")
+            offsets.append(len(blob))
+        header = struct.pack("<I{}I".format(len(offsets)), len(self.strings), *offsets)
+        return header + bytes(blob)
+
+
+class ArchiveWriter:
+    """
+    Collects historical BGP updates and writes them as a columnar archive.
+    """
+
+    def __init__(self):
+        self.records = []
+        self.tables = {table: StringTable() for table in STRING_TABLES}
+
+    def add(
+        self, prefix, peer_asn, path, project, collector, type_, communities, timestamp
+    ):
+        """
+        :param prefix: <str> prefix
+        :param peer_asn: <int> peer ASN
+        :param path: <str> space-separated AS-path (empty for withdrawals)
+        :param project: <str> BGPStream project (e.g., "ris")
+        :param collector: <str> route collector (e.g., "rrc00")
+        :param type_: <str> "A"|"W"
+        :param communities: <list> [{"asn": <int>, "value": <int>}, ...]
+        :param timestamp: <float> timestamp in UNIX epochs
+        """
+        self.records.append(
+            (
+                self.tables["prefixes"].intern(prefix),
+                float(timestamp),
+                int(peer_asn),
+                self.tables["paths"].intern(path),
+                self.tables["communities"].intern(encode_communities(communities)),
+                self.tables["services"].intern("{}|{}".format(project, collector)),
+                ord(type_),
+            )
+        )
+
+    def write(self, out_file):
+        self.records.sort(key=lambda record: (record[0], record[1]))
+        num_prefixes = len(self.tables["prefixes"].strings)
+
+        # prefix index
+        index = [[0, 0, 0.0, 0.0] for _ in range(num_prefixes)]
+        for i, record in enumerate(self.records):
+            entry = index[record[0]]
+            if not entry[1]:
+                entry[0] = i
+                entry[2] = record[1]
+            entry[1] += 1
+            entry[3] = record[1]
+
+        sections = [
+            struct.pack(
+                "<{}{}".format(len(self.records), column_type),
+                *(record[i + 1] for record in self.records)
+            )
+            for i, (_, column_type) in enumerate(COLUMNS)
+        ]
+        sections.append(b"".join(PREFIX_INDEX_ENTRY.pack(*entry) for entry in index))
+        sections.extend(self.tables[table].encode() for table in STRING_TABLES)
+
+        offsets = []
+        offset = _align(HEADER.size)
+        for section in sections:
+            offsets.append(offset)
+            offset = _align(offset + len(section))
+
+        with open(out_file, "wb") as f:
+            f.write(
+                HEADER.pack(
+                    ARCHIVE_MAGIC,
+                    ARCHIVE_VERSION,
+                    len(self.records),
+                    num_prefixes,
+                    *offsets
+                )
+            )
+            for section_offset, section in zip(offsets, sections):
+                f.write(b"\x00" * (section_offset - f.tell()))
+                f.write(section)
+
+
+class ArchiveReader:
+    """
+    Memory-mapped reader of a columnar archive; only the records of the
+    selected prefixes (and time window) are ever decoded.
+    """
+
+    def __init__(self, archive_file):
+        if sys.byteorder != "little":
+            raise ValueError("archives can only be mapped on little-endian hosts")
+        with open(archive_file, "rb") as f:
+            self.mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.buffer = memoryview(self.mmap)
+        self.columns = {}
+        self.tables = {}
+        header = HEADER.unpack_from(self.buffer)
+        if header[0] != ARCHIVE_MAGIC or header[1] != ARCHIVE_VERSION:
+            self.close()
+            raise ValueError("'{}' is not a supported archive".format(archive_file))
+        self.num_records = header[2]
+        self.num_prefixes = header[3]
+        offsets = header[4:]
+
+        for (name, column_type), offset in zip(COLUMNS, offsets):
+            size = struct.calcsize(column_type) * self.num_records
+            self.columns[name] = self.buffer[offset : offset + size].cast(column_type)
+        self.index_offset = offsets[len(COLUMNS)]
+        self.tables = {
+            table: self._string_table(offset)
+            for table, offset in zip(STRING_TABLES, offsets[len(COLUMNS) + 1 :])
+        }
+        self.communities_cache = {}
+
+    def _string_table(self, offset):
+        (count,) = struct.unpack_from("<I", self.buffer, offset)
+        offsets = self.buffer[offset + 4 : offset + 8 + 4 * count].cast("I")
+        blob_offset = offset + 8 + 4 * count
+        return offsets, blob_offset
+
+    def string(self, table, string_id):
+        offsets, blob_offset = self.tables[table]
+        return str(
+            self.buffer[
+                blob_offset + offsets[string_id] : blob_offset + offsets[string_id + 1]
+            ],
+            "utf-8",
+        )
+
+    def prefixes(self):
+        """
+        Yields (prefix, first record, record count, min timestamp, max timestamp)
+        entries of the prefix index.
+        """
+        for prefix_id in range(self.num_prefixes):
+            entry = PREFIX_INDEX_ENTRY.unpack_from(
+                self.buffer, self.index_offset + prefix_id * PREFIX_INDEX_ENTRY.size
+            )
+            yield (self.string("prefixes", prefix_id),) + entry
+
+    def records(self, prefix_filter=None, start=None, end=None):
+        """
+        Yields the records of the prefixes accepted by prefix_filter (all if None),
+        within the [start, end] time window, in (prefix, timestamp) order.
+        Note that no views into the archive are held across yields, so that the
+        reader can be closed while the generator is still alive.
+        """
+        for prefix, first, count, min_ts, max_ts in self.prefixes():
+            if not count:
+                continue
+            if start is not None and max_ts < start:
+                continue
+            if end is not None and min_ts > end:
+                continue
+            if prefix_filter is not None and not prefix_filter(prefix):
+                continue
+            lo = first
+            hi = first + count
+            if start is not None:
+                lo = bisect.bisect_left(self.columns["timestamp"], start, lo, hi)
+            if end is not None:
+                hi = bisect.bisect_right(self.columns["timestamp"], end, lo, hi)
+            for i in range(lo, hi):
+                if not self.columns:
+                    raise ValueError("archive is closed")
+                yield self.record(prefix, i)
+
+    def record(self, prefix, i):
+        communities_id = self.columns["communities_id"][i]
+        communities = self.communities_cache.get(communities_id)
+        if communities is None:
+            communities = decode_communities(self.string("communities", communities_id))
+            self.communities_cache[communities_id] = communities
+        project, collector = self.string(
+            "services", self.columns["service_id"][i]
+        ).split("|", 1)
+        return {
+            "prefix": prefix,
+            "peer_asn": self.columns["peer_asn"][i],
+            "path": self.string("paths", self.columns["path_id"][i]),
+            "project": project,
+            "collector": collector,
+            "type": chr(self.columns["type"][i]),
+            # shared by all records with the same communities
+            "communities": communities,
+            "timestamp": self.columns["timestamp"][i],
+        }
+
+    def close(self):
+        # release the views into the map first
+        for column in self.columns.values():
+            column.release()
+        for offsets, _ in self.tables.values():
+            offsets.release()
+        self.columns = {}
+        self.tables = {}
+        self.buffer.release()
+        try:
+            self.mmap.close()
+        except BufferError:
+            # views are still exported to callers; the map is closed
+            # once they are garbage collected
+            pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
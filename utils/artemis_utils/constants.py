@@ -39,6 +39,8 @@ MAX_DATA_WORKER_WAIT_TIMEOUT = 10
 MITIGATION_HOST = "mitigation"
 NOTIFIER_HOST = "notifier"
 PREFIXTREE_HOST = "prefixtree"
+REST_EXECUTOR_WORKERS = 8
+REST_SLOW_REQUEST_TIME = 5
 RIPE_ASSET_REGEX = r"^RIPE_WHOIS_AS_SET_(.*)$"
 RIPERISTAP_HOST = "riperistap"
 START_TIME_OFFSET = 3600
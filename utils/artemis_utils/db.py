@@ -162,6 +162,63 @@ class DB:
         if not self.readonly:
             self._connection.commit()
 
+    def copy_expert(
+        self, query, file, pre_query=None, post_query=None, retry_counter=0
+    ):
+        """
+        Runs a COPY ... FROM STDIN query with the contents of the given file(-like
+        object), optionally surrounded by other queries in the same transaction.
+        """
+        log.debug("copy_expert query {}".format(query))
+        try:
+            file.seek(0)
+            if pre_query:
+                self._cursor.execute(pre_query)
+            self._cursor.copy_expert(query, file)
+            if post_query:
+                self._cursor.execute(post_query)
+            retry_counter = 0
+        except (psycopg2.DatabaseError, psycopg2.OperationalError) as error:
+            if retry_counter >= LIMIT_RETRIES:
+                raise error
+            retry_counter += 1
+            log.error(
+                "got error {}. retrying {}".format(str(error).strip(), retry_counter)
+            )
+            time.sleep(1)
+            self.reset()
+            self.copy_expert(query, file, pre_query, post_query, retry_counter)
+        except (Exception, psycopg2.Error) as error:
+            if not self.readonly:
+                self._connection.rollback()
+            raise error
+        if not self.readonly:
+            self._connection.commit()
+
+    def execute_iter(self, query, vals=None, chunk_size=1000):
+        """
+        Yields the results of a query in chunks of (at most) chunk_size rows,
+        streamed through a server-side cursor instead of being fetched all at once.
+        """
+        log.debug("execute_iter query {}".format(query))
+        # server-side cursors live within a transaction
+        autocommit = self._connection.autocommit
+        if autocommit:
+            self._connection.autocommit = False
+        try:
+            with self._connection.cursor(name="execute_iter") as cursor:
+                cursor.itersize = chunk_size
+                cursor.execute(query, vals)
+                while True:
+                    entries = cursor.fetchmany(chunk_size)
+                    if not entries:
+                        break
+                    yield entries
+        finally:
+            self._connection.rollback()
+            if autocommit:
+                self._connection.autocommit = True
+
     def reset(self):
         log.debug("connection reset")
         self.close()
@@ -8,6 +8,7 @@ from artemis_utils.constants import DEFAULT_MON_TIMEOUT_LAST_BGP_UPDATE
 
 ARTEMIS_WEB_HOST = os.getenv("ARTEMIS_WEB_HOST", "artemis.com")
 AUTO_RECOVER_PROCESS_STATE = os.getenv("AUTO_RECOVER_PROCESS_STATE", "true")
+BGP_UPDATES_INSERT_METHOD = os.getenv("BGP_UPDATES_INSERT_METHOD", "copy")
 BULK_TIMER = float(os.getenv("BULK_TIMER", 1))
 COMPOSE_PROJECT_NAME = os.getenv("COMPOSE_PROJECT_NAME", "artemis")
 DB_NAME = os.getenv("DB_NAME", "artemis_db")
@@ -15,6 +16,8 @@ DB_USER = os.getenv("DB_USER", "artemis_user")
 DB_HOST = os.getenv("DB_HOST", "postgres")
 DB_PORT = os.getenv("DB_PORT", 5432)
 DB_PASS = os.getenv("DB_PASS", "Art3m1s")
+DETECTION_BATCH_SIZE = int(os.getenv("DETECTION_BATCH_SIZE", 100))
+DETECTION_PARTITIONED = os.getenv("DETECTION_PARTITIONED", "false")
 HASURA_GRAPHQL_ACCESS_KEY = os.getenv("HASURA_GRAPHQL_ACCESS_KEY", "@rt3m1s.")
 HASURA_HOST = os.getenv("HASURA_HOST", "graphql")
 HASURA_PORT = os.getenv("HASURA_PORT", 8080)
@@ -25,11 +28,15 @@ try:
 except Exception:
     HIJACK_LOG_FIELDS = set(DEFAULT_HIJACK_LOG_FIELDS)
 HISTORIC = os.getenv("HISTORIC", "false")
+HISTORICAL_REPLAY_MODE = os.getenv("HISTORICAL_REPLAY_MODE", "fast")
+HISTORICAL_REPLAY_RATE = float(os.getenv("HISTORICAL_REPLAY_RATE", 1000))
+HISTORICAL_REPLAY_SPEEDUP = float(os.getenv("HISTORICAL_REPLAY_SPEEDUP", 1))
 GRAPHQL_URI = "http://{HASURA_HOST}:{HASURA_PORT}/v1alpha1/graphql".format(
     HASURA_HOST=HASURA_HOST, HASURA_PORT=HASURA_PORT
 )
 GUI_ENABLED = os.getenv("GUI_ENABLED", "true")
 IS_KUBERNETES = os.getenv("KUBERNETES_SERVICE_HOST") is not None
+MON_HEARTBEAT_INTERVAL = float(os.getenv("MON_HEARTBEAT_INTERVAL", 10))
 MON_TIMEOUT_LAST_BGP_UPDATE = int(
     os.getenv("MON_TIMEOUT_LAST_BGP_UPDATE", DEFAULT_MON_TIMEOUT_LAST_BGP_UPDATE)
 )
@@ -48,4 +55,10 @@ RPKI_VALIDATOR_ENABLED = os.getenv("RPKI_VALIDATOR_ENABLED", "false")
 RPKI_VALIDATOR_HOST = os.getenv("RPKI_VALIDATOR_HOST", "routinator")
 RPKI_VALIDATOR_PORT = os.getenv("RPKI_VALIDATOR_PORT", 3323)
 TEST_ENV = os.getenv("TEST_ENV", "false")
+UPDATE_BATCH_LINGER = float(os.getenv("UPDATE_BATCH_LINGER", 0.5))
+UPDATE_BATCH_SIZE = int(os.getenv("UPDATE_BATCH_SIZE", 1))
 WITHDRAWN_HIJACK_THRESHOLD = int(os.getenv("WITHDRAWN_HIJACK_THRESHOLD", 80))
+try:
+    WIRE_FORMATS = json.loads(os.getenv("WIRE_FORMATS", "{}"))
+except Exception:
+    WIRE_FORMATS = {}
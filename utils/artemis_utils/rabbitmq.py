@@ -1,8 +1,16 @@
 # rabbitmq aux functions
+import time
+
+from artemis_utils.envvars import UPDATE_BATCH_LINGER
+from artemis_utils.envvars import UPDATE_BATCH_SIZE
+from artemis_utils.envvars import WIRE_FORMATS
 from kombu import Exchange
 from kombu import Queue
 from kombu import uuid
 
+DEFAULT_WIRE_FORMAT = "ujson"
+UPDATE_ENVELOPE_SCHEMA_VERSION = 1
+
 
 def create_exchange(name, channel=None, _type="direct", declare=False):
     exchange = Exchange(
@@ -27,3 +35,92 @@ def create_queue(module, exchange, routing_key, priority=1, random=False):
         consumer_arguments={"x-priority": priority},
     )
     return queue
+
+
+def wire_format(exchange):
+    """
+    Returns the serializer configured (WIRE_FORMATS) for messages published
+    on the given exchange.
+    """
+    return WIRE_FORMATS.get(exchange.name, DEFAULT_WIRE_FORMAT)
+
+
+def accepted_wire_formats(exchange, *extra_formats):
+    """
+    Returns the serializers accepted by consumers of the given exchange: its
+    configured wire format, plus the default one (e.g., during rolling upgrades).
+    """
+    return sorted({DEFAULT_WIRE_FORMAT, wire_format(exchange)} | set(extra_formats))
+
+
+def unpack_update_envelope(payload):
+    """
+    Returns the BGP updates carried by a bgp-update message payload, which is
+    either a single update or a batched envelope
+    {"schema_version": <int>, "updates": [<update>, ...]}.
+    """
+    if isinstance(payload, dict) and "schema_version" in payload:
+        if payload["schema_version"] != UPDATE_ENVELOPE_SCHEMA_VERSION:
+            raise ValueError(
+                "unsupported update envelope schema version {}".format(
+                    payload["schema_version"]
+                )
+            )
+        return payload["updates"]
+    return [payload]
+
+
+class UpdateBatchPublisher:
+    """
+    Publishes BGP updates in batched envelopes of up to max_batch_size updates
+    per (exchange, routing key), lingering at most linger seconds before a flush.
+    With a max_batch_size of 1 every update is published as a single message.
+    An update is accepted once publish returns; batches that fail to be published
+    are kept, to be published again on the next flush.
+    """
+
+    def __init__(self, max_batch_size=UPDATE_BATCH_SIZE, linger=UPDATE_BATCH_LINGER):
+        self.max_batch_size = max_batch_size
+        self.linger = linger
+        # (exchange name, routing key) -> [exchange, publish kwargs, updates, first time]
+        self.batches = {}
+
+    def publish(self, producer, update, exchange, routing_key, **kwargs):
+        if self.max_batch_size <= 1:
+            producer.publish(
+                update, exchange=exchange, routing_key=routing_key, **kwargs
+            )
+            return
+        batch_key = (exchange.name, routing_key)
+        batch = self.batches.get(batch_key)
+        if batch is None:
+            batch = [exchange, kwargs, [], time.time()]
+            self.batches[batch_key] = batch
+        batch[2].append(update)
+        if len(batch[2]) >= self.max_batch_size:
+            try:
+                self.publish_batch(producer, batch_key)
+            except Exception:
+                # not accepted; the rest of the batch is kept
+                batch[2].pop()
+                raise
+
+    def publish_batch(self, producer, batch_key):
+        exchange, kwargs, updates, _ = self.batches[batch_key]
+        producer.publish(
+            {"schema_version": UPDATE_ENVELOPE_SCHEMA_VERSION, "updates": updates},
+            exchange=exchange,
+            routing_key=batch_key[1],
+            **kwargs
+        )
+        del self.batches[batch_key]
+
+    def flush(self, producer, expired_only=False):
+        """
+        Publishes the pending batches (only the ones lingering for too long, if
+        expired_only is set).
+        """
+        now = time.time()
+        for batch_key, batch in list(self.batches.items()):
+            if not expired_only or now - batch[3] >= self.linger:
+                self.publish_batch(producer, batch_key)
@@ -1,6 +1,10 @@
 # redis aux functions
+import threading
 import time
 
+from artemis_utils.envvars import MON_HEARTBEAT_INTERVAL
+from artemis_utils.envvars import MON_TIMEOUT_LAST_BGP_UPDATE
+
 from . import get_hash
 from . import log
 
@@ -14,6 +18,121 @@ def redis_key(prefix, hijack_as, _type):
     return get_hash([prefix, hijack_as, _type])
 
 
+# atomic merge of a hijack into its (ephemeral) redis entry, executed server-side
+# KEYS[1]: ephemeral hijack key
+# KEYS[2]: (optional) set of persistent hijack keys, to register new hijacks
+# ARGV[1]: hijack (json) to be stored as-is if new, or merged into the stored one
+# ARGV[2]: community annotations (json list) in order of priority
+# ARGV[3]: "1" to only merge into an already stored hijack
+# returns: {1 if the hijack is new else 0, merged hijack (json)}, or nil if nothing stored
+MERGE_HIJACK_SCRIPT = """
+local stored = redis.call("GET", KEYS[1])
+if not stored then
+    if ARGV[3] == "1" then
+        return nil
+    end
+    redis.call("SET", KEYS[1], ARGV[1])
+    if KEYS[2] then
+        redis.call("SADD", KEYS[2], cjson.decode(ARGV[1])["key"])
+    end
+    return {1, ARGV[1]}
+end
+
+local empty_array = "__empty_array__"
+local hijack = cjson.decode(stored)
+local update = cjson.decode(ARGV[1])
+
+if update["time_started"] then
+    hijack["time_started"] = math.min(hijack["time_started"], update["time_started"])
+end
+if update["time_last"] then
+    hijack["time_last"] = math.max(hijack["time_last"], update["time_last"])
+end
+for _, field in ipairs({"peers_seen", "asns_inf", "bgpupdate_keys"}) do
+    local seen = {}
+    local merged = {}
+    for _, members in ipairs({hijack[field] or {}, update[field] or {}}) do
+        if type(members) == "table" then
+            for _, member in ipairs(members) do
+                if not seen[member] then
+                    seen[member] = true
+                    table.insert(merged, member)
+                end
+            end
+        end
+    end
+    if #merged == 0 then
+        merged = empty_array
+    end
+    hijack[field] = merged
+end
+-- no merging, the db already knows about previous values
+for _, field in ipairs({"monitor_keys", "outdated_parent", "rpki_status"}) do
+    if update[field] ~= nil then
+        hijack[field] = update[field]
+    end
+end
+
+local current = hijack["community_annotation"]
+if current == nil or current == cjson.null or current == "" then
+    current = "NA"
+end
+local annotation = update["community_annotation"]
+if annotation ~= nil and annotation ~= cjson.null and annotation ~= "NA" then
+    if current == "NA" then
+        current = annotation
+    else
+        local rank = {}
+        for i, priority_annotation in ipairs(cjson.decode(ARGV[2])) do
+            if rank[priority_annotation] == nil then
+                rank[priority_annotation] = i
+            end
+        end
+        if rank[annotation] and rank[current] and rank[annotation] < rank[current] then
+            current = annotation
+        end
+    end
+end
+hijack["community_annotation"] = current
+
+-- cjson keeps only 14 significant digits of numbers (e.g., of epoch timestamps);
+-- encode the top-level ones as placeholders and substitute them exactly
+local numbers = {}
+for field, value in pairs(hijack) do
+    if type(value) == "number" then
+        table.insert(numbers, string.format("%.17g", value))
+        hijack[field] = "__number_" .. #numbers .. "__"
+    end
+end
+stored = string.gsub(cjson.encode(hijack), '"' .. empty_array .. '"', "[]")
+for i, number in ipairs(numbers) do
+    stored = string.gsub(stored, '"__number_' .. i .. '__"', number)
+end
+redis.call("SET", KEYS[1], stored)
+return {0, stored}
+"""
+
+
+# purge of a hijack and its registrations, executed server-side
+# KEYS[1]: ephemeral hijack key
+# KEYS[2]: set of persistent hijack keys
+# KEYS[3]: set of original neighbors of the hijack
+# KEYS[4]: set of (prefix, peer) pairs the hijack is registered for
+# KEYS[5...]: "prefix_<prefix>_peer_<peer>_hijacks" sets the hijack is registered in
+# ARGV[1]: persistent hijack key
+PURGE_HIJACK_SCRIPT = """
+redis.call("DEL", KEYS[1], KEYS[3], KEYS[4])
+redis.call("SREM", KEYS[2], ARGV[1])
+-- emptied sets are removed by redis itself
+for i = 5, #KEYS do
+    redis.call("SREM", KEYS[i], KEYS[1])
+end
+"""
+
+# registered once per process (see purge_redis_eph_pers_keys)
+purge_hijack_script = None
+
+
 def ping_redis(redis_instance, timeout=5):
     while True:
         try:
@@ -25,37 +144,37 @@ def ping_redis(redis_instance, timeout=5):
             time.sleep(timeout)
 
 
-def purge_redis_eph_pers_keys(redis_instance, ephemeral_key, persistent_key):
-    # to prevent detectors from working in parallel with key deletion
-    redis_instance.set("{}token_active".format(ephemeral_key), "1")
-    if redis_instance.exists("{}token".format(ephemeral_key)):
-        token = redis_instance.blpop("{}token".format(ephemeral_key), timeout=60)
-        if not token:
-            log.info(
-                "Redis cleanup encountered redis token timeout for hijack {}".format(
-                    persistent_key
-                )
-            )
-    redis_pipeline = redis_instance.pipeline()
-    # purge also tokens since they are not relevant any more
-    redis_pipeline.delete("{}token_active".format(ephemeral_key))
-    redis_pipeline.delete("{}token".format(ephemeral_key))
-    redis_pipeline.delete(ephemeral_key)
-    redis_pipeline.srem("persistent-keys", persistent_key)
-    redis_pipeline.delete("hij_orig_neighb_{}".format(ephemeral_key))
-    if redis_instance.exists("hijack_{}_prefixes_peers".format(ephemeral_key)):
-        for element in redis_instance.sscan_iter(
-            "hijack_{}_prefixes_peers".format(ephemeral_key)
-        ):
-            subelems = element.decode("utf-8").split("_")
-            prefix_peer_hijack_set = "prefix_{}_peer_{}_hijacks".format(
-                subelems[0], subelems[1]
-            )
-            redis_pipeline.srem(prefix_peer_hijack_set, ephemeral_key)
-            if redis_instance.scard(prefix_peer_hijack_set) <= 1:
-                redis_pipeline.delete(prefix_peer_hijack_set)
-        redis_pipeline.delete("hijack_{}_prefixes_peers".format(ephemeral_key))
-    redis_pipeline.execute()
+def purge_redis_eph_pers_keys(
+    redis_instance,
+    ephemeral_key,
+    persistent_key,
+    redis_pipeline=None,
+    prefixes_peers=None,
+):
+    """
+    Purges a hijack and its registrations from redis in a single (server-side)
+    step; if a pipeline is given, the purge is only queued on it.
+    The (prefix, peer) pairs of the hijack are read first, unless given
+    (e.g., pre-fetched in bulk), since all the keys of the script are declared.
+    """
+    global purge_hijack_script
+    if purge_hijack_script is None:
+        purge_hijack_script = redis_instance.register_script(PURGE_HIJACK_SCRIPT)
+    prefixes_peers_key = "hijack_{}_prefixes_peers".format(ephemeral_key)
+    if prefixes_peers is None:
+        prefixes_peers = redis_instance.smembers(prefixes_peers_key)
+    keys = [
+        ephemeral_key,
+        "persistent-keys",
+        "hij_orig_neighb_{}".format(ephemeral_key),
+        prefixes_peers_key,
+    ]
+    for element in prefixes_peers:
+        subelems = element.decode("utf-8").split("_")
+        keys.append("prefix_{}_peer_{}_hijacks".format(subelems[0], subelems[1]))
+    purge_hijack_script(
+        keys=keys, args=[persistent_key], client=redis_pipeline or redis_instance,
+    )
 
 
 class RedisExpiryChecker:
@@ -100,3 +219,56 @@ class RedisExpiryChecker:
             self.redis_listener_thread = self.redis_pubsub.run_in_thread(sleep_time=1)
         except Exception:
             log.exception("Exception")
+
+
+class RedisHeartbeat:
+    """
+    Coalesced liveness heartbeat of a monitor tap: marking BGP updates as seen is
+    in-memory only, while the (expiring) "<monitor>_seen_bgp_update" key checked by
+    RedisExpiryChecker is refreshed at most once per interval from a background timer
+    """
+
+    def __init__(
+        self,
+        redis=None,
+        monitor=None,
+        interval=MON_HEARTBEAT_INTERVAL,
+        timeout=MON_TIMEOUT_LAST_BGP_UPDATE,
+    ):
+        self.redis = redis
+        self.redis_key = "{}_seen_bgp_update".format(monitor)
+        self.timeout = timeout
+        # refresh well before the key may expire
+        self.interval = min(interval, timeout / 2.0)
+        self.seen = False
+        self.stop_event = threading.Event()
+        self.timer_thread = None
+
+    def beat(self):
+        self.seen = True
+
+    def refresh(self):
+        self.seen = False
+        try:
+            self.redis.set(self.redis_key, "1", ex=self.timeout)
+        except Exception:
+            log.exception("Exception")
+
+    def timer(self):
+        while not self.stop_event.wait(self.interval):
+            if self.seen:
+                self.refresh()
+
+    def start(self):
+        self.refresh()
+        self.stop_event.clear()
+        self.timer_thread = threading.Thread(target=self.timer, daemon=True)
+        self.timer_thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        if self.timer_thread:
+            self.timer_thread.join()
+            self.timer_thread = None
+        if self.seen:
+            self.refresh()
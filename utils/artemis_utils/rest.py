@@ -0,0 +1,115 @@
+# REST handler utilities
+import asyncio
+import functools
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from artemis_utils.constants import REST_EXECUTOR_WORKERS
+from artemis_utils.constants import REST_SLOW_REQUEST_TIME
+from tornado.ioloop import IOLoop
+from tornado.locks import Semaphore
+from tornado.web import RequestHandler
+
+from . import log
+
+# bounded pool shared by the blocking handlers of a service
+rest_executor = ThreadPoolExecutor(
+    max_workers=REST_EXECUTOR_WORKERS, thread_name_prefix="rest"
+)
+
+# "<handler>.<method>" -> timing metrics
+rest_metrics = {}
+
+
+def _record_metrics(endpoint, wait_time, run_time, failed):
+    metrics = rest_metrics.setdefault(
+        endpoint,
+        {
+            "requests": 0,
+            "errors": 0,
+            "total_wait_time": 0.0,
+            "total_run_time": 0.0,
+            "max_run_time": 0.0,
+        },
+    )
+    metrics["requests"] += 1
+    metrics["errors"] += int(failed)
+    metrics["total_wait_time"] += wait_time
+    metrics["total_run_time"] += run_time
+    metrics["max_run_time"] = max(metrics["max_run_time"], run_time)
+    if run_time >= REST_SLOW_REQUEST_TIME:
+        log.warning("slow request {}: {:.2f} sec".format(endpoint, run_time))
+
+
+def _defer_initialize(initialize):
+    @functools.wraps(initialize)
+    def wrapper(self, *args, **kwargs):
+        self.deferred_initialize = functools.partial(initialize, self, *args, **kwargs)
+
+    return wrapper
+
+
+def _run_in_executor(method, semaphore):
+    def run(self, *args, **kwargs):
+        if self.deferred_initialize is not None:
+            self.deferred_initialize()
+            self.deferred_initialize = None
+        method(self, *args, **kwargs)
+
+    @functools.wraps(method)
+    async def wrapper(self, *args, **kwargs):
+        endpoint = "{}.{}".format(type(self).__name__, method.__name__)
+        queued = time.time()
+        async with semaphore:
+            started = time.time()
+            failed = True
+            try:
+                await IOLoop.current().run_in_executor(
+                    rest_executor, functools.partial(run, self, *args, **kwargs)
+                )
+                failed = False
+            finally:
+                _record_metrics(
+                    endpoint, started - queued, time.time() - started, failed
+                )
+
+    return wrapper
+
+
+class BlockingRequestHandler(RequestHandler):
+    """
+    Base handler for endpoints doing blocking (DB, redis, HTTP, etc.) work.
+    Their (synchronous) HTTP methods run in a bounded thread pool instead of
+    the IOLoop, at most max_concurrency at a time per endpoint method, so that
+    lightweight handlers (e.g., /health) stay responsive. Their initialize
+    (e.g., opening DB connections) is deferred to the same thread.
+    Handler methods must only write their response (not flush/finish it).
+    """
+
+    max_concurrency = 4
+    deferred_initialize = None
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        initialize = cls.__dict__.get("initialize")
+        if initialize is not None:
+            cls.initialize = _defer_initialize(initialize)
+        for name in ("get", "post", "put", "delete"):
+            method = cls.__dict__.get(name)
+            if method is not None and not asyncio.iscoroutinefunction(method):
+                semaphore = Semaphore(cls.max_concurrency)
+                setattr(cls, name, _run_in_executor(method, semaphore))
+
+
+class RestMetricsHandler(RequestHandler):
+    """
+    REST request handler for the timing metrics of blocking endpoints.
+    """
+
+    def get(self):
+        """
+        :return: {"<handler>.<method>": {"requests": <int>, "errors": <int>,
+                  "total_wait_time": <float>, "total_run_time": <float>,
+                  "max_run_time": <float>}, ...}
+        """
+        self.write(rest_metrics)
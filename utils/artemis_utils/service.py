@@ -1,6 +1,9 @@
 # service util functions
+import atexit
+import multiprocessing as mp
 import re
 import socket
+import threading
 import time
 
 import requests
@@ -91,3 +94,51 @@ def wait_data_worker_dependencies(data_worker_dependencies):
                 )
             )
         time.sleep(1)
+
+
+class ProcessLauncher:
+    """
+    Starts processes (running target(*args)) on behalf of a multithreaded process.
+    A process forked from a multithreaded one inherits the locks held by its other
+    threads (e.g., of logging handlers) in their locked state and may deadlock on
+    them; the processes are instead forked from a helper process, itself forked
+    while the caller was still single-threaded.
+    The started processes inherit the state of the caller at that point (e.g.,
+    module-level multiprocessing locks and shared memory objects).
+    """
+
+    def __init__(self, target, *args):
+        self.target = target
+        self.args = args
+        self.conn = None
+        self.lock = threading.Lock()
+
+    def start(self):
+        """
+        Starts the helper process; to be called before the caller starts any
+        (long-lived) thread, e.g., before starting its REST app.
+        """
+        self.conn, helper_conn = mp.Pipe()
+        mp.Process(target=self.run_helper, args=(helper_conn,)).start()
+        helper_conn.close()
+        # the helper exits once the caller closes its end
+        atexit.register(self.conn.close)
+
+    def run_helper(self, conn):
+        self.conn.close()
+        while True:
+            try:
+                conn.recv()
+            except EOFError:
+                break
+            try:
+                mp.Process(target=self.target, args=self.args).start()
+            except Exception:
+                log.exception("exception")
+
+    def launch(self):
+        """
+        Instructs the helper process to start a new process (thread-safe).
+        """
+        with self.lock:
+            self.conn.send(None)
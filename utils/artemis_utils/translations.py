@@ -114,6 +114,37 @@ def translate_rfc2622(input_prefix, just_match=False):
     return [input_prefix]
 
 
+def rfc2622_to_range(input_prefix):
+    """
+    :param input_prefix: (str) input IPv4/IPv6 prefix, optionally followed
+    by an RFC2622 range operator (^-, ^+, ^n, ^n-m)
+    :return: (base_prefix, min_length, max_length): the base prefix (str) and
+    the range of prefix lengths of its more specifics that the input stands for
+    """
+    reg_operator = re.match(r"^(\S*)\^(-|\+|\d+|\d+-\d+)$", input_prefix)
+    if not reg_operator or not valid_prefix(reg_operator.group(1)):
+        prefix_ip = str2ip(input_prefix)
+        return str(prefix_ip), prefix_ip.prefixlen, prefix_ip.prefixlen
+
+    matched_prefix_ip = str2ip(reg_operator.group(1))
+    operator = reg_operator.group(2)
+    if operator == "-":
+        min_length = matched_prefix_ip.prefixlen + 1
+        max_length = matched_prefix_ip.max_prefixlen
+    elif operator == "+":
+        min_length = matched_prefix_ip.prefixlen
+        max_length = matched_prefix_ip.max_prefixlen
+    else:
+        lengths = operator.split("-")
+        min_length = int(lengths[0])
+        max_length = int(lengths[-1])
+        if min_length < matched_prefix_ip.prefixlen:
+            raise ArtemisError("invalid-n-small", input_prefix)
+        if max_length > matched_prefix_ip.max_prefixlen:
+            raise ArtemisError("invalid-n-large", input_prefix)
+    return str(matched_prefix_ip), min_length, max_length
+
+
 def translate_asn_range(asn_range, just_match=False):
     """
     :param <str> asn_range: <start_asn>-<end_asn>
@@ -8,7 +8,7 @@ with open(path.join(this_directory, "README.md"), encoding="utf-8") as f:
 
 setuptools.setup(
     name="artemis_utils",
-    version="1.0.10",
+    version="1.0.29",
     author="Dimitrios Mavrommatis, Vassileios Kotronis",
     author_email="jim.mavrommatis@gmail.com, biece89@gmail.com",
     description="ARTEMIS utility modules",
@@ -33,4 +33,5 @@ setuptools.setup(
         "slacker-log-handler==1.7.1",
         "tornado==6.0.4",
     ],
+    extras_require={"msgpack": ["msgpack==1.0.2"]},
 )
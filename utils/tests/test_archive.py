@@ -0,0 +1,131 @@
+import os
+import tempfile
+import unittest
+
+from artemis_utils.archive import ArchiveReader
+from artemis_utils.archive import ArchiveWriter
+
+UPDATES = [
+    {
+        "prefix": "10.0.0.0/24",
+        "peer_asn": 1,
+        "path": "1 2 3",
+        "project": "ris",
+        "collector": "rrc00",
+        "type": "A",
+        "communities": [{"asn": 1, "value": 100}, {"asn": 2, "value": 200}],
+        "timestamp": 30.0,
+    },
+    {
+        "prefix": "2001:db8::/32",
+        "peer_asn": 4,
+        "path": "4 5",
+        "project": "routeviews",
+        "collector": "route-views2",
+        "type": "A",
+        "communities": [],
+        "timestamp": 15.5,
+    },
+    {
+        "prefix": "10.0.0.0/24",
+        "peer_asn": 1,
+        "path": "",
+        "project": "ris",
+        "collector": "rrc00",
+        "type": "W",
+        "communities": [],
+        "timestamp": 40.0,
+    },
+    {
+        "prefix": "10.0.0.0/24",
+        "peer_asn": 7,
+        "path": "7 3",
+        "project": "ris",
+        "collector": "rrc01",
+        "type": "A",
+        "communities": [{"asn": 1, "value": 100}, {"asn": 2, "value": 200}],
+        "timestamp": 10.25,
+    },
+]
+
+
+class ArchiveTester(unittest.TestCase):
+    def setUp(self) -> None:
+        fd, self.archive_file = tempfile.mkstemp(suffix=".bgpa")
+        os.close(fd)
+        writer = ArchiveWriter()
+        for update in UPDATES:
+            writer.add(
+                update["prefix"],
+                update["peer_asn"],
+                update["path"],
+                update["project"],
+                update["collector"],
+                update["type"],
+                update["communities"],
+                update["timestamp"],
+            )
+        writer.write(self.archive_file)
+
+    def tearDown(self) -> None:
+        os.remove(self.archive_file)
+
+    def test_round_trip(self):
+        with ArchiveReader(self.archive_file) as reader:
+            self.assertEqual(reader.num_records, len(UPDATES))
+            records = list(reader.records())
+        # (prefix, timestamp) order, in the order the prefixes were first seen
+        expected = sorted(
+            UPDATES,
+            key=lambda update: (update["prefix"] != "10.0.0.0/24", update["timestamp"]),
+        )
+        self.assertEqual(records, expected)
+
+    def test_prefix_index(self):
+        with ArchiveReader(self.archive_file) as reader:
+            self.assertEqual(
+                list(reader.prefixes()),
+                [
+                    ("10.0.0.0/24", 0, 3, 10.25, 40.0),
+                    ("2001:db8::/32", 3, 1, 15.5, 15.5),
+                ],
+            )
+
+    def test_time_window(self):
+        with ArchiveReader(self.archive_file) as reader:
+            records = list(reader.records(start=15.5, end=30.0))
+            self.assertEqual(
+                [(record["prefix"], record["timestamp"]) for record in records],
+                [("10.0.0.0/24", 30.0), ("2001:db8::/32", 15.5)],
+            )
+            self.assertEqual(list(reader.records(start=41.0)), [])
+            self.assertEqual(list(reader.records(end=10.0)), [])
+            records = list(
+                reader.records(prefix_filter=lambda prefix: ":" in prefix, end=20.0)
+            )
+            self.assertEqual([record["peer_asn"] for record in records], [4])
+
+    def test_withdrawal(self):
+        with ArchiveReader(self.archive_file) as reader:
+            records = list(reader.records(start=35.0))
+        self.assertEqual(len(records), 1)
+        self.assertEqual(records[0]["type"], "W")
+        self.assertEqual(records[0]["path"], "")
+        self.assertEqual(records[0]["communities"], [])
+
+    def test_close_with_pending_records(self):
+        with ArchiveReader(self.archive_file) as reader:
+            records = reader.records()
+            self.assertEqual(next(records)["timestamp"], 10.25)
+        with self.assertRaises(ValueError):
+            next(records)
+
+    def test_invalid_archive(self):
+        with open(self.archive_file, "wb") as f:
+            f.write(b"\x00" * 256)
+        with self.assertRaises(ValueError):
+            ArchiveReader(self.archive_file)
+
+
+if __name__ == "__main__":
+    unittest.main()
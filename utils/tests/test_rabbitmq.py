@@ -0,0 +1,41 @@
+import unittest
+from unittest.mock import MagicMock
+
+from artemis_utils.rabbitmq import UpdateBatchPublisher
+
+
+class UpdateBatchPublisherTester(unittest.TestCase):
+    def setUp(self) -> None:
+        self.exchange = MagicMock()
+        self.exchange.name = "bgp-update"
+        self.producer = MagicMock()
+        self.publisher = UpdateBatchPublisher(max_batch_size=2, linger=0)
+
+    def published_updates(self):
+        return [call[0][0]["updates"] for call in self.producer.publish.call_args_list]
+
+    def test_batches(self):
+        for update in range(3):
+            self.publisher.publish(self.producer, update, self.exchange, "update")
+        self.assertEqual(self.published_updates(), [[0, 1]])
+        self.publisher.flush(self.producer)
+        self.assertEqual(self.published_updates(), [[0, 1], [2]])
+
+    def test_failed_publish_is_kept(self):
+        self.publisher.publish(self.producer, 0, self.exchange, "update")
+        self.producer.publish.side_effect = ConnectionError()
+        with self.assertRaises(ConnectionError):
+            self.publisher.publish(self.producer, 1, self.exchange, "update")
+        with self.assertRaises(ConnectionError):
+            self.publisher.flush(self.producer)
+
+        self.producer.publish.side_effect = None
+        self.producer.publish.reset_mock()
+        self.publisher.flush(self.producer)
+        self.assertEqual(self.published_updates(), [[0]])
+        self.publisher.flush(self.producer)
+        self.assertEqual(self.published_updates(), [[0]])
+
+
+if __name__ == "__main__":
+    unittest.main()